@@ -6,7 +6,9 @@ import sys
 
 def main():
     """Run administrative tasks."""
-    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myproject.settings')
+    # The test runner gets the test settings unless DJANGO_SETTINGS_MODULE says otherwise
+    default_settings = 'myproject.test_settings' if sys.argv[1:2] == ['test'] else 'myproject.settings'
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', default_settings)
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc:
@@ -10,13 +10,22 @@ from django import forms
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
 from django.shortcuts import redirect, get_object_or_404
-from django.core.mail import send_mail
+from django.contrib import messages
+from django.core.exceptions import PermissionDenied
+from django.template.response import TemplateResponse
 from django.template.loader import render_to_string
-from django.conf import settings
+from django.utils import timezone
+from django.db import transaction
+import io
 import json
 import uuid
 import os
-from .models import Property, Booking, MarketplaceItem, MovingService, MoverQuote, Purchase, Profile, Review
+from .models import Property, Booking, MarketplaceItem, MovingService, MoverQuote, Purchase, Profile, Review, OutboxEmail, Job
+from .events import publish_status_change
+from .notifications import enqueue_booking_notifications
+from .property_detail import invalidate_property_detail
+from .importers import detect_format, import_properties
+from .exports import export_response
 
 # Custom form for Property admin
 class PropertyAdminForm(ModelForm):
@@ -65,11 +74,32 @@ class PropertyAdminForm(ModelForm):
                 raise forms.ValidationError("Invalid JSON format for amenities")
         return amenities
 
+class PropertyImportForm(forms.Form):
+    file = forms.FileField(help_text='CSV with a header row, or NDJSON (one JSON object per line)')
+    format = forms.ChoiceField(
+        choices=[('', 'Detect from file extension'), ('csv', 'CSV'), ('ndjson', 'NDJSON')],
+        required=False,
+    )
+
+class ExportActionsMixin:
+    """Admin actions streaming the selected rows as CSV/NDJSON (see myapp.exports)"""
+    export_dataset = None
+
+    def export_csv(self, request, queryset):
+        return export_response(self.export_dataset, 'csv', queryset)
+    export_csv.short_description = 'Export selected as CSV'
+
+    def export_ndjson(self, request, queryset):
+        return export_response(self.export_dataset, 'ndjson', queryset)
+    export_ndjson.short_description = 'Export selected as NDJSON'
+
 # Register your models here.
 
 @admin.register(Property)
-class PropertyAdmin(admin.ModelAdmin):
+class PropertyAdmin(ExportActionsMixin, admin.ModelAdmin):
     form = PropertyAdminForm
+    export_dataset = 'properties'
+    actions = ['export_csv', 'export_ndjson']
     list_display = ('title', 'location', 'county', 'town', 'price_display', 'type', 'rental_type', 'featured', 'created_at')
     list_filter = ('type', 'price_type', 'rental_type', 'managed_by', 'featured', 'county', 'town', 'created_at')
     search_fields = ('title', 'location', 'county', 'town', 'landlord_name', 'agency_name')
@@ -113,6 +143,39 @@ class PropertyAdmin(admin.ModelAdmin):
         }),
     )
 
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path('import/', self.admin_site.admin_view(self.import_properties_view), name='myapp_property_import'),
+        ]
+        return custom_urls + urls
+
+    def import_properties_view(self, request):
+        """Upload a CSV/NDJSON file of listings and upsert them by external_id"""
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+
+        form = PropertyImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            upload = form.cleaned_data['file']
+            fmt = form.cleaned_data['format'] or detect_format(upload.name)
+            stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+            report = import_properties(stream, fmt, created_by=request.user)
+
+            level = messages.WARNING if report.failed else messages.SUCCESS
+            self.message_user(request, f'Imported {report.upserted} of {report.rows} rows ({report.failed} rejected).', level)
+            for error in report.errors[:20]:
+                self.message_user(request, f"Line {error['line']} ({error['external_id'] or 'no external_id'}): {error['error']}", messages.ERROR)
+            return redirect('..')
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'form': form,
+            'title': 'Import properties',
+        }
+        return TemplateResponse(request, 'admin/myapp/property/import_properties.html', context)
+
     def price_display(self, obj):
         return f"KSh {obj.price:,.0f} {obj.get_price_type_display()}"
     price_display.short_description = 'Price'
@@ -124,13 +187,14 @@ class PropertyAdmin(admin.ModelAdmin):
     image_preview.short_description = 'Image Preview'
 
 @admin.register(Booking)
-class BookingAdmin(admin.ModelAdmin):
+class BookingAdmin(ExportActionsMixin, admin.ModelAdmin):
     list_display = ('guest_name', 'property', 'booking_date', 'status', 'created_at', 'approve_booking')
     list_filter = ('status', 'booking_date', 'created_at')
     search_fields = ('guest_name', 'guest_email', 'property__title')
     ordering = ('-created_at',)
     readonly_fields = ('created_at', 'updated_at')
-    actions = ['approve_bookings', 'reject_bookings']
+    actions = ['approve_bookings', 'reject_bookings', 'export_csv', 'export_ndjson']
+    export_dataset = 'bookings'
 
     def approve_booking(self, obj):
         if obj.status == 'pending':
@@ -148,15 +212,33 @@ class BookingAdmin(admin.ModelAdmin):
     approve_booking.allow_tags = True
 
     def approve_bookings(self, request, queryset):
-        updated = queryset.update(status='confirmed')
+        updated = self._set_status_and_notify(queryset, 'confirmed', 'approved')
         self.message_user(request, f'Successfully approved {updated} booking(s).')
     approve_bookings.short_description = 'Approve selected bookings'
 
     def reject_bookings(self, request, queryset):
-        updated = queryset.update(status='cancelled')
+        updated = self._set_status_and_notify(queryset, 'cancelled', 'rejected')
         self.message_user(request, f'Successfully rejected {updated} booking(s).')
     reject_bookings.short_description = 'Reject selected bookings'
 
+    def _set_status_and_notify(self, queryset, status, action):
+        """Update the status in one query and queue a notification per changed booking, all in one transaction"""
+        with transaction.atomic():
+            # Locked so a concurrent change can't slip between the read and the update
+            bookings = list(queryset.exclude(status=status).select_related('property').select_for_update(of=('self',)))
+            if not bookings:
+                return 0
+            now = timezone.now()
+            updated = Booking.objects.filter(pk__in=[booking.pk for booking in bookings]).update(status=status, updated_at=now)
+            enqueue_booking_notifications(bookings, action)
+            # .update() skips post_save, so stream the transitions here
+            for booking in bookings:
+                previous, booking.status, booking.updated_at = booking.status, status, now
+                publish_status_change(booking, previous)
+            for property_id in {booking.property_id for booking in bookings}:
+                invalidate_property_detail(property_id)
+        return updated
+
     def get_urls(self):
         urls = super().get_urls()
         custom_urls = [
@@ -175,86 +257,44 @@ class BookingAdmin(admin.ModelAdmin):
         return redirect('..')
 
     def send_booking_notification(self, booking, action):
-        """Send email notification to guest about booking status"""
-        try:
-            subject = f"Booking {action.title()}: {booking.property.title}"
-
-            # Create email content
-            context = {
-                'guest_name': booking.guest_name,
-                'property_title': booking.property.title,
-                'property_location': booking.property.location,
-                'booking_date': booking.booking_date,
-                'action': action.title(),
-                'status': action.title(),
-                'booking_id': booking.id,
-            }
-
-            # Plain text message
-            message = f"""
-Dear {booking.guest_name},
-
-Your booking for {booking.property.title} has been {action}.
-
-Booking Details:
-- Property: {booking.property.title}
-- Location: {booking.property.location}
-- Booking Date: {booking.booking_date}
-- Status: {action.title()}
-- Booking ID: {booking.id}
-
-Thank you for using Masskan!
-
-Best regards,
-Masskan Team
-"""
-
-            # Send email
-            send_mail(
-                subject=subject,
-                message=message,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[booking.guest_email],
-                fail_silently=False,
-            )
-
-            print(f"Email notification sent successfully to {booking.guest_email} for booking {booking.id}")
-
-        except Exception as e:
-            print(f"Failed to send email notification: {str(e)}")
-            # In production, you might want to log this error or send an admin notification
+        """Queue an email notification to the guest about the booking status"""
+        enqueue_booking_notifications([booking], action)
 
 @admin.register(MarketplaceItem)
 class MarketplaceItemAdmin(admin.ModelAdmin):
-    list_display = ('title', 'price', 'category', 'condition', 'location', 'created_by', 'created_at')
-    list_filter = ('category', 'condition', 'created_at')
+    list_display = ('title', 'price', 'category', 'condition', 'location', 'status', 'created_by', 'created_at')
+    list_filter = ('status', 'category', 'condition', 'created_at')
     search_fields = ('title', 'description', 'location')
     ordering = ('-created_at',)
     readonly_fields = ('created_at', 'updated_at')
 
 @admin.register(MovingService)
 class MovingServiceAdmin(admin.ModelAdmin):
-    list_display = ('name', 'location', 'price_range', 'rating', 'reviews', 'verified', 'created_at')
+    list_display = ('name', 'location', 'price_range', 'min_price', 'max_price', 'rating', 'reviews', 'verified', 'created_at')
     list_filter = ('verified', 'created_at')
     search_fields = ('name', 'location')
     ordering = ('-created_at',)
     readonly_fields = ('created_at', 'updated_at')
 
 @admin.register(MoverQuote)
-class MoverQuoteAdmin(admin.ModelAdmin):
+class MoverQuoteAdmin(ExportActionsMixin, admin.ModelAdmin):
     list_display = ('client_name', 'service', 'pickup_location', 'delivery_location', 'moving_date', 'status', 'quote_amount', 'created_at')
     list_filter = ('status', 'moving_date', 'created_at')
     search_fields = ('client_name', 'client_email', 'pickup_location', 'delivery_location')
     ordering = ('-created_at',)
     readonly_fields = ('created_at', 'updated_at')
+    actions = ['export_csv', 'export_ndjson']
+    export_dataset = 'quotes'
 
 @admin.register(Purchase)
-class PurchaseAdmin(admin.ModelAdmin):
+class PurchaseAdmin(ExportActionsMixin, admin.ModelAdmin):
     list_display = ('buyer_name', 'item', 'purchase_price', 'status', 'created_at')
     list_filter = ('status', 'created_at')
     search_fields = ('buyer_name', 'buyer_email', 'item__title')
     ordering = ('-created_at',)
     readonly_fields = ('created_at', 'updated_at')
+    actions = ['export_csv', 'export_ndjson']
+    export_dataset = 'purchases'
 
 @admin.register(Profile)
 class ProfileAdmin(admin.ModelAdmin):
@@ -271,3 +311,33 @@ class ReviewAdmin(admin.ModelAdmin):
     search_fields = ('user__username', 'property__title', 'comment')
     ordering = ('-created_at',)
     readonly_fields = ('created_at', 'updated_at')
+
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ('to_email', 'subject', 'status', 'attempts', 'next_attempt_at', 'sent_at', 'created_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('to_email', 'subject')
+    ordering = ('-created_at',)
+    readonly_fields = ('created_at', 'updated_at', 'sent_at', 'last_error')
+    actions = ['retry_now']
+
+    def retry_now(self, request, queryset):
+        updated = queryset.exclude(status='sent').update(status='pending', next_attempt_at=timezone.now())
+        self.message_user(request, f'Queued {updated} email(s) for immediate delivery.')
+    retry_now.short_description = 'Retry selected emails now'
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'attempts', 'max_attempts', 'run_at', 'locked_by', 'created_at')
+    list_filter = ('status', 'name', 'created_at')
+    search_fields = ('name', 'locked_by')
+    ordering = ('-created_at',)
+    readonly_fields = ('created_at', 'updated_at', 'locked_by', 'locked_at', 'last_error')
+    actions = ['retry_jobs']
+
+    def retry_jobs(self, request, queryset):
+        updated = queryset.exclude(status__in=['queued', 'running']).update(
+            status='queued', attempts=0, run_at=timezone.now(), last_error=None,
+        )
+        self.message_user(request, f'Requeued {updated} job(s).')
+    retry_jobs.short_description = 'Requeue selected jobs'
@@ -0,0 +1,79 @@
+"""
+``Property.amenities`` flattened into indexed ``PropertyAmenity`` rows.
+
+The JSON column comes in two shapes: a mapping of category to nearby places
+(``{"schools": ["Nairobi Academy"], "hospitals": [...]}``, as in the admin
+placeholder) or a plain list of features (``["wifi", "parking"]``). Both
+become ``(key, name)`` rows: a category with at least one place gives one row
+per place, a list entry (or a category mapped to ``true``) gives one row with
+an empty name. Keys and names are lower-cased with whitespace collapsed.
+
+``?amenity=schools,parking`` on the listings then turns into one
+``id IN (SELECT property_id ... WHERE key = %s)`` per key, answered from the
+``(key, property)`` index instead of decoding JSON for every listing. Rows are
+replaced on ``post_save`` when the amenities change and by the importer after
+each batch; ``manage.py rebuild_property_amenities`` recomputes all of them.
+"""
+from django.db import transaction
+
+from .models import Property, PropertyAmenity
+
+REBUILD_CHUNK_SIZE = 2000
+
+
+def normalize(value):
+    return ' '.join(str(value).lower().split())
+
+
+def amenity_rows(value):
+    """``{(key, name)}`` for an ``amenities`` value; anything unrecognised gives no rows"""
+    rows = set()
+    if isinstance(value, dict):
+        for key, places in value.items():
+            key = normalize(key)
+            if not key:
+                continue
+            if isinstance(places, (list, tuple)):
+                rows.update((key, name) for name in map(normalize, places) if name)
+            elif isinstance(places, str):
+                if normalize(places):
+                    rows.add((key, normalize(places)))
+            elif places:
+                rows.add((key, ''))
+    elif isinstance(value, (list, tuple)):
+        rows.update((key, '') for key in map(normalize, value) if key)
+    return rows
+
+
+def amenity_keys(value):
+    return {key for key, _ in amenity_rows(value)}
+
+
+def sync(amenities_by_property):
+    """Replace the rows of each ``{property id: amenities}`` entry"""
+    rows = [
+        PropertyAmenity(property_id=property_id, key=key[:50], name=name[:255])
+        for property_id, amenities in amenities_by_property.items()
+        for key, name in sorted(amenity_rows(amenities))
+    ]
+    property_ids = list(amenities_by_property)
+    with transaction.atomic():
+        for start in range(0, len(property_ids), 500):
+            PropertyAmenity.objects.filter(property_id__in=property_ids[start:start + 500]).delete()
+        PropertyAmenity.objects.bulk_create(rows, batch_size=1000, ignore_conflicts=True)
+
+
+def rebuild():
+    """Recompute every listing's rows; returns the number of listings"""
+    total = 0
+    with transaction.atomic():
+        PropertyAmenity.objects.all().delete()
+        chunk = {}
+        for property_id, amenities in Property.objects.order_by().values_list('pk', 'amenities').iterator(
+                chunk_size=REBUILD_CHUNK_SIZE):
+            chunk[property_id] = amenities
+            if len(chunk) == REBUILD_CHUNK_SIZE:
+                sync(chunk)
+                total, chunk = total + len(chunk), {}
+        sync(chunk)
+    return total + len(chunk)
@@ -0,0 +1,146 @@
+"""
+JWT authentication that doesn't load the user row on every request.
+
+Tokens issued by this app carry ``username`` and ``is_staff`` claims next to
+``user_id`` (and the password fingerprint when CHECK_REVOKE_TOKEN is on).
+``ClaimsJWTAuthentication`` verifies the token and builds a ``User`` instance
+with only id/username/flags loaded and every other column deferred, so views
+that only need the id (filters, ownership checks, FK assignment) never touch
+the users table. Revocation and permission changes are checked against a small
+per-user auth state (active flag, staff flags, password fingerprint) that is
+cached for ``AUTH_STATE_CACHE_SECONDS`` and dropped whenever the user is saved
+or deleted (see ``signals.py``); the flags and username come from that state
+rather than the claims, so a demotion or rename applies before the token
+expires. Views that render the profile call ``get_full_user()``, which reads
+the remaining columns through the same cache.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import update_last_login
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .login import guarded_authenticate
+
+User = get_user_model()
+
+STATE_FIELDS = ['username', 'is_active', 'is_staff', 'is_superuser', 'password']
+
+# Never cached or loaded with the profile: only the auth state keeps a fingerprint of it
+FULL_USER_EXCLUDE = {'password'}
+
+
+def state_cache_key(user_id):
+    return f'auth:state:{user_id}'
+
+
+def full_user_cache_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def invalidate_user(user_id):
+    cache.delete_many([state_cache_key(user_id), full_user_cache_key(user_id)])
+
+
+def get_auth_state(user_id):
+    """``{'username', 'is_active', 'is_staff', 'is_superuser', 'password_hash'}`` or None if the user is gone"""
+    key = state_cache_key(user_id)
+    state = cache.get(key)
+    if state is None:
+        row = User.objects.filter(pk=user_id).values(*STATE_FIELDS).first()
+        if row is None:
+            return None
+        state = {
+            'username': row['username'],
+            'is_active': row['is_active'],
+            'is_staff': row['is_staff'],
+            'is_superuser': row['is_superuser'],
+            'password_hash': get_md5_hash_password(row['password']),
+        }
+        cache.set(key, state, settings.AUTH_STATE_CACHE_SECONDS)
+    return state
+
+
+def _user_from_values(values):
+    """A saved-looking User with only ``values`` loaded; other columns load lazily on access"""
+    # from_db() expects the values in model field order
+    field_names = [f.attname for f in User._meta.concrete_fields if f.attname in values]
+    return User.from_db(DEFAULT_DB_ALIAS, field_names, [values[name] for name in field_names])
+
+
+def get_full_user(user):
+    """Return ``user`` with all profile columns loaded (through the cache when it came from a token)"""
+    if not isinstance(user, User) or not user.get_deferred_fields() - FULL_USER_EXCLUDE:
+        return user
+    key = full_user_cache_key(user.pk)
+    values = cache.get(key)
+    if values is None:
+        fields = [f.attname for f in User._meta.concrete_fields if f.attname not in FULL_USER_EXCLUDE]
+        values = User.objects.filter(pk=user.pk).values(*fields).first()
+        if values is None:
+            return user
+        cache.set(key, values, settings.AUTH_STATE_CACHE_SECONDS)
+    return _user_from_values(values)
+
+
+class ClaimsRefreshToken(RefreshToken):
+    """Refresh token whose access tokens carry the claims ClaimsJWTAuthentication reads"""
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token['username'] = user.get_username()
+        token['is_staff'] = user.is_staff
+        return token
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = ClaimsRefreshToken
+
+    def validate(self, attrs):
+        # Same checks as login_view: rate limits and the bounded hashing pool
+        self.user = guarded_authenticate(self.context.get('request'), attrs[self.username_field], attrs['password'])
+        if not api_settings.USER_AUTHENTICATION_RULE(self.user):
+            raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+
+        refresh = self.get_token(self.user)
+        if api_settings.UPDATE_LAST_LOGIN:
+            update_last_login(None, self.user)
+        return {'refresh': str(refresh), 'access': str(refresh.access_token)}
+
+
+def issue_tokens(user):
+    """``{'access': ..., 'refresh': ...}`` for a freshly authenticated user"""
+    refresh = ClaimsRefreshToken.for_user(user)
+    return {'access': str(refresh.access_token), 'refresh': str(refresh)}
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        try:
+            user_id = int(validated_token[api_settings.USER_ID_CLAIM])
+        except (KeyError, TypeError, ValueError):
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        state = get_auth_state(user_id)
+        if state is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if not state['is_active']:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN and validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != state['password_hash']:
+            raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return _user_from_values({
+            'id': user_id,
+            'username': state['username'],
+            'is_active': True,
+            'is_staff': state['is_staff'],
+            'is_superuser': state['is_superuser'],
+        })
@@ -0,0 +1,49 @@
+"""
+Marketplace checkout: an item is sold at most once.
+
+``checkout()`` marks the item sold with a single conditional
+``UPDATE ... SET status = 'sold' WHERE id = %s AND status = 'available'`` and
+creates the purchase in the same transaction. However many buyers race for an
+item, the database lets exactly one of those UPDATEs match the row; every
+other buyer sees zero rows changed and gets ``ItemUnavailable`` (409). No
+lock is taken before the UPDATE, so losers never wait on a ``SELECT ... FOR
+UPDATE`` queue and the same code is correct on SQLite and Postgres.
+
+Cancelling (or deleting) the purchase puts the item back on sale through
+``release_item()``, called from ``signals.py``.
+"""
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from .models import MarketplaceItem, Purchase
+
+
+class ItemUnavailable(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'This item has already been sold.'
+    default_code = 'item_unavailable'
+
+
+def checkout(serializer, buyer):
+    """Save a validated ``PurchaseSerializer`` for ``buyer`` if its item is still available"""
+    item = serializer.validated_data['item']
+    if item.created_by_id == buyer.pk:
+        raise ValidationError({'item_id': 'You cannot buy your own item.'})
+    with transaction.atomic():
+        reserved = MarketplaceItem.objects.filter(pk=item.pk, status='available').update(
+            status='sold', updated_at=timezone.now())
+        if not reserved:
+            raise ItemUnavailable()
+        # Re-read under the row lock the UPDATE holds: price and seller as of the sale
+        item = MarketplaceItem.objects.get(pk=item.pk)
+        return serializer.save(buyer=buyer, item=item, seller_id=item.created_by_id, purchase_price=item.price)
+
+
+def release_item(item_id):
+    """Put an item back on sale unless a purchase of it is still live; safe to call repeatedly"""
+    live = Purchase.objects.filter(item=OuterRef('pk')).exclude(status='cancelled')
+    MarketplaceItem.objects.filter(pk=item_id, status='sold').exclude(Exists(live)).update(
+        status='available', updated_at=timezone.now())
@@ -0,0 +1,307 @@
+"""
+Server-sent events: booking, quote and purchase status changes pushed to the
+users they concern, so clients stop polling ``/api/bookings/`` and the
+dashboard.
+
+``events_app`` is a plain ASGI app served at ``EVENTS_PATH`` by its own
+service, ``myproject/events_asgi.py`` (it never enters Django's
+request/response cycle, and Django stays on WSGI). A
+connection is one coroutine waiting on an ``asyncio.Event``: it costs no
+thread, no database connection and no work until an event for its user
+arrives or the heartbeat is due.
+
+Status changes are detected with ``post_init``/``post_save`` (see
+``signals.py``) and published once the transaction commits. Publishing goes
+through ``EVENTS_BACKEND``: ``LocalBackend`` hands events straight to this
+process's ``broker``; ``RedisBackend`` sends them over Redis pub/sub and a
+listener thread in every process feeds its own broker. Events are not
+replayed: clients should refetch on the ``ready`` event sent at (re)connect.
+
+``EventSource`` can't send an Authorization header, so browsers connect with
+``?stream_token=`` from ``POST /api/auth/stream-token/``: a signed user id
+that only opens streams and expires after ``EVENTS_STREAM_TOKEN_SECONDS``, so
+the URL that lands in access logs never carries the API access token. The
+token is checked when the stream opens; fetch a new one before reconnecting.
+The app sits outside Django's middleware, so it answers CORS itself from
+``CORS_ALLOWED_ORIGINS``.
+"""
+import asyncio
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.module_loading import import_string
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken, TokenError
+
+from .authentication import ClaimsJWTAuthentication, get_auth_state
+
+STREAM_TOKEN_SALT = 'myapp.events.stream'
+
+
+class Subscription:
+    """One open stream. ``push`` runs on the stream's event loop."""
+
+    def __init__(self, loop, maxlen):
+        self.loop = loop
+        # Slow readers lose the oldest events rather than growing without bound
+        self.pending = deque(maxlen=maxlen)
+        self.ready = asyncio.Event()
+
+    def push(self, event):
+        self.pending.append(event)
+        self.ready.set()
+
+    def drain(self):
+        self.ready.clear()
+        events = list(self.pending)
+        self.pending.clear()
+        return events
+
+
+class Broker:
+    """Fans events out to the streams open in this process"""
+
+    def __init__(self):
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        subscription = Subscription(asyncio.get_running_loop(), settings.EVENTS_BUFFER_SIZE)
+        with self._lock:
+            self._subscriptions[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, user_id, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[user_id]
+
+    def dispatch(self, message):
+        """Deliver ``{'users': [...], 'event': ..., 'data': {...}}``; safe to call from any thread"""
+        event = {'event': message['event'], 'data': message['data']}
+        for user_id in message['users']:
+            with self._lock:
+                subscriptions = list(self._subscriptions.get(user_id, ()))
+            for subscription in subscriptions:
+                try:
+                    subscription.loop.call_soon_threadsafe(subscription.push, event)
+                except RuntimeError:
+                    # The stream's loop has shut down
+                    self.unsubscribe(user_id, subscription)
+
+
+broker = Broker()
+
+
+class LocalBackend:
+    """Single process: publishing is dispatching"""
+
+    def __init__(self, broker):
+        self.broker = broker
+
+    def publish(self, message):
+        self.broker.dispatch(message)
+
+    def start(self):
+        pass
+
+
+class RedisBackend:
+    """Redis pub/sub so events reach streams held by other processes"""
+    channel = 'myapp:events'
+
+    def __init__(self, broker):
+        import redis
+
+        self.broker = broker
+        self.client = redis.Redis.from_url(settings.REDIS_URL)
+        self._listener = None
+        self._lock = threading.Lock()
+
+    def publish(self, message):
+        self.client.publish(self.channel, json.dumps(message, cls=DjangoJSONEncoder))
+
+    def start(self):
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name='events-listener', daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    self.broker.dispatch(json.loads(message['data']))
+            except Exception:
+                # Connection lost: resubscribe after a pause
+                time.sleep(1)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = import_string(settings.EVENTS_BACKEND)(broker)
+        return _backend
+
+
+# model label -> user id attributes that receive its status events
+STATUS_EVENT_RECIPIENTS = {
+    'myapp.booking': ('user_id',),
+    'myapp.moverquote': ('user_id',),
+    'myapp.purchase': ('buyer_id', 'seller_id'),
+}
+
+
+def publish_status_change(instance, previous_status):
+    """Queue a ``<model>.status`` event for the users ``instance`` belongs to, sent on commit"""
+    recipients = sorted({
+        getattr(instance, field) for field in STATUS_EVENT_RECIPIENTS[type(instance)._meta.label_lower]
+    } - {None})
+    message = {
+        'users': recipients,
+        'event': f'{type(instance)._meta.model_name}.status',
+        'data': {
+            'id': instance.pk,
+            'status': instance.status,
+            'previous_status': previous_status,
+            'updated_at': instance.updated_at,
+        },
+    }
+    # Round-trip through JSON now so every backend sends the same payload
+    message = json.loads(json.dumps(message, cls=DjangoJSONEncoder))
+    transaction.on_commit(lambda: get_backend().publish(message))
+
+
+def _format(event, data):
+    return f'event: {event}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'.encode()
+
+
+def issue_stream_token(user_id):
+    return signing.TimestampSigner(salt=STREAM_TOKEN_SALT).sign(str(user_id))
+
+
+def _stream_token_user(raw_token):
+    try:
+        user_id = int(signing.TimestampSigner(salt=STREAM_TOKEN_SALT).unsign(
+            raw_token, max_age=settings.EVENTS_STREAM_TOKEN_SECONDS))
+    except (signing.BadSignature, ValueError):
+        return None
+    # Deactivated or deleted since the token was issued
+    state = get_auth_state(user_id)
+    return user_id if state is not None and state['is_active'] else None
+
+
+def _authenticate(headers, query_string):
+    """User id for the access token in the Authorization header or for ``?stream_token=``, else None"""
+    authorization = headers.get(b'authorization', b'').split()
+    if len(authorization) != 2 or authorization[0] != b'Bearer':
+        # EventSource can't set headers
+        raw_token = parse_qs(query_string.decode('latin-1')).get('stream_token', [None])[0]
+        return _stream_token_user(raw_token) if raw_token else None
+    authentication = ClaimsJWTAuthentication()
+    try:
+        return authentication.get_user(authentication.get_validated_token(authorization[1].decode('latin-1'))).pk
+    except (AuthenticationFailed, InvalidToken, TokenError):
+        return None
+
+
+def _cors_headers(headers):
+    """CORS response headers for the request's Origin, mirroring django-cors-headers' settings"""
+    origin = headers.get(b'origin')
+    if origin is None:
+        return []
+    if not settings.CORS_ALLOW_ALL_ORIGINS and origin.decode('latin-1') not in settings.CORS_ALLOWED_ORIGINS:
+        return [(b'vary', b'origin')]
+    cors = [(b'access-control-allow-origin', origin), (b'vary', b'origin')]
+    if settings.CORS_ALLOW_CREDENTIALS:
+        cors.append((b'access-control-allow-credentials', b'true'))
+    return cors
+
+
+async def _send_json(send, status, body, headers=()):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), *headers],
+    })
+    await send({'type': 'http.response.body', 'body': json.dumps(body).encode()})
+
+
+async def events_app(scope, receive, send):
+    headers = dict(scope['headers'])
+    cors = _cors_headers(headers)
+    if scope['method'] == 'OPTIONS':
+        if any(name == b'access-control-allow-origin' for name, _ in cors):
+            cors += [
+                (b'access-control-allow-methods', b'GET, OPTIONS'),
+                (b'access-control-allow-headers', b'authorization, cache-control, last-event-id'),
+                (b'access-control-max-age', b'86400'),
+            ]
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [(b'content-length', b'0'), *cors]})
+        return await send({'type': 'http.response.body', 'body': b''})
+    if scope['method'] != 'GET':
+        return await _send_json(send, 405, {'detail': f'Method "{scope["method"]}" not allowed.'}, cors)
+    user_id = await sync_to_async(_authenticate)(headers, scope.get('query_string', b''))
+    if user_id is None:
+        return await _send_json(
+            send, 401, {'detail': 'Authentication credentials were not provided or are invalid.'}, cors)
+
+    async def wait_for_disconnect():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    subscription = broker.subscribe(user_id)
+    get_backend().start()
+    disconnected = asyncio.ensure_future(wait_for_disconnect())
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                # Don't let nginx buffer the stream
+                (b'x-accel-buffering', b'no'),
+                *cors,
+            ],
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': f'retry: {settings.EVENTS_RETRY_MS}\n\n'.encode() + _format('ready', {}),
+            'more_body': True,
+        })
+        while True:
+            ready = asyncio.ensure_future(subscription.ready.wait())
+            done, _ = await asyncio.wait(
+                {ready, disconnected}, timeout=settings.EVENTS_HEARTBEAT_SECONDS,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if disconnected in done:
+                ready.cancel()
+                break
+            if ready in done:
+                body = b''.join(_format(event['event'], event['data']) for event in subscription.drain())
+            else:
+                ready.cancel()
+                body = b': ping\n\n'
+            await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+    finally:
+        disconnected.cancel()
+        broker.unsubscribe(user_id, subscription)
@@ -0,0 +1,246 @@
+"""
+Streaming bulk import of agency property listings from CSV or NDJSON.
+
+Rows are read lazily and processed in fixed-size batches, so memory use does
+not depend on the file size. Each batch is validated with the same model
+rules as the admin (``Property.full_clean``) and upserted by ``external_id``
+with ``bulk_create(update_conflicts=True)``. Re-importing a listing only
+overwrites the columns its row carries; missing or blank columns keep their
+stored values.
+
+Image columns (``image1`` .. ``image6``, or an ``images`` list) may hold URLs,
+which are stored as-is, or paths that are either already in media storage or
+relative to ``image_root`` (those are copied into storage).
+"""
+import csv
+import json
+import os
+from collections import defaultdict
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from .amenities import sync as sync_amenities
+from .models import Property
+from .property_detail import invalidate_property_detail
+from .rollups import SEGMENT_FIELDS, apply_changes, segment_of
+from .similarity import enqueue_refresh as enqueue_similar_refresh
+
+IMAGE_FIELDS = ['image1', 'image2', 'image3', 'image4', 'image5', 'image6']
+
+IMPORT_FIELDS = [
+    'title', 'location', 'county', 'town', 'price', 'price_type', 'type',
+    'bedrooms', 'bathrooms', 'area', 'rental_type',
+    'managed_by', 'landlord_name', 'landlord_verified', 'agency_name', 'agency_verified',
+    'featured', 'ready_date', 'amenities',
+] + IMAGE_FIELDS
+
+BOOLEAN_FIELDS = {'landlord_verified', 'agency_verified', 'featured'}
+
+# Only the first errors are kept in the report; all of them go to ``error_writer``
+MAX_REPORTED_ERRORS = 1000
+
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.upserted = 0
+        self.failed = 0
+        self.errors = []
+
+    def add_error(self, line, external_id, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'external_id': external_id, 'error': message})
+
+    def as_dict(self):
+        return {'rows': self.rows, 'upserted': self.upserted, 'failed': self.failed, 'errors': self.errors}
+
+
+def detect_format(filename):
+    return 'ndjson' if os.path.splitext(filename)[1].lower() in ('.ndjson', '.jsonl', '.json') else 'csv'
+
+
+def iter_rows(stream, fmt):
+    """Yield (line number, row dict or error) without reading the whole stream"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'ndjson':
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_number, ValueError(f'Invalid JSON: {e.msg}')
+                continue
+            yield line_number, row if isinstance(row, dict) else ValueError('Expected a JSON object')
+    else:
+        raise ValueError(f'Unsupported format: {fmt}')
+
+
+class PropertyImporter:
+    def __init__(self, batch_size=500, image_root=None, created_by=None, error_writer=None, on_batch=None):
+        self.batch_size = batch_size
+        self.image_root = image_root
+        self.created_by = created_by
+        self.error_writer = error_writer
+        self.on_batch = on_batch
+        self.report = ImportReport()
+        self._stored_images = {}
+
+    def run(self, stream, fmt='csv'):
+        rows = iter_rows(stream, fmt)
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                break
+            self._import_batch(batch)
+            if self.on_batch:
+                self.on_batch(self.report)
+        return self.report
+
+    def _error(self, line, external_id, message):
+        self.report.add_error(line, external_id, message)
+        if self.error_writer:
+            self.error_writer.writerow([line, external_id or '', message])
+
+    def _import_batch(self, batch):
+        parsed = []
+        for line, row in batch:
+            self.report.rows += 1
+            if isinstance(row, Exception):
+                self._error(line, None, str(row))
+                continue
+            external_id = (str(row.get('external_id') or '')).strip()
+            if not external_id:
+                self._error(line, None, 'external_id is required')
+                continue
+            try:
+                parsed.append((line, external_id, self._values(row)))
+            except (ValueError, TypeError) as e:
+                self._error(line, external_id, str(e))
+
+        if not parsed:
+            return
+        rollup_fields = ['pk', 'external_id', 'created_at', 'price', *SEGMENT_FIELDS]
+        batch_rows = Property.objects.filter(external_id__in={external_id for _, external_id, _ in parsed})
+        with transaction.atomic():
+            # Locked until the upsert commits, so neither the stored values used
+            # for validation nor the rollup snapshot can change underneath it
+            stored = {
+                row['external_id']: row
+                for row in batch_rows.select_for_update().values(*dict.fromkeys(rollup_fields + IMPORT_FIELDS))
+            }
+            properties, present = {}, {}
+            for line, external_id, values in parsed:
+                # Columns the row doesn't carry keep their stored value; they are
+                # filled in here only so the listing validates as a whole
+                merged = {field: value for field, value in stored.get(external_id, {}).items() if field in IMPORT_FIELDS}
+                prop = Property(created_by=self.created_by, **{**merged, **values})
+                try:
+                    prop.full_clean(exclude=['external_id'], validate_unique=False)
+                except ValidationError as e:
+                    self._error(line, external_id, '; '.join(e.messages))
+                    continue
+                except (ValueError, TypeError) as e:
+                    self._error(line, external_id, str(e))
+                    continue
+                prop.external_id = external_id
+                # A key repeated within the batch: the last row wins
+                properties[external_id] = prop
+                present[external_id] = frozenset(values)
+            if not properties:
+                return
+
+            previous = [(segment_of(row), row['price']) for external_id, row in stored.items() if external_id in properties]
+            # Only the columns present in a row are overwritten: rows sharing the
+            # same set of columns are upserted together
+            groups = defaultdict(list)
+            for external_id, prop in properties.items():
+                groups[present[external_id]].append(prop)
+            for fields, props in groups.items():
+                Property.objects.bulk_create(
+                    props,
+                    update_conflicts=True,
+                    unique_fields=['external_id'],
+                    update_fields=[field for field in IMPORT_FIELDS if field in fields] + ['updated_at'],
+                )
+            # bulk_create skips post_save: update the price rollups and amenity
+            # rows, drop the cached detail pages and queue the similar-listing
+            # refresh for the batch here
+            current = list(batch_rows.filter(external_id__in=list(properties)).values(*rollup_fields))
+            apply_changes(removed=previous, added=[(segment_of(row), row['price']) for row in current])
+            sync_amenities({
+                row['pk']: properties[row['external_id']].amenities
+                for row in current if 'amenities' in present[row['external_id']]
+            })
+            for row in current:
+                invalidate_property_detail(row['pk'])
+            enqueue_similar_refresh([row['pk'] for row in current])
+        self.report.upserted += len(properties)
+
+    def _values(self, row):
+        """Field values for the non-blank columns of ``row``, with image references resolved"""
+        values = {}
+        for field in IMPORT_FIELDS:
+            value = row.get(field)
+            if isinstance(value, str):
+                value = value.strip()
+            if value in ('', None):
+                continue
+            if field in BOOLEAN_FIELDS and isinstance(value, str):
+                value = value.lower() in ('1', 'true', 'yes', 'y')
+            elif field == 'amenities' and isinstance(value, str):
+                value = json.loads(value)
+            values[field] = value
+
+        images = row.get('images')
+        if isinstance(images, str) and images.strip():
+            images = json.loads(images) if images.strip().startswith('[') else images.split('|')
+        if images:
+            free_slots = [field for field in IMAGE_FIELDS if field not in values]
+            for field, ref in zip(free_slots, images):
+                values[field] = ref
+
+        for field in IMAGE_FIELDS:
+            if field in values:
+                values[field] = self._resolve_image(str(values[field]).strip())
+                max_length = Property._meta.get_field(field).max_length
+                if len(values[field]) > max_length:
+                    raise ValueError(f'{field} is longer than {max_length} characters')
+
+        return values
+
+    def _resolve_image(self, ref):
+        if ref.startswith(('http://', 'https://')):
+            return ref
+        if ref in self._stored_images:
+            return self._stored_images[ref]
+
+        local_path = None
+        if self.image_root:
+            root = os.path.realpath(self.image_root)
+            local_path = os.path.realpath(os.path.join(root, ref))
+            if os.path.commonpath([root, local_path]) != root:
+                raise ValueError(f'Image path escapes the image root: {ref}')
+        if local_path and os.path.isfile(local_path):
+            with open(local_path, 'rb') as fh:
+                name = default_storage.save(f'properties/{os.path.basename(ref)}', File(fh))
+        elif default_storage.exists(ref):
+            name = ref
+        else:
+            raise ValueError(f'Image not found: {ref}')
+
+        self._stored_images[ref] = name
+        return name
+
+
+def import_properties(stream, fmt='csv', **options):
+    """Import listings from a text stream; returns an ``ImportReport``"""
+    return PropertyImporter(**options).run(stream, fmt)
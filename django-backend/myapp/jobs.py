@@ -0,0 +1,162 @@
+"""
+Lightweight background job queue stored in the ``Job`` table.
+
+Producers call ``enqueue('task-name', {...})`` inside the request; the
+``runworker`` management command claims due jobs and runs the registered
+handler with the payload as keyword arguments. No external broker is needed:
+
+- PostgreSQL claims batches with ``SELECT ... FOR UPDATE SKIP LOCKED``
+- SQLite (no row locks) claims one row at a time with a conditional UPDATE
+
+Failed jobs are retried with exponential backoff and end up ``dead`` after
+``max_attempts``. A running worker refreshes ``locked_at`` on its jobs; jobs
+whose lock goes stale (crashed worker) are requeued, or marked dead once they
+have used up their attempts.
+"""
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+
+def job(name, max_attempts=None):
+    """Register a function as the handler for jobs called ``name``"""
+    def decorator(func):
+        _registry[name] = func
+        func.job_name = name
+        func.max_attempts = max_attempts
+        return func
+    return decorator
+
+
+def get_handler(name):
+    return _registry.get(name)
+
+
+def enqueue(name, payload=None, run_at=None, delay=None, max_attempts=None):
+    """Schedule ``name`` to run with ``payload`` at ``run_at`` (or after ``delay`` seconds)"""
+    if run_at is None:
+        run_at = timezone.now() + timedelta(seconds=delay or 0)
+    handler = _registry.get(name)
+    return Job.objects.create(
+        name=name,
+        payload=payload or {},
+        run_at=run_at,
+        max_attempts=max_attempts or getattr(handler, 'max_attempts', None) or settings.JOB_MAX_ATTEMPTS,
+    )
+
+
+def enqueue_once(name, payload=None, **kwargs):
+    """Like ``enqueue`` but skip if an identical job is already waiting"""
+    payload = payload or {}
+    if Job.objects.filter(name=name, payload=payload, status='queued').exists():
+        return None
+    return enqueue(name, payload, **kwargs)
+
+
+def enqueue_merged(name, field, values, delay=None):
+    """
+    Add ``values`` to the ``payload[field]`` list of a waiting ``name`` job, or
+    enqueue a new one (after ``delay`` seconds) if none is waiting, so a burst
+    of changes runs as one job. The merge only lands while the job is still
+    queued and unchanged since it was read.
+    """
+    values = set(values)
+    for _ in range(3):
+        pending = Job.objects.filter(name=name, status='queued').order_by('run_at', 'id').first()
+        if pending is None:
+            break
+        merged = sorted(values | set(pending.payload.get(field, [])))
+        if Job.objects.filter(pk=pending.pk, status='queued', updated_at=pending.updated_at).update(
+                payload={**pending.payload, field: merged}, updated_at=timezone.now()):
+            return pending
+    return enqueue(name, {field: sorted(values)}, delay=delay)
+
+
+def _due_jobs(now):
+    return Job.objects.filter(status='queued', run_at__lte=now).order_by('run_at', 'id')
+
+
+def claim(worker_id, limit):
+    """Mark up to ``limit`` due jobs as running for ``worker_id`` and return them"""
+    now = timezone.now()
+    claim_values = dict(status='running', locked_by=worker_id, locked_at=now, attempts=F('attempts') + 1)
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            pks = list(_due_jobs(now).select_for_update(skip_locked=True).values_list('pk', flat=True)[:limit])
+            Job.objects.filter(pk__in=pks).update(**claim_values)
+    else:
+        # Polling fallback: whoever flips the row out of 'queued' first owns it
+        pks = [
+            pk for pk in _due_jobs(now).values_list('pk', flat=True)[:limit]
+            if Job.objects.filter(pk=pk, status='queued').update(**claim_values)
+        ]
+
+    return list(Job.objects.filter(pk__in=pks).order_by('run_at', 'id'))
+
+
+def retry_delay(attempts):
+    delay = settings.JOB_RETRY_BACKOFF_SECONDS * (2 ** max(attempts - 1, 0))
+    return timedelta(seconds=min(delay, settings.JOB_RETRY_BACKOFF_MAX_SECONDS))
+
+
+def run(job):
+    """Run a claimed job and record the outcome"""
+    handler = _registry.get(job.name)
+    try:
+        if handler is None:
+            raise LookupError(f"No handler registered for job '{job.name}'")
+        handler(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning("Job %s (%s) failed on attempt %s", job.pk, job.name, job.attempts)
+        if job.attempts >= job.max_attempts:
+            Job.objects.filter(pk=job.pk).update(status='dead', last_error=error, locked_by=None, locked_at=None, updated_at=timezone.now())
+        else:
+            Job.objects.filter(pk=job.pk).update(
+                status='queued', last_error=error, locked_by=None, locked_at=None,
+                run_at=timezone.now() + retry_delay(job.attempts), updated_at=timezone.now(),
+            )
+        return False
+
+    Job.objects.filter(pk=job.pk).update(status='succeeded', last_error=None, locked_by=None, locked_at=None, updated_at=timezone.now())
+    return True
+
+
+def heartbeat(worker_id, job_ids):
+    """Refresh the lock on jobs ``worker_id`` is still running so ``requeue_stale`` leaves them alone"""
+    if not job_ids:
+        return 0
+    return Job.objects.filter(pk__in=job_ids, status='running', locked_by=worker_id).update(locked_at=timezone.now())
+
+
+def requeue_stale(timeout=None):
+    """
+    Give jobs held by a crashed worker back to the queue.
+
+    The lost run was already counted by ``claim``; jobs that have used up
+    ``max_attempts`` are marked ``dead`` instead, so a job that keeps killing
+    its worker is not retried forever.
+    """
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=timeout or settings.JOB_STALE_SECONDS)
+    stale = Job.objects.filter(status='running', locked_at__lt=cutoff)
+    error = 'Worker stopped sending heartbeats; lock expired'
+    with transaction.atomic():
+        stale.filter(attempts__gte=F('max_attempts')).update(
+            status='dead', last_error=error, locked_by=None, locked_at=None, updated_at=now,
+        )
+        return stale.update(
+            status='queued', last_error=error, locked_by=None, locked_at=None, updated_at=now,
+        )
@@ -0,0 +1,124 @@
+"""
+Password login that can't starve the rest of the site.
+
+Password hashing is CPU-heavy on purpose, so a burst of logins (or credential
+stuffing) could otherwise tie up every worker. ``guarded_authenticate``:
+
+- rate limits attempts per client IP and failed attempts per username
+  (fixed-window counters in the cache);
+- runs the hash check on a small per-process thread pool with a bounded
+  queue, answering 429 right away when it is full instead of queueing;
+- rehashes the stored password after a successful login when the preferred
+  hasher changed (e.g. after enabling USE_ARGON2).
+
+The user lookup and any password save happen on the request thread; the pool
+threads only hash, so they never open database connections.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import check_password, make_password
+from django.contrib.auth.signals import user_login_failed
+from django.core.cache import cache
+from rest_framework.exceptions import Throttled
+from rest_framework.throttling import BaseThrottle
+
+User = get_user_model()
+
+
+class LoginPool:
+    """Thread pool that refuses work instead of queueing more than ``queue_size`` hashes"""
+
+    def __init__(self, workers, queue_size):
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='login')
+            return self._executor
+
+    def run(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            raise Throttled(wait=1, detail='Too many logins in progress, try again shortly.')
+        try:
+            future = self._get_executor().submit(func, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=settings.LOGIN_TIMEOUT_SECONDS)
+        except FutureTimeout:
+            raise Throttled(wait=1, detail='Login timed out, try again shortly.')
+
+
+pool = LoginPool(settings.LOGIN_WORKERS, settings.LOGIN_QUEUE_SIZE)
+
+
+def _verify(password, encoded):
+    """(valid, needs_rehash) without touching the database"""
+    outdated = []
+    valid = check_password(password, encoded, setter=lambda raw: outdated.append(True))
+    return valid, bool(outdated)
+
+
+def _hit(key, window):
+    """Increment a fixed-window counter and return the new count"""
+    cache.add(key, 0, window)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Expired between add() and incr()
+        cache.set(key, 1, window)
+        return 1
+
+
+def _ip_key(request):
+    return f'login:ip:{BaseThrottle().get_ident(request)}'
+
+
+def _username_key(username):
+    return f'login:user:{username.strip().lower()}'
+
+
+def check_rate_limits(request, username):
+    """Count this attempt against the client IP and refuse if the IP or username is over its limit"""
+    if _hit(_ip_key(request), settings.LOGIN_IP_WINDOW) > settings.LOGIN_IP_LIMIT:
+        raise Throttled(wait=settings.LOGIN_IP_WINDOW, detail='Too many login attempts from this address.')
+    failures = cache.get(_username_key(username), 0)
+    if failures >= settings.LOGIN_USERNAME_FAILURE_LIMIT:
+        raise Throttled(wait=settings.LOGIN_USERNAME_WINDOW, detail='Too many failed logins for this account.')
+
+
+def guarded_authenticate(request, username, password):
+    """Drop-in for ``authenticate(username=..., password=...)`` with rate limits and the bounded pool"""
+    check_rate_limits(request, username)
+
+    try:
+        user = User._default_manager.get_by_natural_key(username)
+    except User.DoesNotExist:
+        user = None
+
+    if user is None or not user.has_usable_password():
+        # Hash anyway so response time doesn't reveal whether the username exists
+        pool.run(make_password, password)
+        valid = needs_rehash = False
+    else:
+        valid, needs_rehash = pool.run(_verify, password, user.password)
+
+    if not valid or not user.is_active:
+        _hit(_username_key(username), settings.LOGIN_USERNAME_WINDOW)
+        user_login_failed.send(sender=__name__, credentials={'username': username}, request=request)
+        return None
+
+    cache.delete(_username_key(username))
+    if needs_rehash:
+        user.password = pool.run(make_password, password)
+        user.save(update_fields=['password'])
+    return user
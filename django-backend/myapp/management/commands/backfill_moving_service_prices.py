@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from myapp.matching import invalidate_match_index
+from myapp.models import MovingService, parse_price_range
+
+
+class Command(BaseCommand):
+    help = 'Fill MovingService.min_price/max_price from price_range for rows saved before they existed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        changed, unparsed, batch = 0, 0, []
+        services = MovingService.objects.order_by('pk').only('pk', 'price_range', 'min_price', 'max_price')
+        for service in services.iterator(chunk_size=options['batch_size']):
+            bounds = parse_price_range(service.price_range)
+            if bounds == (None, None):
+                unparsed += 1
+            if bounds == (service.min_price, service.max_price):
+                continue
+            service.min_price, service.max_price = bounds
+            # Bumped so Last-Modified and the changes feed pick up the new fields
+            service.updated_at = now
+            batch.append(service)
+            if len(batch) >= options['batch_size']:
+                changed += MovingService.objects.bulk_update(batch, ['min_price', 'max_price', 'updated_at'])
+                batch = []
+        if batch:
+            changed += MovingService.objects.bulk_update(batch, ['min_price', 'max_price', 'updated_at'])
+        if changed:
+            # Starting prices feed the quote matching index
+            invalidate_match_index()
+        self.stdout.write(self.style.SUCCESS(
+            f'Updated price bounds of {changed} moving services ({unparsed} without a recognisable price)'))
@@ -0,0 +1,75 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from myapp.models import MarketplaceItem, Property
+from myapp.serializers import (
+    MarketplaceItemCompactSerializer, MarketplaceItemSerializer, PropertyCompactSerializer, PropertySerializer,
+)
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compare ModelSerializer and compact list rendering for one page of properties/marketplace items'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=100, help='Rows per rendered page')
+        parser.add_argument('--repeat', type=int, default=50, help='Number of timed renders per serializer')
+
+    def handle(self, *args, **options):
+        page_size, repeat = options['page_size'], options['repeat']
+        request = Request(APIRequestFactory().get('/api/properties/'))
+        context = {'request': request}
+
+        # Sample rows are created in a transaction that is always rolled back
+        try:
+            with transaction.atomic():
+                self._create_rows(page_size)
+                for label, model, full, compact in (
+                    ('properties', Property, PropertySerializer, PropertyCompactSerializer),
+                    ('marketplace', MarketplaceItem, MarketplaceItemSerializer, MarketplaceItemCompactSerializer),
+                ):
+                    queryset = model.objects.all()[:page_size]
+                    values = model.objects.values(*compact(context=context).value_fields())[:page_size]
+                    full_time = self._time(lambda: full(list(queryset.all()), many=True, context=context).data, repeat)
+                    compact_time = self._time(lambda: compact(context=context).render(list(values.all())), repeat)
+                    self.stdout.write(
+                        f'{label}: {page_size} rows  serializer {full_time * 1000:.2f} ms  '
+                        f'compact {compact_time * 1000:.2f} ms  speedup {full_time / compact_time:.1f}x'
+                    )
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _time(self, render, repeat):
+        render()
+        started = time.perf_counter()
+        for _ in range(repeat):
+            render()
+        return (time.perf_counter() - started) / repeat
+
+    def _create_rows(self, count):
+        user = get_user_model().objects.create_user(username='benchmark-list-serializers')
+        Property.objects.bulk_create([
+            Property(
+                title=f'Benchmark listing {i}', location='Nairobi', county='Nairobi', town='Kilimani',
+                price='25000.00', rating='4.5', bedrooms=2, bathrooms=1, amenities=['wifi', 'parking'],
+                image1=f'properties/bench-{i}-1.jpg', image2=f'properties/bench-{i}-2.jpg',
+                image3=f'properties/bench-{i}-3.jpg',
+            )
+            for i in range(count)
+        ])
+        MarketplaceItem.objects.bulk_create([
+            MarketplaceItem(
+                title=f'Benchmark item {i}', price='1500.00', category='furniture', condition='used',
+                location='Nairobi', image='https://example.com/item.jpg', created_by=user,
+            )
+            for i in range(count)
+        ])
@@ -0,0 +1,65 @@
+import csv
+import io
+import sys
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.importers import detect_format, import_properties
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Stream-import property listings from a CSV or NDJSON file, upserting by external_id'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV/NDJSON file to import, or '-' for stdin")
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help='Input format (default: guessed from the file extension)')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--image-root', help='Directory that relative image paths in the file are resolved against')
+        parser.add_argument('--created-by', help='Username recorded as creator of new listings')
+        parser.add_argument('--errors-file', help='Write every rejected row (line, external_id, error) to this CSV file')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or detect_format(path)
+
+        created_by = None
+        if options['created_by']:
+            try:
+                created_by = User.objects.get(username=options['created_by'])
+            except User.DoesNotExist:
+                raise CommandError(f"User '{options['created_by']}' does not exist")
+
+        errors_fh = open(options['errors_file'], 'w', newline='') if options['errors_file'] else None
+        error_writer = None
+        if errors_fh:
+            error_writer = csv.writer(errors_fh)
+            error_writer.writerow(['line', 'external_id', 'error'])
+
+        def progress(report):
+            self.stdout.write(f'{report.rows} rows processed: {report.upserted} upserted, {report.failed} rejected')
+
+        stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig') if path == '-' else open(path, encoding='utf-8-sig', newline='')
+        try:
+            report = import_properties(
+                stream, fmt,
+                batch_size=options['batch_size'],
+                image_root=options['image_root'],
+                created_by=created_by,
+                error_writer=error_writer,
+                on_batch=progress,
+            )
+        finally:
+            stream.close()
+            if errors_fh:
+                errors_fh.close()
+
+        for error in report.errors[:20]:
+            self.stderr.write(f"line {error['line']} ({error['external_id'] or 'no external_id'}): {error['error']}")
+        if report.failed > 20:
+            self.stderr.write(f'... and {report.failed - 20} more rejected rows')
+
+        style = self.style.SUCCESS if not report.failed else self.style.WARNING
+        self.stdout.write(style(f'Imported {report.upserted} of {report.rows} rows ({report.failed} rejected)'))
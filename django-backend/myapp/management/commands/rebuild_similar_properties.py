@@ -0,0 +1,15 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from myapp.similarity import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recompute the similar-listings table for every property from scratch'
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = rebuild()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt similar listings for {count} properties in {elapsed:.2f}s'))
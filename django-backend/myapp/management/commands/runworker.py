@@ -0,0 +1,84 @@
+import os
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from myapp import jobs
+
+
+class Command(BaseCommand):
+    help = 'Run background jobs from the database job queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=settings.JOB_WORKER_CONCURRENCY, help='Number of jobs run in parallel')
+        parser.add_argument('--poll-interval', type=float, default=settings.JOB_POLL_INTERVAL, help='Seconds to sleep when no job is due')
+        parser.add_argument('--once', action='store_true', help='Exit once no job is due instead of polling forever')
+
+    def handle(self, *args, **options):
+        concurrency = max(1, options['concurrency'])
+        worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        stopping = threading.Event()
+        slots = threading.BoundedSemaphore(concurrency)
+        running = set()
+        running_lock = threading.Lock()
+
+        def request_stop(signum, frame):
+            self.stdout.write('Stopping after running jobs finish...')
+            stopping.set()
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+
+        def execute(job):
+            try:
+                jobs.run(job)
+            finally:
+                with running_lock:
+                    running.discard(job.pk)
+                # Each pool thread owns a connection; don't leak it between jobs
+                connection.close()
+                slots.release()
+
+        self.stdout.write(f'Worker {worker_id} started with concurrency {concurrency}')
+        last_stale_check = 0.0
+        last_heartbeat = time.monotonic()
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='job') as pool:
+            while not stopping.is_set():
+                close_old_connections()
+                # Keep the locks on long-running jobs fresh, well inside the stale cutoff
+                if time.monotonic() - last_heartbeat > settings.JOB_STALE_SECONDS / 4:
+                    last_heartbeat = time.monotonic()
+                    with running_lock:
+                        running_ids = list(running)
+                    jobs.heartbeat(worker_id, running_ids)
+                if time.monotonic() - last_stale_check > settings.JOB_STALE_SECONDS / 2:
+                    last_stale_check = time.monotonic()
+                    requeued = jobs.requeue_stale()
+                    if requeued:
+                        self.stdout.write(f'Requeued {requeued} stale job(s)')
+
+                # Only claim as many jobs as there are idle threads
+                free = 0
+                while slots.acquire(blocking=False):
+                    free += 1
+                claimed = jobs.claim(worker_id, free) if free else []
+                for _ in range(free - len(claimed)):
+                    slots.release()
+                for job in claimed:
+                    with running_lock:
+                        running.add(job.pk)
+                    pool.submit(execute, job)
+
+                if claimed:
+                    continue
+                if options['once'] and free == concurrency:
+                    break
+                stopping.wait(options['poll_interval'])
+
+        self.stdout.write(self.style.SUCCESS(f'Worker {worker_id} stopped'))
@@ -0,0 +1,205 @@
+"""
+Ranks verified moving services for a move (``POST /api/quotes/match/``).
+
+Each candidate gets a weighted sum (``MATCH_WEIGHTS``) of scores in [0, 1]:
+
+- distance: 1 in the pickup town, 0 at ``MATCH_RADIUS_KM`` (from the offline
+  town matrix in towns.py);
+- rating: the average rating, shrunk towards ``RATING_PRIOR`` while a
+  service has few reviews;
+- price: the percentile of its starting price among all verified services
+  (cheapest 1, dearest 0, unknown 0.5); services starting above ``budget``
+  are dropped;
+- load: ``1 / (1 + pending quotes / LOAD_HALF)``, from ``QuoteCounter``.
+
+Everything but the load changes only when a service is saved, so it is kept
+in a per-town index in process memory: for every town, NumPy arrays of the
+verified services' ids, rating and price scores and starting prices. The
+index is rebuilt with one query when ``invalidate_match_index()`` bumps its
+version (on every ``MovingService`` save or delete) or after
+``MATCH_INDEX_SECONDS``.
+
+A match reads the towns near the pickup from the index, then fetches pending
+counts in batches in order of best possible score (load = 1) and stops once
+no remaining candidate can beat the current top ``limit``. Only the winners'
+cards are loaded, so the cost depends on the result size, not on how many
+services operate around the pickup town.
+"""
+import heapq
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import MoverQuote, MovingService
+from .quote_counters import counts, record_created
+from .serializers import MovingServiceCompactSerializer
+from .towns import towns_within
+
+MATCH_WEIGHTS = {'distance': 0.35, 'rating': 0.3, 'price': 0.2, 'load': 0.15}
+
+RATING_PRIOR = 3.5
+RATING_PRIOR_REVIEWS = 5
+
+# Pending quotes at which the load score halves
+LOAD_HALF = 5
+
+MATCH_FIELDS = ['id', 'name', 'location', 'town', 'price_range', 'min_price', 'max_price', 'services', 'image',
+                'rating', 'reviews', 'verified']
+
+VERSION_KEY = 'matching:index:version'
+
+_index = {'version': None, 'built_at': 0.0, 'towns': {}}
+_index_lock = threading.Lock()
+
+
+def invalidate_match_index():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        # No index built anywhere yet
+        pass
+
+
+def rating_scores(ratings, reviews):
+    ratings = np.where(np.isnan(ratings), RATING_PRIOR, ratings)
+    return (ratings * reviews + RATING_PRIOR * RATING_PRIOR_REVIEWS) / (reviews + RATING_PRIOR_REVIEWS) / 5
+
+
+def price_scores(prices):
+    """1 for the cheapest known starting price down to 0 for the dearest; 0.5 when unknown"""
+    known = np.sort(prices[~np.isnan(prices)])
+    scores = np.full(len(prices), 0.5)
+    if len(known) > 1:
+        present = ~np.isnan(prices)
+        # Mid-rank of ties, so equal prices score the same
+        ranks = (np.searchsorted(known, prices[present], 'left') + np.searchsorted(known, prices[present], 'right') - 1) / 2
+        scores[present] = 1 - ranks / (len(known) - 1)
+    elif len(known) == 1:
+        scores[~np.isnan(prices)] = 1.0
+    return scores
+
+
+def build_index():
+    """``{town: (ids, rating scores, price scores, starting prices)}`` for the verified services"""
+    rows = list(
+        MovingService.objects.filter(verified=True).exclude(town='').order_by('pk')
+        .values_list('pk', 'town', 'rating', 'reviews', 'min_price')
+    )
+    if not rows:
+        return {}
+    ids = np.array([row[0] for row in rows], dtype=np.int64)
+    towns = np.array([row[1] for row in rows])
+    ratings = np.array([np.nan if row[2] is None else float(row[2]) for row in rows])
+    reviews = np.array([row[3] or 0 for row in rows], dtype=np.float64)
+    prices = np.array([np.nan if row[4] is None else float(row[4]) for row in rows])
+    rating, price = rating_scores(ratings, reviews), price_scores(prices)
+    index = {}
+    for town in np.unique(towns):
+        mask = towns == town
+        index[str(town)] = (ids[mask], rating[mask], price[mask], prices[mask])
+    return index
+
+
+def get_index():
+    cache.add(VERSION_KEY, 1, None)
+    version = cache.get(VERSION_KEY, 1)
+    with _index_lock:
+        stale = time.monotonic() - _index['built_at'] > settings.MATCH_INDEX_SECONDS
+        if _index['version'] != version or stale:
+            _index.update(version=version, built_at=time.monotonic(), towns=build_index())
+        return _index['towns']
+
+
+def _candidates(pickup_town, budget):
+    """Arrays (ids, distance km, distance/rating/price scores) of the verified services near ``pickup_town``"""
+    radius = settings.MATCH_RADIUS_KM
+    index = get_index()
+    parts = []
+    for town, km in towns_within(pickup_town, radius).items():
+        if town not in index:
+            continue
+        ids, rating, price, prices = index[town]
+        if budget is not None:
+            # Unknown prices stay in, as with ?budget= on the services list
+            keep = ~(prices > float(budget))
+            ids, rating, price = ids[keep], rating[keep], price[keep]
+        distance = max(0.0, 1 - km / radius) if radius else 1.0
+        parts.append((ids, np.full(len(ids), km), np.full(len(ids), distance), rating, price))
+    if not parts:
+        return None
+    return tuple(np.concatenate(column) for column in zip(*parts))
+
+
+def match_services(request, pickup_town, limit, budget=None):
+    """Best ``limit`` candidates for a move from ``pickup_town``, best first, as service cards plus scores"""
+    candidates = _candidates(pickup_town, budget)
+    if candidates is None or not len(candidates[0]):
+        return []
+    ids, km, distance, rating, price = candidates
+    base = MATCH_WEIGHTS['distance'] * distance + MATCH_WEIGHTS['rating'] * rating + MATCH_WEIGHTS['price'] * price
+    # Best possible score: no pending quotes
+    optimistic = base + MATCH_WEIGHTS['load']
+    order = np.lexsort((ids, -optimistic))
+
+    best = []  # min-heap of (score, -id, position, pending)
+    batch_size = max(4 * limit, 32)
+    for start in range(0, len(order), batch_size):
+        batch = order[start:start + batch_size]
+        if len(best) == limit and optimistic[batch[0]] < best[0][0]:
+            break
+        pending = counts(ids[batch].tolist(), statuses=['pending'])
+        for position in batch.tolist():
+            queued = pending.get(int(ids[position]), {}).get('pending', 0)
+            score = base[position] + MATCH_WEIGHTS['load'] / (1 + queued / LOAD_HALF)
+            entry = (score, -int(ids[position]), position, queued)
+            if len(best) < limit:
+                heapq.heappush(best, entry)
+            elif entry > best[0]:
+                heapq.heapreplace(best, entry)
+    best.sort(reverse=True)
+
+    compact = MovingServiceCompactSerializer(context={'request': request}, fields=MATCH_FIELDS)
+    rows = {
+        row['id']: row
+        for row in MovingService.objects.filter(pk__in=[-entry[1] for entry in best]).values(*compact.value_fields())
+    }
+    results = []
+    for score, negative_id, position, queued in best:
+        if -negative_id not in rows:
+            # Deleted since the index was built
+            continue
+        results.append({
+            'service': compact.to_representation(rows[-negative_id]),
+            'score': round(float(score), 4),
+            'scores': {
+                'distance': round(float(distance[position]), 4),
+                'rating': round(float(rating[position]), 4),
+                'price': round(float(price[position]), 4),
+                'load': round(1 / (1 + queued / LOAD_HALF), 4),
+            },
+            'distance_km': round(float(km[position]), 1),
+            'pending_quotes': queued,
+        })
+    return results
+
+
+def create_quotes(user, matches, data):
+    """One pending quote per match, inserted with a single ``bulk_create``; returns the quotes"""
+    quotes = [
+        MoverQuote(
+            service_id=match['service']['id'], user=user,
+            client_name=data['client_name'], client_email=data['client_email'], client_phone=data['client_phone'],
+            pickup_location=data['pickup_location'], delivery_location=data['delivery_location'],
+            moving_date=data['moving_date'], inventory=data.get('inventory'),
+        )
+        for match in matches
+    ]
+    with transaction.atomic():
+        quotes = MoverQuote.objects.bulk_create(quotes)
+        # bulk_create skips post_save
+        record_created(quotes)
+    return quotes
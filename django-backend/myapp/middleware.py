@@ -0,0 +1,98 @@
+import re
+
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+
+from .profiling import sampler
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+re_accepts_br = re.compile(r'\bbr\b')
+
+# Already compressed, or must reach the client unbuffered
+UNCOMPRESSED_CONTENT_TYPES = ('image/', 'video/', 'audio/', 'font/woff', 'application/zip', 'application/gzip', 'text/event-stream')
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    GZipMiddleware that prefers Brotli when the client accepts it and the
+    ``brotli`` package is installed. Bodies smaller than COMPRESSION_MIN_SIZE,
+    already-compressed or event-stream content and partial (206) responses,
+    whose Content-Range counts uncompressed bytes, are sent as-is; streaming
+    responses are compressed chunk by chunk and flushed after every chunk.
+    """
+
+    def process_response(self, request, response):
+        if not response.streaming and len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+        if response.get('Content-Type', '').startswith(UNCOMPRESSED_CONTENT_TYPES):
+            return response
+        if response.status_code == 206 or response.has_header('Content-Range'):
+            return response
+        if brotli is None or response.has_header('Content-Encoding'):
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if not re_accepts_br.search(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+            return super().process_response(request, response)
+
+        quality = settings.COMPRESSION_BROTLI_QUALITY
+        if response.streaming:
+            if response.is_async:
+                original_iterator = response.streaming_content
+
+                async def brotli_wrapper():
+                    compressor = brotli.Compressor(quality=quality)
+                    async for chunk in original_iterator:
+                        yield compressor.process(chunk) + compressor.flush()
+                    yield compressor.finish()
+
+                response.streaming_content = brotli_wrapper()
+            else:
+                response.streaming_content = compress_sequence_brotli(response.streaming_content, quality)
+            del response.headers['Content-Length']
+        else:
+            compressed_content = brotli.compress(response.content, quality=quality)
+            if len(compressed_content) >= len(response.content):
+                return response
+            response.content = compressed_content
+            response.headers['Content-Length'] = str(len(response.content))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'br'
+        return response
+
+
+def compress_sequence_brotli(sequence, quality):
+    compressor = brotli.Compressor(quality=quality)
+    for chunk in sequence:
+        # Flush so every chunk reaches the client as soon as it's produced
+        yield compressor.process(chunk) + compressor.flush()
+    yield compressor.finish()
+
+
+class SamplingProfilerMiddleware:
+    """Register the current thread with the stack sampler while a view runs"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            return self.get_response(request)
+        finally:
+            sampler.leave()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not sampler.is_sampling():
+            return None
+        match = request.resolver_match
+        endpoint = (match.view_name or match.route) if match else request.path
+        sampler.enter(endpoint)
+        return None
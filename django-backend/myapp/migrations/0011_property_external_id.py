@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-19 14:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0010_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='property',
+            name='external_id',
+            field=models.CharField(blank=True, help_text="Listing key in the agency's own system, used by bulk imports", max_length=100, null=True, unique=True),
+        ),
+    ]
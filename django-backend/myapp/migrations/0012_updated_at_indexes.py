@@ -0,0 +1,27 @@
+# Generated by Django 5.1.1 on 2026-10-19 15:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0011_property_external_id'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='marketplaceitem',
+            index=models.Index(fields=['updated_at'], name='marketplace_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movingservice',
+            index=models.Index(fields=['updated_at'], name='movingservice_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='property',
+            index=models.Index(fields=['updated_at'], name='property_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.1.1 on 2026-10-19 15:22
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0012_updated_at_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletionLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=100)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['deleted_at', 'id'],
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name='marketplaceitem',
+            name='marketplace_updated_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='movingservice',
+            name='movingservice_updated_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='property',
+            name='property_updated_idx',
+        ),
+        migrations.AddIndex(
+            model_name='marketplaceitem',
+            index=models.Index(fields=['updated_at', 'id'], name='marketplace_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movingservice',
+            index=models.Index(fields=['updated_at', 'id'], name='movingservice_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='property',
+            index=models.Index(fields=['updated_at', 'id'], name='property_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deletionlog',
+            index=models.Index(fields=['model', 'deleted_at', 'id'], name='deletionlog_feed_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.1 on 2026-10-19 15:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0014_property_similar_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarProperty',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+            ],
+            options={
+                'ordering': ['property', 'rank'],
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name='property',
+            name='property_similar_idx',
+        ),
+        migrations.AddField(
+            model_name='similarproperty',
+            name='neighbor',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbor_of', to='myapp.property'),
+        ),
+        migrations.AddField(
+            model_name='similarproperty',
+            name='property',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbors', to='myapp.property'),
+        ),
+        migrations.AddConstraint(
+            model_name='similarproperty',
+            constraint=models.UniqueConstraint(fields=('property', 'rank'), name='similarproperty_rank_uniq'),
+        ),
+    ]
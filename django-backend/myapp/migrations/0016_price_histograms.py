@@ -0,0 +1,29 @@
+# Generated by Django 5.1.1 on 2026-10-19 15:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0015_similar_properties'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceHistogramBin',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price_type', models.CharField(max_length=20)),
+                ('county', models.CharField(blank=True, default='', max_length=100)),
+                ('town', models.CharField(blank=True, default='', max_length=100)),
+                ('rental_type', models.CharField(blank=True, default='', max_length=20)),
+                ('period', models.DateField(help_text='First day of the month the listings were created in')),
+                ('bin', models.PositiveSmallIntegerField()),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('price_type', 'county', 'town', 'rental_type', 'period', 'bin'), name='pricehistogrambin_segment_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.1 on 2026-10-19 15:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_amenities(apps, schema_editor):
+    from myapp.amenities import amenity_rows
+
+    Property = apps.get_model('myapp', 'Property')
+    PropertyAmenity = apps.get_model('myapp', 'PropertyAmenity')
+    rows = [
+        PropertyAmenity(property_id=property_id, key=key[:50], name=name[:255])
+        for property_id, amenities in Property.objects.values_list('pk', 'amenities').iterator()
+        for key, name in sorted(amenity_rows(amenities))
+    ]
+    PropertyAmenity.objects.bulk_create(rows, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0016_price_histograms'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PropertyAmenity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(help_text="Category or feature, e.g. 'schools' or 'parking'", max_length=50)),
+                ('name', models.CharField(blank=True, default='', help_text='Place within the category, if any', max_length=255)),
+                ('property', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='amenity_rows', to='myapp.property')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['key', 'property'], name='propertyamenity_key_idx')],
+                'constraints': [models.UniqueConstraint(fields=('property', 'key', 'name'), name='propertyamenity_uniq')],
+            },
+        ),
+        migrations.RunPython(backfill_amenities, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.1 on 2026-10-19 15:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_purchased_items_sold(apps, schema_editor):
+    MarketplaceItem = apps.get_model('myapp', 'MarketplaceItem')
+    Purchase = apps.get_model('myapp', 'Purchase')
+    purchased = Purchase.objects.exclude(status='cancelled').values('item_id')
+    MarketplaceItem.objects.filter(pk__in=purchased).update(status='sold')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0017_property_amenities'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='marketplaceitem',
+            name='status',
+            field=models.CharField(choices=[('available', 'Available'), ('sold', 'Sold')], default='available', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='marketplaceitem',
+            index=models.Index(fields=['status', '-created_at'], name='marketplace_status_idx'),
+        ),
+        migrations.RunPython(mark_purchased_items_sold, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.1 on 2026-10-19 15:39
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0018_marketplace_item_status'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movingservice',
+            name='max_price',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='movingservice',
+            name='min_price',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=12, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='movingservice',
+            index=models.Index(fields=['min_price'], name='movingservice_min_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movingservice',
+            index=models.Index(fields=['max_price'], name='movingservice_max_price_idx'),
+        ),
+    ]
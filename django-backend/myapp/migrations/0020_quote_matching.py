@@ -0,0 +1,61 @@
+# Generated by Django 5.1.1 on 2026-10-19 15:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill(apps, schema_editor):
+    from myapp.towns import resolve_town
+
+    MovingService = apps.get_model('myapp', 'MovingService')
+    MoverQuote = apps.get_model('myapp', 'MoverQuote')
+    QuoteCounter = apps.get_model('myapp', 'QuoteCounter')
+    services = list(MovingService.objects.only('pk', 'location'))
+    for service in services:
+        service.town = resolve_town(service.location) or ''
+    MovingService.objects.bulk_update(services, ['town'], batch_size=500)
+    totals = MoverQuote.objects.order_by().values_list('service_id', 'status').annotate(count=Count('id'))
+    QuoteCounter.objects.bulk_create(
+        [QuoteCounter(service_id=service_id, status=status, count=count) for service_id, status, count in totals],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0019_moving_service_price_bounds'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuoteCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('quoted', 'Quoted'), ('accepted', 'Accepted'), ('rejected', 'Rejected'), ('completed', 'Completed')], max_length=20)),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='movingservice',
+            name='town',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='movingservice',
+            index=models.Index(fields=['town', 'verified'], name='movingservice_town_idx'),
+        ),
+        migrations.AddField(
+            model_name='quotecounter',
+            name='service',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='quote_counters', to='myapp.movingservice'),
+        ),
+        migrations.AddConstraint(
+            model_name='quotecounter',
+            constraint=models.UniqueConstraint(fields=('service', 'status'), name='quotecounter_service_status_uniq'),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
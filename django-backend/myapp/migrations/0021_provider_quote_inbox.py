@@ -0,0 +1,19 @@
+# Generated by Django 5.1.1 on 2026-10-19 15:46
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0020_quote_matching'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='moverquote',
+            index=models.Index(fields=['service', 'status', 'created_at'], name='moverquote_inbox_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.1 on 2026-10-19 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0021_provider_quote_inbox'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='similarproperty',
+            index=models.Index(fields=['rank', 'score'], name='similarproperty_weakest_idx'),
+        ),
+    ]
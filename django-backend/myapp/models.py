@@ -1,6 +1,12 @@
+import re
+from decimal import Decimal
+
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
+
+from .towns import resolve_town
 
 # Create your models here.
 
@@ -101,12 +107,17 @@ class Property(models.Model):
     amenities = models.JSONField(blank=True, null=True, help_text="List of amenities available at the property")
 
     # Metadata
+    external_id = models.CharField(max_length=100, unique=True, blank=True, null=True, help_text="Listing key in the agency's own system, used by bulk imports")
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # max(updated_at) for Last-Modified on list endpoints and the (updated_at, id) changes feed cursor
+            models.Index(fields=['updated_at', 'id'], name='property_updated_idx'),
+        ]
 
     def clean(self):
         """Validate that at least 3 images are uploaded and no more than 6"""
@@ -192,11 +203,18 @@ class MarketplaceItem(models.Model):
         ('refurbished', 'Refurbished'),
     ]
 
+    STATUS_CHOICES = [
+        ('available', 'Available'),
+        ('sold', 'Sold'),
+    ]
+
     # Basic Info
     title = models.CharField(max_length=255)
     price = models.DecimalField(max_digits=12, decimal_places=2, validators=[MinValueValidator(0)])
     category = models.CharField(max_length=20, choices=CATEGORY_CHOICES)
     condition = models.CharField(max_length=20, choices=CONDITION_CHOICES)
+    # Only changed by checkout (see checkout.py), never set by the client
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='available')
 
     # Details
     description = models.TextField(blank=True, null=True)
@@ -212,15 +230,55 @@ class MarketplaceItem(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # max(updated_at) for Last-Modified on list endpoints and the (updated_at, id) changes feed cursor
+            models.Index(fields=['updated_at', 'id'], name='marketplace_updated_idx'),
+            # Default list: available items, newest first
+            models.Index(fields=['status', '-created_at'], name='marketplace_status_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+# "5,000", "12.5k", "1.2M" (the currency prefix is ignored)
+PRICE_AMOUNT_RE = re.compile(r'(\d[\d,]*(?:\.\d+)?)\s*([km])?\b', re.IGNORECASE)
+PRICE_MULTIPLIERS = {'': 1, 'k': 1000, 'm': 1000000}
+# Amounts that don't fit min_price/max_price (max_digits=12) are ignored
+PRICE_AMOUNT_LIMIT = Decimal(10) ** 10
+
+def parse_price_range(text):
+    """
+    ``(min, max)`` Decimals for a display range like "KSh 5,000 - KSh 50,000".
+    A single amount is both bounds, unless it reads "from X" (no max) or
+    "up to X" (no min); text without an amount gives ``(None, None)``.
+    """
+    text = text or ''
+    amounts = [
+        Decimal(number.replace(',', '')) * PRICE_MULTIPLIERS[(suffix or '').lower()]
+        for number, suffix in PRICE_AMOUNT_RE.findall(text)
+    ]
+    amounts = [amount for amount in amounts if amount < PRICE_AMOUNT_LIMIT]
+    if not amounts:
+        return None, None
+    if len(amounts) > 1:
+        return min(amounts), max(amounts)
+    lowered = text.lower()
+    if re.search(r'\b(up to|max(imum)?|below|under)\b', lowered):
+        return None, amounts[0]
+    if re.search(r'\b(from|min(imum)?|starting)\b', lowered) or '+' in lowered:
+        return amounts[0], None
+    return amounts[0], amounts[0]
+
 class MovingService(models.Model):
     # Basic Info
     name = models.CharField(max_length=255)
     location = models.CharField(max_length=255)
     price_range = models.CharField(max_length=100)  # e.g., "KSh 5,000 - KSh 50,000"
+    # Parsed from price_range on save, for filtering and ordering in SQL
+    min_price = models.DecimalField(max_digits=12, decimal_places=2, blank=True, null=True, editable=False)
+    max_price = models.DecimalField(max_digits=12, decimal_places=2, blank=True, null=True, editable=False)
+    # Known town the service is based in, resolved from location on save (see towns.py)
+    town = models.CharField(max_length=100, blank=True, default='', editable=False)
 
     # Services Offered
     services = models.JSONField()  # Array of services
@@ -244,10 +302,32 @@ class MovingService(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # max(updated_at) for Last-Modified on list endpoints and the (updated_at, id) changes feed cursor
+            models.Index(fields=['updated_at', 'id'], name='movingservice_updated_idx'),
+            models.Index(fields=['min_price'], name='movingservice_min_price_idx'),
+            models.Index(fields=['max_price'], name='movingservice_max_price_idx'),
+            # Per-town candidate lookup for quote matching
+            models.Index(fields=['town', 'verified'], name='movingservice_town_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        """Keep min_price/max_price in step with price_range and town with location"""
+        self.min_price, self.max_price = parse_price_range(self.price_range)
+        self.town = resolve_town(self.location) or ''
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if 'price_range' in update_fields:
+                update_fields |= {'min_price', 'max_price'}
+            if 'location' in update_fields:
+                update_fields.add('town')
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+
 class MoverQuote(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -281,9 +361,29 @@ class MoverQuote(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Provider inbox: one service's quotes in one status, newest first
+            models.Index(fields=['service', 'status', 'created_at'], name='moverquote_inbox_idx'),
+        ]
+
     def __str__(self):
         return f"{self.client_name} - {self.service.name}"
 
+class QuoteCounter(models.Model):
+    """Quotes of one moving service in one status, maintained on every change (see quote_counters.py)"""
+    service = models.ForeignKey(MovingService, on_delete=models.CASCADE, related_name='quote_counters')
+    status = models.CharField(max_length=20, choices=MoverQuote.STATUS_CHOICES)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['service', 'status'], name='quotecounter_service_status_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.service_id} {self.status}: {self.count}"
+
 class Review(models.Model):
     property = models.ForeignKey(Property, on_delete=models.CASCADE, related_name='property_reviews')
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -331,3 +431,143 @@ class Purchase(models.Model):
 
     def __str__(self):
         return f"{self.buyer_name} - {self.item.title}"
+
+class OutboxEmail(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    # Message
+    to_email = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255, blank=True, null=True)
+
+    # Delivery
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, null=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    # Timestamps
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['next_attempt_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.to_email} - {self.subject}"
+
+class Job(models.Model):
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('dead', 'Dead'),  # gave up after max_attempts
+    ]
+
+    # Task
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+
+    # Scheduling
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+
+    # Worker lease
+    locked_by = models.CharField(max_length=255, blank=True, null=True)
+    locked_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True, null=True)
+
+    # Timestamps
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['run_at']
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='job_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+
+class DeletionLog(models.Model):
+    """Tombstone for a hard-deleted listing, read by the changes feed"""
+    model = models.CharField(max_length=100)  # app_label.model_name
+    object_id = models.PositiveBigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['deleted_at', 'id']
+        indexes = [
+            models.Index(fields=['model', 'deleted_at', 'id'], name='deletionlog_feed_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.model} #{self.object_id} deleted {self.deleted_at:%Y-%m-%d %H:%M}"
+
+class SimilarProperty(models.Model):
+    """Precomputed nearest neighbours of a listing (see similarity.py)"""
+    property = models.ForeignKey(Property, on_delete=models.CASCADE, related_name='neighbors')
+    neighbor = models.ForeignKey(Property, on_delete=models.CASCADE, related_name='neighbor_of')
+    rank = models.PositiveSmallIntegerField()  # 1 = most similar
+    score = models.FloatField()
+
+    class Meta:
+        ordering = ['property', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['property', 'rank'], name='similarproperty_rank_uniq'),
+        ]
+        indexes = [
+            # Weakest entries a changed listing could beat, for incremental refreshes
+            models.Index(fields=['rank', 'score'], name='similarproperty_weakest_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.property_id} -> {self.neighbor_id} (#{self.rank})"
+
+class PropertyAmenity(models.Model):
+    """One amenity of a listing, flattened out of ``Property.amenities`` for indexed filtering (see amenities.py)"""
+    property = models.ForeignKey(Property, on_delete=models.CASCADE, related_name='amenity_rows')
+    key = models.CharField(max_length=50, help_text="Category or feature, e.g. 'schools' or 'parking'")
+    name = models.CharField(max_length=255, blank=True, default='', help_text="Place within the category, if any")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['key', 'property'], name='propertyamenity_key_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['property', 'key', 'name'], name='propertyamenity_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.property_id}: {self.key}" + (f" ({self.name})" if self.name else "")
+
+class PriceHistogramBin(models.Model):
+    """Listings of one segment whose price falls in one histogram bin (see rollups.py)"""
+    price_type = models.CharField(max_length=20)
+    county = models.CharField(max_length=100, blank=True, default='')
+    town = models.CharField(max_length=100, blank=True, default='')
+    rental_type = models.CharField(max_length=20, blank=True, default='')
+    period = models.DateField(help_text="First day of the month the listings were created in")
+    bin = models.PositiveSmallIntegerField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['price_type', 'county', 'town', 'rental_type', 'period', 'bin'],
+                                    name='pricehistogrambin_segment_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.price_type}/{self.county}/{self.town}/{self.rental_type} {self.period:%Y-%m} bin {self.bin}: {self.count}"
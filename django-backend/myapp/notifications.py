@@ -0,0 +1,145 @@
+"""
+Queued e-mail delivery.
+
+Request handlers never talk to SMTP directly: they add rows to the
+``OutboxEmail`` table (a single bulk insert), and a ``send_outbox`` job (or
+the ``send_outbox`` management command) drains the table in batches over one
+reused connection, retrying failed messages with exponential backoff.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .jobs import enqueue_once
+from .models import OutboxEmail
+
+logger = logging.getLogger(__name__)
+
+
+def booking_notification(booking, action):
+    """Build (unsaved) the e-mail telling a guest their booking was ``action``"""
+    property = booking.property
+    body = f"""
+Dear {booking.guest_name},
+
+Your booking for {property.title} has been {action}.
+
+Booking Details:
+- Property: {property.title}
+- Location: {property.location}
+- Booking Date: {booking.booking_date}
+- Status: {action.title()}
+- Booking ID: {booking.id}
+
+Thank you for using Masskan!
+
+Best regards,
+Masskan Team
+"""
+    return OutboxEmail(
+        to_email=booking.guest_email,
+        subject=f"Booking {action.title()}: {property.title}",
+        body=body,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+    )
+
+
+def enqueue_booking_notifications(bookings, action):
+    """Queue one notification per booking with a single INSERT"""
+    emails = OutboxEmail.objects.bulk_create([
+        booking_notification(booking, action) for booking in bookings if booking.guest_email
+    ])
+    if emails:
+        # Let the job worker deliver them promptly
+        enqueue_once('send_outbox')
+    return emails
+
+
+def backoff_delay(attempts):
+    """Delay before the next attempt after ``attempts`` failed deliveries"""
+    delay = settings.OUTBOX_BACKOFF_SECONDS * (2 ** max(attempts - 1, 0))
+    return timedelta(seconds=min(delay, settings.OUTBOX_BACKOFF_MAX_SECONDS))
+
+
+def claim_batch(batch_size):
+    """
+    Lease up to ``batch_size`` due e-mails to this sender.
+
+    Leased rows are pushed ``OUTBOX_LEASE_SECONDS`` into the future so a
+    concurrent sender (or a crashed one) cannot pick them up twice.
+    On backends without SKIP LOCKED the row lock is a no-op, so run a single
+    sender per SQLite database.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(
+            OutboxEmail.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        if batch:
+            lease_until = now + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS)
+            OutboxEmail.objects.filter(pk__in=[email.pk for email in batch]).update(next_attempt_at=lease_until)
+    return batch
+
+
+def send_pending(batch_size=None, connection=None):
+    """Send one batch of due e-mails over a single connection. Returns (sent, failed)."""
+    batch = claim_batch(batch_size or settings.OUTBOX_BATCH_SIZE)
+    if not batch:
+        return 0, 0
+
+    connection = connection or get_connection()
+    sent = failed = 0
+    remaining = list(reversed(batch))
+    try:
+        connection.open()
+        while remaining:
+            email = remaining.pop()
+            message = EmailMessage(
+                subject=email.subject,
+                body=email.body,
+                from_email=email.from_email or settings.DEFAULT_FROM_EMAIL,
+                to=[email.to_email],
+                connection=connection,
+            )
+            try:
+                message.send()
+            except Exception as e:
+                _mark_failed(email, e)
+                failed += 1
+                # The SMTP session may be unusable after an error; start a fresh one
+                connection.close()
+                connection.open()
+            else:
+                email.status = 'sent'
+                email.sent_at = timezone.now()
+                email.attempts += 1
+                email.last_error = None
+                email.save(update_fields=['status', 'sent_at', 'attempts', 'last_error', 'updated_at'])
+                sent += 1
+    except Exception as e:
+        # Could not (re)connect: back off everything that was not attempted
+        logger.warning("Outbox connection failed: %s", e)
+        for email in remaining:
+            _mark_failed(email, e)
+            failed += 1
+    finally:
+        connection.close()
+
+    return sent, failed
+
+
+def _mark_failed(email, error):
+    email.attempts += 1
+    email.last_error = str(error)
+    if email.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+        email.status = 'failed'
+        logger.error("Giving up on e-mail %s to %s after %s attempts: %s", email.pk, email.to_email, email.attempts, error)
+    else:
+        email.next_attempt_at = timezone.now() + backoff_delay(email.attempts)
+    email.save(update_fields=['status', 'attempts', 'last_error', 'next_attempt_at', 'updated_at'])
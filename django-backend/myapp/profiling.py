@@ -0,0 +1,184 @@
+"""
+Low-frequency sampling profiler for request handlers.
+
+A single daemon thread per worker process periodically grabs the Python stack
+of every thread that is currently serving a request and aggregates the stacks
+per endpoint in the collapsed format understood by flamegraph.pl/speedscope:
+
+    frame;frame;frame <count>
+
+Sampling is opt-in: either continuously (``PROFILER_ENABLED``) or for a capture
+window armed by staff through ``/api/admin/profile/?seconds=N``.
+"""
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Cache key holding the unix timestamp until which capture is armed
+CAPTURE_UNTIL_KEY = 'profiler:capture-until'
+
+# How often (seconds) a worker re-reads the capture window from the cache
+CAPTURE_CHECK_INTERVAL = 1.0
+
+MAX_STACK_DEPTH = 64
+
+
+def collapse_stack(frame, max_depth=MAX_STACK_DEPTH):
+    """Render a frame and its callers as a root-first, ';'-joined stack"""
+    frames = []
+    while frame is not None and len(frames) < max_depth:
+        code = frame.f_code
+        frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    frames.reverse()
+    return ';'.join(frames)
+
+
+def _endpoint_filename(endpoint):
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', endpoint) or 'unknown'
+
+
+class StackSampler:
+    """Samples the stacks of threads registered as serving an endpoint"""
+
+    def __init__(self, interval=None, output_dir=None, flush_interval=None):
+        self.interval = interval or getattr(settings, 'PROFILER_INTERVAL', 0.05)
+        self.output_dir = output_dir or getattr(settings, 'PROFILER_OUTPUT_DIR', 'profiles')
+        self.flush_interval = flush_interval or getattr(settings, 'PROFILER_FLUSH_INTERVAL', 60)
+        self.continuous = getattr(settings, 'PROFILER_ENABLED', False)
+
+        self._active = {}  # thread ident -> endpoint
+        self._stacks = defaultdict(Counter)  # endpoint -> collapsed stack -> samples
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._capture_until = 0.0
+        self._capture_checked_at = 0.0
+        self._last_flush = time.monotonic()
+
+    # Request bookkeeping (called from the middleware)
+
+    def is_sampling(self):
+        """Whether requests should currently be registered for sampling"""
+        if self.continuous:
+            return True
+        now = time.time()
+        if now - self._capture_checked_at >= CAPTURE_CHECK_INTERVAL:
+            self._capture_checked_at = now
+            self._capture_until = cache.get(CAPTURE_UNTIL_KEY) or 0.0
+        return now < self._capture_until
+
+    def enter(self, endpoint):
+        self.ensure_started()
+        self._active[threading.get_ident()] = endpoint
+
+    def leave(self):
+        self._active.pop(threading.get_ident(), None)
+
+    # Capture control
+
+    def arm(self, seconds):
+        """Start a capture window of ``seconds`` in every worker sharing the cache"""
+        until = time.time() + seconds
+        cache.set(CAPTURE_UNTIL_KEY, until, timeout=int(seconds) + 60)
+        self._capture_until = until
+        self._capture_checked_at = time.time()
+        self.ensure_started()
+        return until
+
+    def disarm(self):
+        """Close the capture window early; workers flush on their next tick"""
+        cache.set(CAPTURE_UNTIL_KEY, 0.0, timeout=60)
+        self._capture_until = 0.0
+
+    def profile_files(self):
+        """Collapsed-stack files written so far, with their total sample counts"""
+        if not os.path.isdir(self.output_dir):
+            return []
+        files = []
+        for name in sorted(os.listdir(self.output_dir)):
+            if not name.endswith('.collapsed'):
+                continue
+            path = os.path.join(self.output_dir, name)
+            with open(path) as fh:
+                samples = sum(int(line.rsplit(' ', 1)[1]) for line in fh if line.strip())
+            files.append({'file': name, 'samples': samples, 'modified': os.path.getmtime(path)})
+        return files
+
+    def snapshot(self):
+        with self._lock:
+            return {endpoint: Counter(stacks) for endpoint, stacks in self._stacks.items()}
+
+    def flush(self):
+        """Write one collapsed-stack file per endpoint for this worker process"""
+        snapshot = self.snapshot()
+        if not snapshot:
+            return []
+        os.makedirs(self.output_dir, exist_ok=True)
+        written = []
+        for endpoint, stacks in snapshot.items():
+            path = os.path.join(self.output_dir, f"{_endpoint_filename(endpoint)}.{os.getpid()}.collapsed")
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w') as fh:
+                for stack, count in stacks.most_common():
+                    fh.write(f"{stack} {count}\n")
+            os.replace(tmp_path, path)
+            written.append(path)
+        return written
+
+    # Sampling thread
+
+    def ensure_started(self):
+        # Threads do not survive fork(), so restart the sampler in each worker
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+            self._thread.start()
+
+    def sample(self):
+        """Take one sample of every registered thread"""
+        if not self._active:
+            return
+        frames = sys._current_frames()
+        own_ident = threading.get_ident()
+        with self._lock:
+            for ident, endpoint in list(self._active.items()):
+                frame = frames.get(ident)
+                if frame is None or ident == own_ident:
+                    continue
+                self._stacks[endpoint][collapse_stack(frame)] += 1
+
+    def _run(self):
+        capturing = False
+        while True:
+            time.sleep(self.interval)
+
+            window_open = time.time() < self._capture_until
+            if window_open and not capturing and not self.continuous:
+                # New capture window: start from an empty profile
+                with self._lock:
+                    self._stacks.clear()
+            elif capturing and not window_open:
+                # Capture window just closed: persist what this worker saw
+                self.flush()
+            capturing = window_open
+
+            self.sample()
+
+            now = time.monotonic()
+            if self.continuous and now - self._last_flush >= self.flush_interval:
+                self._last_flush = now
+                self.flush()
+
+
+sampler = StackSampler()
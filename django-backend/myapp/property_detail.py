@@ -0,0 +1,96 @@
+"""
+Everything the property details modal shows, in one response.
+
+``property_detail(request, prop)`` assembles the property, its latest
+reviews, the rating histogram, the booked date ranges and a few similar
+listings with one query each, and caches the result per property. Cache keys
+carry a per-property version number that ``invalidate_property_detail()``
+bumps whenever the property, one of its reviews, one of its bookings or its
+similar-listings list changes, so a response built concurrently with a change is written under the
+old version and never served.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import Booking, Property, Review
+from .serializers import PropertyCompactSerializer, PropertySerializer, ReviewSerializer
+
+REVIEWS_LIMIT = 20
+SIMILAR_LIMIT = 4
+
+# Card fields for the similar listings (same as PropertyViewSet's ``card`` preset)
+SIMILAR_FIELDS = ['id', 'title', 'location', 'price', 'price_type', 'type', 'bedrooms', 'bathrooms', 'area',
+                  'image', 'images', 'rating', 'reviews', 'featured', 'managed_by', 'landlord_name', 'agency_name']
+
+
+def _version_key(property_id):
+    return f'property:full:version:{property_id}'
+
+
+def invalidate_property_detail(property_id):
+    try:
+        cache.incr(_version_key(property_id))
+    except ValueError:
+        # Nothing cached for this property yet
+        pass
+
+
+def rating_breakdown(prop):
+    counts = dict(
+        Review.objects.filter(property=prop).order_by().values_list('rating').annotate(count=Count('id'))
+    )
+    return {str(stars): counts.get(stars, 0) for stars in range(1, 6)}
+
+
+def booked_ranges(prop):
+    """Current and future booked (check-in, check-out) ranges, the same ones booking validation rejects"""
+    rows = (
+        Booking.objects
+        .filter(property=prop, check_in_date__isnull=False, check_out_date__gte=timezone.localdate())
+        .order_by('check_in_date')
+        .values_list('check_in_date', 'check_out_date')
+    )
+    return [{'check_in_date': start.isoformat(), 'check_out_date': end.isoformat()} for start, end in rows]
+
+
+def similar_properties(request, prop, limit=SIMILAR_LIMIT):
+    """Cards for the precomputed nearest neighbours of ``prop`` (see similarity.py), most similar first"""
+    compact = PropertyCompactSerializer(context={'request': request}, fields=SIMILAR_FIELDS)
+    rows = (
+        Property.objects
+        .filter(neighbor_of__property=prop)
+        .order_by('neighbor_of__rank')
+        .values(*compact.value_fields())[:limit]
+    )
+    return compact.render(list(rows))
+
+
+def build_property_detail(request, prop):
+    context = {'request': request}
+    reviews = list(Review.objects.filter(property=prop).select_related('user').order_by('-created_at')[:REVIEWS_LIMIT])
+    for review in reviews:
+        # ReviewSerializer renders the property title; it is already loaded
+        review.property = prop
+    return {
+        'property': PropertySerializer(prop, context=context).data,
+        'reviews': ReviewSerializer(reviews, many=True, context=context).data,
+        'rating_breakdown': rating_breakdown(prop),
+        'booked_ranges': booked_ranges(prop),
+        'similar': similar_properties(request, prop),
+    }
+
+
+def property_detail(request, prop):
+    """Cached ``build_property_detail()``"""
+    version_key = _version_key(prop.pk)
+    cache.add(version_key, 1, None)
+    version = cache.get(version_key, 1)
+    # Image URLs are absolute, so responses differ per host
+    key = f'property:full:{prop.pk}:{version}:{request.get_host()}'
+    data = cache.get(key)
+    if data is None:
+        data = build_property_detail(request, prop)
+        cache.set(key, data, settings.PROPERTY_DETAIL_CACHE_SECONDS)
+    return data
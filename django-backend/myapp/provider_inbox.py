@@ -0,0 +1,92 @@
+"""
+Quote inbox for moving companies: the quotes sent to the services a user
+created (``MovingService.created_by``), served by ``ProviderQuoteViewSet``.
+
+Listing one queue (``?service=&status=``) reads the ``(service, status,
+created_at)`` index in order, and cursor pagination keeps every page as
+cheap as the first. ``update_quotes()`` applies a batch of status and
+quote-amount changes with one read and one ``bulk_update``, adjusting the
+``QuoteCounter`` rows and streaming the status events the skipped
+``post_save`` would have sent. Queue sizes come from those counters.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from .events import publish_status_change
+from .models import MoverQuote, MovingService
+from .quote_counters import apply_changes, counts
+
+# Status a provider may move a quote to, by current status; setting only a
+# quote amount moves a pending quote to 'quoted'
+PROVIDER_TRANSITIONS = {
+    'pending': {'quoted', 'rejected'},
+    'quoted': {'quoted', 'rejected'},
+    'accepted': {'completed'},
+}
+
+
+def provider_services(user):
+    return MovingService.objects.filter(created_by=user)
+
+
+def inbox_queryset(user):
+    return MoverQuote.objects.filter(service__in=provider_services(user))
+
+
+def update_quotes(user, updates):
+    """
+    Apply ``[{'id', 'status'?, 'quote_amount'?}]`` to the user's quotes.
+    Returns ``(quotes, errors)``: nothing is written unless every update is
+    valid, in which case ``errors`` is ``[]``.
+    """
+    with transaction.atomic():
+        quotes = {
+            quote.pk: quote
+            for quote in inbox_queryset(user).select_for_update().filter(pk__in=[update['id'] for update in updates])
+        }
+        errors, changed, counter_moves = [], [], ([], [])
+        for index, update in enumerate(updates):
+            quote = quotes.get(update['id'])
+            if quote is None:
+                errors.append({'index': index, 'errors': {'id': 'Not found.'}})
+                continue
+            status = update.get('status') or ('quoted' if 'quote_amount' in update else quote.status)
+            if status not in PROVIDER_TRANSITIONS.get(quote.status, ()):
+                errors.append({'index': index, 'errors': {'status': f'Cannot change a {quote.status} quote to {status}.'}})
+                continue
+            amount = update.get('quote_amount', quote.quote_amount)
+            if status == 'quoted' and amount is None:
+                errors.append({'index': index, 'errors': {'quote_amount': 'Required to quote.'}})
+                continue
+            changed.append((quote, quote.status, status, amount))
+        if errors:
+            return [], errors
+
+        now = timezone.now()
+        for quote, previous, status, amount in changed:
+            if status != previous:
+                counter_moves[0].append((quote.service_id, previous))
+                counter_moves[1].append((quote.service_id, status))
+            quote.status, quote.quote_amount, quote.updated_at = status, amount, now
+            # Counted under the new status from here on
+            quote._counted_queue = (quote.service_id, status)
+        MoverQuote.objects.bulk_update([quote for quote, *_ in changed], ['status', 'quote_amount', 'updated_at'])
+        apply_changes(removed=counter_moves[0], added=counter_moves[1])
+        # bulk_update skips post_save, so stream the transitions here
+        for quote, previous, status, _ in changed:
+            if status != previous:
+                publish_status_change(quote, previous)
+            quote._loaded_status = status
+    return [quote for quote, *_ in changed], []
+
+
+def queue_counts(user):
+    """``{'services': [{'id', 'name', 'counts': {status: n}}], 'totals': {status: n}}`` from the counters"""
+    services = list(provider_services(user).order_by('name', 'pk').values('id', 'name'))
+    by_service = counts([service['id'] for service in services])
+    totals = dict.fromkeys((status for status, _ in MoverQuote.STATUS_CHOICES), 0)
+    for service in services:
+        service['counts'] = {status: by_service.get(service['id'], {}).get(status, 0) for status in totals}
+        for status, count in service['counts'].items():
+            totals[status] += count
+    return {'services': services, 'totals': totals}
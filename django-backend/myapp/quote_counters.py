@@ -0,0 +1,65 @@
+"""
+Mover quotes per (moving service, status), kept in ``QuoteCounter`` so queue
+sizes come from one indexed row instead of ``COUNT(*)`` over ``MoverQuote``.
+
+``post_save``/``post_delete`` on ``MoverQuote`` move one unit between
+counters with ``UPDATE ... SET count = count + n`` in the same transaction
+as the quote change (see signals.py); ``bulk_create`` paths call
+``record_created()`` themselves. ``manage.py rebuild_quote_counters``
+recomputes every counter from the quotes.
+"""
+from collections import Counter, defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from .models import MoverQuote, QuoteCounter
+
+
+def _bump(service_id, status, delta):
+    counters = QuoteCounter.objects.filter(service_id=service_id, status=status)
+    if counters.update(count=F('count') + delta):
+        return
+    try:
+        with transaction.atomic():
+            QuoteCounter.objects.create(service_id=service_id, status=status, count=delta)
+    except IntegrityError:
+        # Created concurrently
+        counters.update(count=F('count') + delta)
+
+
+def apply_changes(removed=(), added=()):
+    """Move quotes between counters: ``removed``/``added`` are ``(service id, status)`` pairs"""
+    deltas = Counter()
+    for key in removed:
+        deltas[key] -= 1
+    for key in added:
+        deltas[key] += 1
+    for (service_id, status), delta in sorted(deltas.items()):
+        if delta:
+            _bump(service_id, status, delta)
+
+
+def record_created(quotes):
+    apply_changes(added=[(quote.service_id, quote.status) for quote in quotes])
+
+
+def counts(service_ids, statuses=None):
+    """``{service id: {status: count}}`` for ``service_ids``, optionally only ``statuses``"""
+    rows = QuoteCounter.objects.filter(service_id__in=service_ids)
+    if statuses is not None:
+        rows = rows.filter(status__in=statuses)
+    result = defaultdict(dict)
+    for service_id, status, count in rows.values_list('service_id', 'status', 'count'):
+        result[service_id][status] = count
+    return result
+
+
+def rebuild():
+    """Recount every counter from the quotes; returns the number of counters"""
+    totals = MoverQuote.objects.order_by().values_list('service_id', 'status').annotate(count=Count('id'))
+    counters = [QuoteCounter(service_id=service_id, status=status, count=count) for service_id, status, count in totals]
+    with transaction.atomic():
+        QuoteCounter.objects.all().delete()
+        QuoteCounter.objects.bulk_create(counters, batch_size=1000)
+    return len(counters)
@@ -0,0 +1,111 @@
+"""
+JSON renderer/parser for the REST API that use orjson when it is installed.
+
+The output is byte-for-byte what DRF's ``JSONRenderer`` produces with this
+project's settings (compact separators, UTF-8, U+2028/U+2029 escaped):
+datetimes, Decimals, lazy strings and other non-native values are passed to
+the same ``default`` hook the stdlib encoder uses. Indented output (the
+browsable API), non-default ``UNICODE_JSON``/``COMPACT_JSON``/``STRICT_JSON``
+settings and values orjson rejects (e.g. integers wider than 64 bits) fall back
+to the stdlib encoder. Known differences: floats of magnitude >= 1e16 or
+< 1e-4 are written ``1e16`` rather than ``1e+16`` (same value), and NaN or
+infinity is written as ``null`` where the strict stdlib encoder raises.
+"""
+import json
+import re
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.json import strict_constant
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+if orjson is not None:
+    # Datetimes and dataclasses go through ``default`` so they match the stdlib encoders
+    ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_NON_STR_KEYS
+
+LINE_SEPARATORS = ((b'\xe2\x80\xa8', b'\\u2028'), (b'\xe2\x80\xa9', b'\\u2029'))
+
+# orjson reads integers beyond 64 bits as floats; bodies that might hold one use the stdlib
+LONG_NUMBER = re.compile(rb'\d{20}')
+
+
+def dumps(data, default):
+    """
+    Encode ``data`` as compact UTF-8 JSON bytes with orjson, using ``default``
+    for values it doesn't handle. Returns None if orjson is unavailable or
+    can't encode ``data`` so the caller can use the stdlib encoder instead.
+    """
+    if orjson is None:
+        return None
+    try:
+        return orjson.dumps(data, default=default, option=ORJSON_OPTIONS)
+    except orjson.JSONEncodeError:
+        return None
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        if (self.ensure_ascii or not self.compact or not self.strict
+                or self.get_indent(accepted_media_type, renderer_context)):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = dumps(data, self.encoder_class().default)
+        if ret is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Same escaping as JSONRenderer: these are valid JSON but not valid JavaScript
+        for raw, escaped in LINE_SEPARATORS:
+            if raw in ret:
+                ret = ret.replace(raw, escaped)
+        return ret
+
+
+class FastJSONParser(JSONParser):
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace('_', '-') not in ('utf-8', 'utf8'):
+            return super().parse(stream, media_type, parser_context)
+
+        body = stream.read()
+        if not LONG_NUMBER.search(body):
+            try:
+                return orjson.loads(body)
+            except orjson.JSONDecodeError:
+                pass
+        # Values orjson refuses (NaN when not strict) and malformed bodies go
+        # through the stdlib, so errors read exactly as they did before
+        try:
+            return json.loads(body.decode(encoding), parse_constant=strict_constant if self.strict else None)
+        except ValueError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
+
+
+class FastJsonResponse(HttpResponse):
+    """
+    Drop-in replacement for ``JsonResponse`` that encodes with orjson when it
+    is installed. Values are converted exactly as ``DjangoJSONEncoder`` does;
+    the body is compact UTF-8 JSON instead of the stdlib's spaced ASCII.
+    """
+    def __init__(self, data, encoder=DjangoJSONEncoder, safe=True, json_dumps_params=None, **kwargs):
+        if safe and not isinstance(data, dict):
+            raise TypeError(
+                'In order to allow non-dict objects to be serialized set the safe parameter to False.'
+            )
+        kwargs.setdefault('content_type', 'application/json')
+        content = None if json_dumps_params else dumps(data, encoder().default)
+        if content is None:
+            content = json.dumps(data, cls=encoder, **(json_dumps_params or {}))
+        super().__init__(content=content, **kwargs)
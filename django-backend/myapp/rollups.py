@@ -0,0 +1,170 @@
+"""
+Price distributions per listing segment, kept as fixed histograms.
+
+A segment is (price_type, county, town, rental_type, month the listing was
+created). Each segment has one ``PriceHistogramBin`` row per non-empty bin
+of a fixed log-scale histogram (``BINS_PER_DECADE`` bins per factor of ten,
+so a quantile read from it is within about 5% of the exact value).
+
+Counts are kept current without rescanning listings: ``post_save`` and
+``post_delete`` on ``Property`` (and the importer, which bypasses them) move
+one unit between bins with ``UPDATE ... SET count = count + n``, in the same
+transaction as the listing change. ``price_stats()`` merges the bins of the
+matching segments in one grouped query, so a request costs O(segments x
+bins) no matter how many listings there are. ``manage.py rebuild_price_rollups``
+recomputes every histogram from scratch.
+"""
+import math
+from collections import Counter, defaultdict
+
+import numpy as np
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+
+from .models import PriceHistogramBin, Property
+
+SEGMENT_FIELDS = ('price_type', 'county', 'town', 'rental_type')
+
+# Bin 0 holds prices below MIN_PRICE, the last bin everything from MAX_PRICE up
+MIN_PRICE = 100
+MAX_PRICE = 10 ** 9
+BINS_PER_DECADE = 24
+BIN_COUNT = 2 + BINS_PER_DECADE * round(math.log10(MAX_PRICE / MIN_PRICE))
+
+REBUILD_CHUNK_SIZE = 5000
+
+
+def bin_indices(prices):
+    """Histogram bin of each price in a float array"""
+    with np.errstate(divide='ignore'):
+        indices = 1 + np.floor(np.log10(np.maximum(prices, 1e-9) / MIN_PRICE) * BINS_PER_DECADE).astype(np.int64)
+    return np.where(prices < MIN_PRICE, 0, np.minimum(indices, BIN_COUNT - 1))
+
+
+def bin_index(price):
+    # Same arithmetic as the rebuild, so a listing is always removed from the bin it was counted in
+    return int(bin_indices(np.array([float(price)]))[0])
+
+
+def bin_bounds(index):
+    """(low, high) price range of bin ``index``"""
+    if index == 0:
+        return 0.0, float(MIN_PRICE)
+    low = MIN_PRICE * 10 ** ((index - 1) / BINS_PER_DECADE)
+    return low, low * 10 ** (1 / BINS_PER_DECADE)
+
+
+def segment_of(values):
+    """Segment key for a mapping holding SEGMENT_FIELDS and ``created_at``"""
+    return tuple(values[field] or '' for field in SEGMENT_FIELDS) + (values['created_at'].date().replace(day=1),)
+
+
+def _bump(segment, index, delta):
+    lookup = dict(zip(SEGMENT_FIELDS + ('period',), segment), bin=index)
+    bins = PriceHistogramBin.objects.filter(**lookup)
+    if bins.update(count=F('count') + delta):
+        return
+    try:
+        with transaction.atomic():
+            PriceHistogramBin.objects.create(count=delta, **lookup)
+    except IntegrityError:
+        # Created concurrently
+        bins.update(count=F('count') + delta)
+
+
+def apply_changes(removed=(), added=()):
+    """Move listings between bins: ``removed``/``added`` are ``(segment, price)`` pairs"""
+    deltas = Counter()
+    for segment, price in removed:
+        deltas[segment, bin_index(price)] -= 1
+    for segment, price in added:
+        deltas[segment, bin_index(price)] += 1
+    for (segment, index), delta in sorted(deltas.items()):
+        if delta:
+            _bump(segment, index, delta)
+
+
+def rebuild():
+    """Recompute every histogram with NumPy over chunks of listings; returns the number of listings"""
+    histograms = defaultdict(lambda: np.zeros(BIN_COUNT, dtype=np.int64))
+    total = 0
+    rows = Property.objects.order_by().values_list(*SEGMENT_FIELDS, 'created_at', 'price').iterator(
+        chunk_size=REBUILD_CHUNK_SIZE)
+    while True:
+        chunk = [row for _, row in zip(range(REBUILD_CHUNK_SIZE), rows)]
+        if not chunk:
+            break
+        total += len(chunk)
+        indices = bin_indices(np.array([float(row[-1]) for row in chunk]))
+        segments = [
+            tuple(value or '' for value in row[:len(SEGMENT_FIELDS)]) + (row[-2].date().replace(day=1),)
+            for row in chunk
+        ]
+        keys = {}
+        codes = np.array([keys.setdefault(segment, len(keys)) for segment in segments])
+        counts = np.zeros((len(keys), BIN_COUNT), dtype=np.int64)
+        np.add.at(counts, (codes, indices), 1)
+        for segment, code in keys.items():
+            histograms[segment] += counts[code]
+
+    bins = [
+        PriceHistogramBin(count=int(count), bin=int(index), **dict(zip(SEGMENT_FIELDS + ('period',), segment)))
+        for segment, histogram in histograms.items()
+        for index, count in enumerate(histogram)
+        if count
+    ]
+    with transaction.atomic():
+        PriceHistogramBin.objects.all().delete()
+        PriceHistogramBin.objects.bulk_create(bins, batch_size=1000)
+    return total
+
+
+def quantiles(histogram, qs=(0.25, 0.5, 0.75)):
+    """Quantiles of a ``{bin: count}`` histogram, interpolated on a log scale within a bin"""
+    count = sum(histogram.values())
+    results = []
+    for q in qs:
+        target, seen = q * count, 0
+        for index in sorted(histogram):
+            in_bin = histogram[index]
+            if in_bin <= 0:
+                continue
+            if seen + in_bin >= target:
+                low, high = bin_bounds(index)
+                fraction = (target - seen) / in_bin
+                if index == 0:
+                    value = low + fraction * (high - low)
+                else:
+                    value = low * (high / low) ** fraction
+                results.append(round(value, 2))
+                break
+            seen += in_bin
+    return results
+
+
+def price_stats(filters, group_by):
+    """
+    ``[{<group_by fields>, 'count', 'p25', 'median', 'p75'}]`` for the
+    segments matching ``filters`` (field -> value), merged per ``group_by``
+    combination (a subset of SEGMENT_FIELDS + ('period',)).
+    """
+    rows = (
+        PriceHistogramBin.objects
+        .filter(**filters)
+        .values(*group_by, 'bin')
+        .annotate(total=Sum('count'))
+        .order_by()
+    )
+    groups = defaultdict(dict)
+    for row in rows:
+        groups[tuple(row[field] for field in group_by)][row['bin']] = row['total']
+
+    results = []
+    for key in sorted(groups, key=lambda key: tuple(str(value) for value in key)):
+        histogram = groups[key]
+        count = sum(histogram.values())
+        if count <= 0:
+            continue
+        p25, median, p75 = quantiles(histogram)
+        results.append({**dict(zip(group_by, key)), 'count': count, 'p25': p25, 'median': median, 'p75': p75})
+    return results
@@ -1,10 +1,40 @@
+from decimal import Decimal
+
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
 from .models import Property, Booking, MarketplaceItem, MovingService, MoverQuote, Purchase, Review
 from django.db.models import Q
+from django.utils import timezone
+from .towns import resolve_town
 
 User = get_user_model()
 
+class PrefetchablePrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Primary key field that can resolve ids from a map prefetched by bulk
+    endpoints (``context['prefetched'][field_name]``), so validating a batch
+    costs one query per relation instead of one per item.
+    """
+    def to_internal_value(self, data):
+        prefetched = self.context.get('prefetched', {}).get(self.field_name)
+        if prefetched is None:
+            return super().to_internal_value(data)
+        try:
+            pk = self.get_queryset().model._meta.pk.to_python(data)
+        except Exception:
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if pk not in prefetched:
+            self.fail('does_not_exist', pk_value=data)
+        return prefetched[pk]
+
+def image_url(image, request=None):
+    """URL of an image column; remote ``http(s)://`` names (e.g. from the CSV importer) are returned as stored"""
+    name = str(getattr(image, 'name', image))
+    if name.startswith(('http://', 'https://')):
+        return name
+    url = image.url if hasattr(image, 'url') else name
+    return request.build_absolute_uri(url) if request else url
+
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
@@ -27,6 +57,9 @@ class RegisterSerializer(serializers.ModelSerializer):
         )
         return user
 
+# Output fields of PropertySerializer that are derived from all the image columns together
+PROPERTY_IMAGE_FIELDS = ('image1', 'image2', 'image3', 'image4', 'image5', 'image6', 'image', 'images')
+
 class PropertySerializer(serializers.ModelSerializer):
     # Image fields
     image1 = serializers.ImageField(required=False)
@@ -44,10 +77,17 @@ class PropertySerializer(serializers.ModelSerializer):
         model = Property
         fields = ['id', 'title', 'location', 'county', 'town', 'price', 'price_type', 'type', 'bedrooms', 'bathrooms', 'area', 'rental_type', 'image1', 'image2', 'image3', 'image4', 'image5', 'image6', 'image', 'images', 'rating', 'reviews', 'featured', 'managed_by', 'landlord_name', 'agency_name', 'ready_date', 'amenities', 'created_at']
 
+    # Model columns read to render each output field (for sparse fieldsets)
+    field_dependencies = {name: PROPERTY_IMAGE_FIELDS for name in PROPERTY_IMAGE_FIELDS}
+
     def to_representation(self, instance):
         """Convert image fields to URLs for API responses"""
         representation = super().to_representation(instance)
 
+        # Sparse fieldset without any image field: don't touch the image columns
+        if not any(name in self.fields for name in PROPERTY_IMAGE_FIELDS):
+            return representation
+
         request = self.context.get('request')
 
         # Convert all image fields to URLs
@@ -56,21 +96,7 @@ class PropertySerializer(serializers.ModelSerializer):
             image_field_name = f'image{i}'
             image_field = getattr(instance, image_field_name)
             if image_field:
-                # Handle both Django ImageField objects and string paths
-                if hasattr(image_field, 'url'):
-                    # Django ImageField
-                    if request:
-                        url = request.build_absolute_uri(image_field.url)
-                    else:
-                        url = image_field.url
-                else:
-                    # Plain string path
-                    if str(image_field).startswith('http'):
-                        url = str(image_field)
-                    elif request:
-                        url = request.build_absolute_uri(str(image_field))
-                    else:
-                        url = str(image_field)
+                url = image_url(image_field, request)
                 representation[image_field_name] = url
                 image_urls.append(url)
 
@@ -85,20 +111,7 @@ class PropertySerializer(serializers.ModelSerializer):
 
         # Handle legacy image field if it exists and no new images
         if not image_urls and instance.image:
-            if hasattr(instance.image, 'url'):
-                # Django ImageField
-                if request:
-                    legacy_image_url = request.build_absolute_uri(instance.image.url)
-                else:
-                    legacy_image_url = instance.image.url
-            else:
-                # Plain string path
-                if str(instance.image).startswith('http'):
-                    legacy_image_url = str(instance.image)
-                elif request:
-                    legacy_image_url = request.build_absolute_uri(str(instance.image))
-                else:
-                    legacy_image_url = str(instance.image)
+            legacy_image_url = image_url(instance.image, request)
             representation['image'] = legacy_image_url
             representation['images'] = [legacy_image_url]
 
@@ -117,11 +130,15 @@ class PropertySerializer(serializers.ModelSerializer):
             if not representation.get('image') and images_urls:
                 representation['image'] = images_urls[0]
 
+        for name in PROPERTY_IMAGE_FIELDS:
+            if name not in self.fields:
+                representation.pop(name, None)
+
         return representation
 
 class BookingSerializer(serializers.ModelSerializer):
     user = serializers.StringRelatedField(read_only=True)
-    property = serializers.PrimaryKeyRelatedField(queryset=Property.objects.all())
+    property = PrefetchablePrimaryKeyRelatedField(queryset=Property.objects.all())
 
     class Meta:
         model = Booking
@@ -146,6 +163,10 @@ class BookingSerializer(serializers.ModelSerializer):
             if start > end:
                 raise serializers.ValidationError("check_out_date must be after check_in_date")
 
+            # Bulk creation checks overlaps for the whole batch in one query
+            if self.context.get('bulk'):
+                return data
+
             # check overlapping bookings (inclusive)
             overlapping = Booking.objects.filter(property=property).filter(
                 Q(check_in_date__lte=end) & Q(check_out_date__gte=start)
@@ -169,27 +190,82 @@ class BookingSerializer(serializers.ModelSerializer):
 class MarketplaceItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = MarketplaceItem
-        fields = ['id', 'title', 'price', 'category', 'condition', 'description', 'location', 'image', 'created_by', 'created_at']
+        fields = ['id', 'title', 'price', 'category', 'condition', 'description', 'location', 'image', 'status', 'created_by', 'created_at']
+        read_only_fields = ['created_by', 'status']
 
 class MovingServiceSerializer(serializers.ModelSerializer):
     class Meta:
         model = MovingService
-        fields = ['id', 'name', 'location', 'price_range', 'services', 'image', 'rating', 'reviews', 'verified', 'created_by', 'created_at']
+        fields = ['id', 'name', 'location', 'town', 'price_range', 'min_price', 'max_price', 'services', 'image', 'rating', 'reviews', 'verified', 'created_by', 'created_at']
 
 class MoverQuoteSerializer(serializers.ModelSerializer):
     service = MovingServiceSerializer(read_only=True)
+    service_id = PrefetchablePrimaryKeyRelatedField(source='service', queryset=MovingService.objects.all(), write_only=True)
 
     class Meta:
         model = MoverQuote
-        fields = ['id', 'service', 'user', 'client_name', 'client_email', 'client_phone', 'pickup_location', 'delivery_location', 'moving_date', 'inventory', 'quote_amount', 'status', 'created_at']
+        fields = ['id', 'service', 'service_id', 'user', 'client_name', 'client_email', 'client_phone', 'pickup_location', 'delivery_location', 'moving_date', 'inventory', 'quote_amount', 'status', 'created_at']
+        read_only_fields = ['user']
+
+class QuoteMatchSerializer(serializers.Serializer):
+    """Input of ``POST /api/quotes/match/``; the client fields are only needed with ``create_quotes``"""
+    pickup_location = serializers.CharField(max_length=255)
+    delivery_location = serializers.CharField(max_length=255)
+    moving_date = serializers.DateField()
+    inventory = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+    budget = serializers.DecimalField(max_digits=12, decimal_places=2, required=False, min_value=Decimal('0'))
+    limit = serializers.IntegerField(required=False, default=5, min_value=1, max_value=20)
+    create_quotes = serializers.BooleanField(required=False, default=False)
+    client_name = serializers.CharField(max_length=255, required=False)
+    client_email = serializers.EmailField(required=False)
+    client_phone = serializers.CharField(max_length=20, required=False)
+
+    def validate_moving_date(self, value):
+        if value < timezone.localdate():
+            raise serializers.ValidationError('Moving date cannot be in the past.')
+        return value
+
+    def validate(self, attrs):
+        errors = {}
+        for field in ('pickup_location', 'delivery_location'):
+            town = resolve_town(attrs[field])
+            if town is None:
+                errors[field] = 'No known town in this location.'
+            attrs[field.replace('location', 'town')] = town
+        if attrs['create_quotes']:
+            for field in ('client_name', 'client_email', 'client_phone'):
+                if not attrs.get(field):
+                    errors[field] = 'This field is required to request quotes.'
+        if errors:
+            raise serializers.ValidationError(errors)
+        return attrs
+
+class ProviderQuoteUpdateSerializer(serializers.Serializer):
+    """One entry of a provider's bulk quote update"""
+    id = serializers.IntegerField()
+    status = serializers.ChoiceField(choices=['quoted', 'rejected', 'completed'], required=False)
+    quote_amount = serializers.DecimalField(max_digits=12, decimal_places=2, required=False, min_value=Decimal('0'))
+
+    def validate(self, attrs):
+        if 'status' not in attrs and 'quote_amount' not in attrs:
+            raise serializers.ValidationError('Give a status, a quote_amount or both.')
+        return attrs
 
 class PurchaseSerializer(serializers.ModelSerializer):
     item = MarketplaceItemSerializer(read_only=True)
+    item_id = PrefetchablePrimaryKeyRelatedField(source='item', queryset=MarketplaceItem.objects.all(), write_only=True)
     buyer = serializers.StringRelatedField(read_only=True)
 
     class Meta:
         model = Purchase
-        fields = ['id', 'item', 'buyer', 'buyer_name', 'buyer_email', 'buyer_phone', 'purchase_price', 'delivery_address', 'status', 'created_at']
+        fields = ['id', 'item', 'item_id', 'buyer', 'buyer_name', 'buyer_email', 'buyer_phone', 'purchase_price', 'delivery_address', 'status', 'created_at']
+        # Set by checkout from the item at the moment of sale
+        read_only_fields = ['purchase_price']
+
+    def validate(self, attrs):
+        if self.instance is not None and 'item' in attrs and attrs['item'].pk != self.instance.item_id:
+            raise serializers.ValidationError({'item_id': 'The item of a purchase cannot be changed.'})
+        return attrs
 
 class ReviewSerializer(serializers.ModelSerializer):
     user = serializers.StringRelatedField(read_only=True)
@@ -198,3 +274,128 @@ class ReviewSerializer(serializers.ModelSerializer):
     class Meta:
         model = Review
         fields = ['id', 'property', 'user', 'rating', 'comment', 'created_at']
+
+
+class CompactListSerializer:
+    """
+    Read-only renderer for list pages that builds rows from ``values()`` dicts
+    instead of model instances. Per-field converters are taken once from the
+    fields of ``serializer_class`` so the output matches it exactly; fields
+    whose DB value is already in its JSON form are passed through untouched.
+    """
+    serializer_class = None
+
+    # Fields filled in by a subclass's to_representation(); copied raw by the base
+    computed_fields = ()
+
+    # Field types whose to_representation() is a no-op for values coming from the DB
+    PASSTHROUGH_FIELDS = (
+        serializers.CharField, serializers.ChoiceField, serializers.IntegerField,
+        serializers.BooleanField, serializers.JSONField, serializers.PrimaryKeyRelatedField,
+    )
+
+    _compiled = None
+
+    def __init__(self, context=None, fields=None):
+        self.context = context or {}
+        # Optional sparse fieldset: names of the output fields to render
+        self.fields = fields
+        self.plan = [entry for entry in self.compile() if fields is None or entry[0] in fields]
+
+    @classmethod
+    def compile(cls):
+        """Return ``[(name, source, converter or None)]`` for ``serializer_class``"""
+        if cls.__dict__.get('_compiled') is None:
+            plan = []
+            for name, field in cls.serializer_class().fields.items():
+                if field.write_only:
+                    continue
+                passthrough = name in cls.computed_fields or isinstance(field, cls.PASSTHROUGH_FIELDS)
+                converter = None if passthrough else field.to_representation
+                plan.append((name, field.source, converter))
+            cls._compiled = plan
+        return cls._compiled
+
+    def value_fields(self):
+        """Model columns to fetch with ``values()`` for the selected fields"""
+        dependencies = getattr(self.serializer_class, 'field_dependencies', {})
+        columns = {}
+        for name, source, _ in self.plan:
+            columns.update(dict.fromkeys(dependencies.get(name, (source,))))
+        return list(columns)
+
+    def to_representation(self, values):
+        row = {}
+        for name, source, converter in self.plan:
+            value = values[source]
+            row[name] = value if converter is None or value is None else converter(value)
+        return row
+
+    def render(self, rows):
+        return [self.to_representation(values) for values in rows]
+
+
+class PropertyCompactSerializer(CompactListSerializer):
+    serializer_class = PropertySerializer
+
+    IMAGE_FIELDS = ('image1', 'image2', 'image3', 'image4', 'image5', 'image6')
+    computed_fields = PROPERTY_IMAGE_FIELDS
+
+    def __init__(self, context=None, fields=None):
+        super().__init__(context, fields)
+        self.with_images = fields is None or any(name in fields for name in PROPERTY_IMAGE_FIELDS)
+        request = self.context.get('request')
+        self._absolute = request.build_absolute_uri if request else str
+        self._storage_url = Property._meta.get_field('image1').storage.url
+
+    def _path_url(self, path):
+        path = str(path)
+        return path if path.startswith('http') else self._absolute(path)
+
+    def _image_url(self, name):
+        if name.startswith(('http://', 'https://')):
+            return name
+        return self._absolute(self._storage_url(name))
+
+    def to_representation(self, values):
+        # Same image rules as PropertySerializer.to_representation
+        row = super().to_representation(values)
+        if not self.with_images:
+            return row
+
+        image_urls = []
+        for field in self.IMAGE_FIELDS:
+            name = values[field]
+            row[field] = None
+            if name:
+                url = self._image_url(name)
+                row[field] = url
+                image_urls.append(url)
+
+        row['image'] = image_urls[0] if image_urls else None
+        row['images'] = image_urls
+
+        if not image_urls and values['image']:
+            legacy_image_url = self._image_url(values['image'])
+            row['image'] = legacy_image_url
+            row['images'] = [legacy_image_url]
+
+        if not image_urls and values['images']:
+            images_urls = [self._path_url(path) for path in values['images']]
+            row['images'] = images_urls
+            if not row.get('image') and images_urls:
+                row['image'] = images_urls[0]
+
+        if self.fields is not None:
+            for name in PROPERTY_IMAGE_FIELDS:
+                if name not in self.fields:
+                    row.pop(name, None)
+        return row
+
+
+class MarketplaceItemCompactSerializer(CompactListSerializer):
+    serializer_class = MarketplaceItemSerializer
+
+
+class MovingServiceCompactSerializer(CompactListSerializer):
+    serializer_class = MovingServiceSerializer
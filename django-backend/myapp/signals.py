@@ -0,0 +1,198 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from .amenities import sync as sync_amenities
+from .authentication import invalidate_user
+from .checkout import release_item
+from .events import publish_status_change
+from .matching import invalidate_match_index
+from .models import Booking, DeletionLog, MarketplaceItem, MoverQuote, MovingService, Property, Purchase, Review
+from .property_detail import invalidate_property_detail
+from .quote_counters import apply_changes as apply_quote_counter_changes
+from .rollups import SEGMENT_FIELDS, apply_changes, segment_of
+from .similarity import FEATURE_FIELDS, enqueue_refresh as enqueue_similar_refresh
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def drop_cached_auth_state(sender, instance, **kwargs):
+    """Password, active and staff changes must reach token authentication right away"""
+    invalidate_user(instance.pk)
+
+
+@receiver(post_delete, sender=Property)
+@receiver(post_delete, sender=MarketplaceItem)
+@receiver(post_delete, sender=MovingService)
+def record_deletion(sender, instance, **kwargs):
+    """Rows are hard-deleted; the changes feed reports them from these tombstones"""
+    DeletionLog.objects.create(model=sender._meta.label_lower, object_id=instance.pk)
+
+
+@receiver(post_init, sender=Booking)
+@receiver(post_init, sender=MoverQuote)
+@receiver(post_init, sender=Purchase)
+def remember_status(sender, instance, **kwargs):
+    # None when the status column was deferred
+    instance._loaded_status = instance.__dict__.get('status')
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_save, sender=MoverQuote)
+@receiver(post_save, sender=Purchase)
+def push_status_change(sender, instance, created, **kwargs):
+    """Stream status transitions to the users involved (see events.py)"""
+    previous, current = instance._loaded_status, instance.__dict__.get('status')
+    if not created and previous is not None and current is not None and current != previous:
+        publish_status_change(instance, previous)
+    instance._loaded_status = current
+
+
+@receiver(post_save, sender=Property)
+@receiver(post_delete, sender=Property)
+def drop_property_detail(sender, instance, **kwargs):
+    invalidate_property_detail(instance.pk)
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def drop_parent_property_detail(sender, instance, **kwargs):
+    invalidate_property_detail(instance.property_id)
+
+
+def _feature_values(instance):
+    # None for fields that weren't loaded
+    return tuple(instance.__dict__.get(field) for field in FEATURE_FIELDS)
+
+
+@receiver(post_init, sender=Property)
+def remember_features(sender, instance, **kwargs):
+    instance._loaded_features = _feature_values(instance)
+
+
+@receiver(post_save, sender=Property)
+def refresh_similar_on_save(sender, instance, created, **kwargs):
+    """Recompute similar listings when something they are scored on changes"""
+    features = _feature_values(instance)
+    if created or features != instance._loaded_features:
+        enqueue_similar_refresh([instance.pk])
+    instance._loaded_features = features
+
+
+@receiver(post_delete, sender=Property)
+def refresh_similar_on_delete(sender, instance, **kwargs):
+    enqueue_similar_refresh([instance.pk])
+
+
+def _price_entry(instance):
+    """(segment, price) the listing is counted under in the price rollups, or None if not all loaded"""
+    values = instance.__dict__
+    if any(field not in values for field in SEGMENT_FIELDS + ('created_at', 'price')) or values['created_at'] is None:
+        return None
+    return segment_of(values), values['price']
+
+
+@receiver(post_init, sender=Property)
+def remember_price_entry(sender, instance, **kwargs):
+    instance._loaded_price_entry = _price_entry(instance)
+
+
+@receiver(post_save, sender=Property)
+def update_price_rollups(sender, instance, created, **kwargs):
+    """Move the listing between price histogram bins (see rollups.py)"""
+    previous, current = instance._loaded_price_entry, _price_entry(instance)
+    if current is None or (previous is None and not created):
+        # Deferred fields: left to `manage.py rebuild_price_rollups`
+        return
+    if previous != current:
+        apply_changes(removed=[previous] if previous else [], added=[current])
+    instance._loaded_price_entry = current
+
+
+@receiver(post_delete, sender=Property)
+def remove_from_price_rollups(sender, instance, **kwargs):
+    entry = _price_entry(instance)
+    if entry is not None:
+        apply_changes(removed=[entry])
+
+
+def _amenities_snapshot(value):
+    # Serialised, so in-place mutation of the JSON is still seen as a change
+    return json.dumps(value, sort_keys=True, default=str)
+
+
+@receiver(post_init, sender=Property)
+def remember_amenities(sender, instance, **kwargs):
+    # Raw snapshot only: normalising happens in post_save, and only on change; None when deferred
+    values = instance.__dict__
+    instance._loaded_amenities = _amenities_snapshot(values['amenities']) if 'amenities' in values else None
+
+
+@receiver(post_save, sender=Property)
+def update_amenity_rows(sender, instance, created, **kwargs):
+    """Keep the indexed amenity rows behind ``?amenity=`` in step with the JSON (see amenities.py)"""
+    if 'amenities' not in instance.__dict__:
+        return
+    snapshot = _amenities_snapshot(instance.amenities)
+    if created or snapshot != instance._loaded_amenities:
+        sync_amenities({instance.pk: instance.amenities})
+    instance._loaded_amenities = snapshot
+
+
+@receiver(post_save, sender=Purchase)
+def release_cancelled_item(sender, instance, **kwargs):
+    """A cancelled purchase puts its item back on sale (see checkout.py)"""
+    if instance.__dict__.get('status') == 'cancelled':
+        release_item(instance.item_id)
+
+
+@receiver(post_delete, sender=Purchase)
+def release_deleted_purchase_item(sender, instance, **kwargs):
+    release_item(instance.item_id)
+
+
+def _quote_queue(instance):
+    """(service id, status) the quote is counted under, or None if either wasn't loaded"""
+    values = instance.__dict__
+    if 'service_id' not in values or 'status' not in values:
+        return None
+    return values['service_id'], values['status']
+
+
+@receiver(post_init, sender=MoverQuote)
+def remember_quote_queue(sender, instance, **kwargs):
+    instance._counted_queue = _quote_queue(instance)
+
+
+@receiver(post_save, sender=MoverQuote)
+def update_quote_counters(sender, instance, created, **kwargs):
+    """Keep the per-service, per-status quote counters current (see quote_counters.py)"""
+    previous, current = instance._counted_queue, _quote_queue(instance)
+    if current is None or (previous is None and not created):
+        # Deferred fields: left to `manage.py rebuild_quote_counters`
+        return
+    if created:
+        apply_quote_counter_changes(added=[current])
+    elif previous != current:
+        apply_quote_counter_changes(removed=[previous], added=[current])
+    instance._counted_queue = current
+
+
+@receiver(post_delete, sender=MoverQuote)
+def remove_from_quote_counters(sender, instance, **kwargs):
+    queue = _quote_queue(instance)
+    if queue is not None:
+        apply_quote_counter_changes(removed=[queue])
+
+
+@receiver(post_save, sender=MovingService)
+@receiver(post_delete, sender=MovingService)
+def drop_match_index(sender, instance, **kwargs):
+    """Town, verification, rating and price feed the quote matching index (see matching.py)"""
+    invalidate_match_index()
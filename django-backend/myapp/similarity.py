@@ -0,0 +1,198 @@
+"""
+Precomputed "similar properties" stored in ``SimilarProperty``.
+
+Every listing is encoded as one row of a feature matrix:
+
+- one-hot ``type``, ``rental_type``, ``price_type``, ``county`` and ``town``;
+- z-scored log price, bedrooms, bathrooms and area (missing values sit at
+  the mean, i.e. 0);
+- amenity keys from ``amenities`` (see amenities.py), scaled so the whole
+  block has unit norm.
+
+Each block is multiplied by its ``FEATURE_WEIGHTS`` entry. Similarity is
+``1 / (1 + squared distance)`` and the top ``SIMILAR_PROPERTIES_K`` neighbours
+of a batch of rows come from a single matrix product plus ``argpartition``.
+Batches are sized so a batch never holds more than ``MAX_BATCH_CELLS``
+distances.
+
+``refresh(ids)`` recomputes only the lists that can change when those
+listings change (their own, the lists that contained them, short lists, and
+the lists a changed listing now beats the weakest entry of). Only those
+neighbour rows are read: the lists containing a changed listing through the
+``neighbor`` index, and the weakest entries that could be beaten through
+the ``(rank, score)`` index. It runs as the ``refresh_similar_properties``
+job; ``enqueue_refresh()`` (from ``post_save``/``post_delete`` and the
+importer) merges the ids into the job already waiting, if any, so a burst of
+saves costs one matrix load. Normalisation statistics drift as listings
+change, so ``manage.py rebuild_similar_properties`` recomputes everything
+from scratch.
+"""
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from .amenities import amenity_keys
+from .jobs import enqueue_merged
+from .models import Property, SimilarProperty
+
+CATEGORICAL_FIELDS = ('type', 'rental_type', 'price_type', 'county', 'town')
+NUMERIC_FIELDS = ('price', 'bedrooms', 'bathrooms', 'area')
+
+# Fields whose change can move a listing in feature space
+FEATURE_FIELDS = CATEGORICAL_FIELDS + NUMERIC_FIELDS + ('amenities',)
+
+FEATURE_WEIGHTS = {
+    'type': 2.0, 'rental_type': 1.0, 'price_type': 2.0, 'county': 0.7, 'town': 1.0,
+    'price': 1.5, 'bedrooms': 1.0, 'bathrooms': 0.5, 'area': 0.5,
+    'amenities': 0.7,
+}
+
+MAX_BATCH_CELLS = 4_000_000
+
+
+def _normalize_key(value):
+    return str(value).strip().lower() if value not in (None, '') else None
+
+
+def encode(rows):
+    """Feature matrix (float32, one row per ``values()`` dict in ``rows``)"""
+    n = len(rows)
+    blocks = []
+
+    for field in CATEGORICAL_FIELDS:
+        keys = [_normalize_key(row[field]) for row in rows]
+        vocabulary = {key: i for i, key in enumerate(sorted({key for key in keys if key}))}
+        block = np.zeros((n, len(vocabulary)), dtype=np.float32)
+        for i, key in enumerate(keys):
+            if key:
+                block[i, vocabulary[key]] = FEATURE_WEIGHTS[field]
+        blocks.append(block)
+
+    for field in NUMERIC_FIELDS:
+        column = np.array([np.nan if row[field] is None else float(row[field]) for row in rows], dtype=np.float64)
+        if field == 'price':
+            column = np.log1p(column)
+        present = ~np.isnan(column)
+        if present.any():
+            mean, std = column[present].mean(), column[present].std()
+            column = np.where(present, (column - mean) / (std or 1.0), 0.0)
+        else:
+            column = np.zeros(n)
+        blocks.append((column * FEATURE_WEIGHTS[field]).astype(np.float32)[:, None])
+
+    amenities = [amenity_keys(row['amenities']) for row in rows]
+    vocabulary = {name: i for i, name in enumerate(sorted(set().union(*amenities)))}
+    block = np.zeros((n, len(vocabulary)), dtype=np.float32)
+    for i, names in enumerate(amenities):
+        for name in names:
+            block[i, vocabulary[name]] = 1.0
+    counts = block.sum(axis=1, keepdims=True)
+    blocks.append(block / np.sqrt(np.maximum(counts, 1.0)) * FEATURE_WEIGHTS['amenities'])
+
+    return np.hstack(blocks)
+
+
+def _batches(indices, n):
+    size = max(1, MAX_BATCH_CELLS // max(n, 1))
+    for start in range(0, len(indices), size):
+        yield indices[start:start + size]
+
+
+def _similarity(matrix, squared_norms, rows):
+    """``len(rows) x n`` similarities of ``rows`` to every listing"""
+    distances = squared_norms[rows, None] + squared_norms[None, :] - 2.0 * (matrix[rows] @ matrix.T)
+    return 1.0 / (1.0 + np.maximum(distances, 0.0))
+
+
+def top_neighbors(matrix, rows, k):
+    """``{row: [(neighbour row, score), ...]}`` best first, excluding the row itself"""
+    n = matrix.shape[0]
+    k = min(k, n - 1)
+    result = {}
+    if k <= 0:
+        return {row: [] for row in rows}
+    squared_norms = np.einsum('ij,ij->i', matrix, matrix)
+    for batch in _batches(np.asarray(rows, dtype=np.intp), n):
+        scores = _similarity(matrix, squared_norms, batch)
+        scores[np.arange(len(batch)), batch] = -np.inf
+        best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(scores, best, axis=1)
+        order = np.argsort(-best_scores, axis=1, kind='stable')
+        best, best_scores = np.take_along_axis(best, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+        for row, neighbours, neighbour_scores in zip(batch, best, best_scores):
+            result[int(row)] = list(zip(neighbours.tolist(), neighbour_scores.tolist()))
+    return result
+
+
+def _load():
+    rows = list(Property.objects.order_by('pk').values('pk', *FEATURE_FIELDS))
+    return [row['pk'] for row in rows], encode(rows)
+
+
+def _store(pks, neighbours, replace_all=False):
+    links = [
+        SimilarProperty(property_id=pks[row], neighbor_id=pks[other], rank=rank, score=score)
+        for row, ranked in neighbours.items()
+        for rank, (other, score) in enumerate(ranked, start=1)
+    ]
+    with transaction.atomic():
+        if replace_all:
+            SimilarProperty.objects.all().delete()
+        else:
+            property_ids = [pks[row] for row in neighbours]
+            for start in range(0, len(property_ids), 500):
+                SimilarProperty.objects.filter(property_id__in=property_ids[start:start + 500]).delete()
+        SimilarProperty.objects.bulk_create(links, batch_size=1000)
+
+
+def rebuild():
+    """Recompute every list; returns the number of listings"""
+    pks, matrix = _load()
+    _store(pks, top_neighbors(matrix, list(range(len(pks))), settings.SIMILAR_PROPERTIES_K), replace_all=True)
+    return len(pks)
+
+
+def enqueue_refresh(property_ids):
+    enqueue_merged('refresh_similar_properties', 'property_ids', property_ids,
+                   delay=settings.SIMILAR_REFRESH_DELAY_SECONDS)
+
+
+def refresh(property_ids):
+    """Recompute the lists affected by changes to (or deletion of) ``property_ids``; returns their ids"""
+    pks, matrix = _load()
+    position = {pk: i for i, pk in enumerate(pks)}
+    changed_ids = set(property_ids)
+    changed = [position[pk] for pk in changed_ids if pk in position]
+    wanted = min(settings.SIMILAR_PROPERTIES_K, len(pks) - 1)
+    if wanted <= 0:
+        return []
+
+    def rows(property_id_list):
+        return {position[pk] for pk in property_id_list if pk in position}
+
+    affected = set(changed)
+    # Lists that contain a changed listing
+    affected |= rows(SimilarProperty.objects.filter(neighbor_id__in=changed_ids).values_list('property_id', flat=True))
+    # Short lists: new listings, or neighbours removed by a delete
+    full = SimilarProperty.objects.filter(property=OuterRef('pk'), rank=wanted)
+    affected |= rows(Property.objects.exclude(Exists(full)).values_list('pk', flat=True))
+
+    if changed:
+        squared_norms = np.einsum('ij,ij->i', matrix, matrix)
+        best = np.full(len(pks), -np.inf)
+        for batch in _batches(np.asarray(changed, dtype=np.intp), len(pks)):
+            scores = _similarity(matrix, squared_norms, batch)
+            scores[np.arange(len(batch)), batch] = -np.inf
+            best = np.maximum(best, scores.max(axis=0))
+        # Full lists whose weakest entry a changed listing now beats; nothing
+        # scoring at least the best new score can be beaten
+        weakest = SimilarProperty.objects.filter(rank__gte=wanted, score__lt=float(best.max()))
+        for property_id, score in weakest.values_list('property_id', 'score'):
+            row = position.get(property_id)
+            if row is not None and best[row] > score:
+                affected.add(row)
+
+    if affected:
+        _store(pks, top_neighbors(matrix, sorted(affected), settings.SIMILAR_PROPERTIES_K))
+    return [pks[row] for row in sorted(affected)]
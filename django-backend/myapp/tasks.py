@@ -0,0 +1,93 @@
+"""Handlers for deferred work run by ``python manage.py runworker``"""
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Avg, Count, Value
+from django.db.models.functions import Replace
+from django.utils import timezone
+
+from .jobs import job
+from .models import MarketplaceItem, MovingService, Property, Review
+from .notifications import send_pending
+from .property_detail import invalidate_property_detail
+
+
+@job('send_outbox')
+def send_outbox():
+    """Drain the e-mail outbox"""
+    while any(send_pending()):
+        pass
+
+
+@job('recalculate_property_rating')
+def recalculate_property_rating(property_id):
+    """Refresh the denormalized rating/reviews counters of a property"""
+    stats = Review.objects.filter(property_id=property_id).aggregate(average=Avg('rating'), count=Count('id'))
+    rating = round(stats['average'], 1) if stats['average'] is not None else None
+    Property.objects.filter(pk=property_id).update(rating=rating, reviews=stats['count'], updated_at=timezone.now())
+    invalidate_property_detail(property_id)
+
+
+@job('optimize_image', max_attempts=3)
+def optimize_image(file_name):
+    """Downscale an uploaded image that exceeds IMAGE_MAX_DIMENSION, moving the rows that use it to the smaller copy"""
+    from PIL import Image
+
+    with default_storage.open(file_name, 'rb') as fh:
+        image = Image.open(fh)
+        image.load()
+
+    # Animated/paletted formats are left untouched
+    if image.format not in ('JPEG', 'PNG', 'WEBP'):
+        return
+    max_dimension = settings.IMAGE_MAX_DIMENSION
+    if max(image.size) <= max_dimension:
+        return
+
+    image_format = image.format
+    image.thumbnail((max_dimension, max_dimension))
+    buffer = BytesIO()
+    save_kwargs = {'optimize': True}
+    if image_format in ('JPEG', 'WEBP'):
+        save_kwargs['quality'] = 85
+    image.save(buffer, format=image_format, **save_kwargs)
+
+    # Stored under a new name and the original is kept: upload_image has already
+    # handed its URL to the client, which may still submit it or serve it from a CDN
+    stem, extension = os.path.splitext(file_name)
+    new_name = default_storage.save(f'{stem}-optimized{extension}', ContentFile(buffer.getvalue()))
+    repoint_image(file_name, new_name)
+
+
+PROPERTY_IMAGE_COLUMNS = ['image1', 'image2', 'image3', 'image4', 'image5', 'image6', 'image']
+
+
+def repoint_image(old_name, new_name):
+    """Point the property image columns and the marketplace/moving-service image URLs at ``new_name``"""
+    now = timezone.now()
+    old_url, new_url = default_storage.url(old_name), default_storage.url(new_name)
+    with transaction.atomic():
+        property_ids = set()
+        for column in PROPERTY_IMAGE_COLUMNS:
+            rows = Property.objects.filter(**{column: old_name})
+            property_ids.update(rows.values_list('pk', flat=True))
+            rows.update(**{column: new_name, 'updated_at': now})
+        # Stored as absolute or media-relative URLs
+        for model in (MarketplaceItem, MovingService):
+            model.objects.filter(image__endswith=old_url).update(
+                image=Replace('image', Value(old_url), Value(new_url)), updated_at=now)
+    for property_id in property_ids:
+        invalidate_property_detail(property_id)
+
+
+@job('refresh_similar_properties')
+def refresh_similar_properties(property_ids):
+    """Recompute the similar-listing lists affected by changes to ``property_ids``"""
+    from .similarity import refresh
+
+    for property_id in refresh(property_ids):
+        invalidate_property_detail(property_id)
@@ -1,11 +1,15 @@
+import json
+import os
 import pytest
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.core.files.uploadedfile import SimpleUploadedFile
 from rest_framework import status
-from rest_framework.test import APITestCase
+from rest_framework.test import APITestCase, APITransactionTestCase
 from .models import Property, Booking, Review
+from .serializers import PropertySerializer
 from datetime import date
+from django.utils import timezone
 
 User = get_user_model()
 
@@ -167,3 +171,1720 @@ class ReviewsAPITest(APITestCase):
         resp = self.client.post(self.review_url, payload, format='json')
         assert resp.status_code == status.HTTP_201_CREATED
         assert Review.objects.filter(property=self.listing).count() == 1
+
+class SamplingProfilerTest(APITestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username="staff", password="staffpass", is_staff=True)
+        self.url = reverse('admin_profile')
+
+    def test_sampler_aggregates_collapsed_stacks_per_endpoint(self):
+        import tempfile
+        import threading
+        from .profiling import StackSampler
+
+        sampler = StackSampler(interval=0.01, output_dir=tempfile.mkdtemp())
+        ready, done = threading.Event(), threading.Event()
+
+        def handler():
+            sampler._active[threading.get_ident()] = 'property-list'
+            ready.set()
+            done.wait(5)
+
+        worker = threading.Thread(target=handler)
+        worker.start()
+        ready.wait(5)
+        sampler.sample()
+        sampler.sample()
+        done.set()
+        worker.join()
+
+        stacks = sampler.snapshot()['property-list']
+        assert sum(stacks.values()) == 2
+        assert all(stack.split(';')[-1].startswith('wait (') for stack in stacks)
+        [path] = sampler.flush()
+        assert path.endswith('property-list.%d.collapsed' % os.getpid())
+
+    def test_capture_endpoint_requires_staff(self):
+        User.objects.create_user(username="plain", password="plainpass")
+        self.client.force_authenticate(User.objects.get(username="plain"))
+        assert self.client.get(self.url + "?seconds=5").status_code == status.HTTP_403_FORBIDDEN
+
+    def test_capture_endpoint_arms_window(self):
+        self.client.force_authenticate(self.staff)
+        assert self.client.get(self.url + "?seconds=0").status_code == status.HTTP_400_BAD_REQUEST
+        resp = self.client.get(self.url + "?seconds=5")
+        assert resp.status_code == status.HTTP_202_ACCEPTED
+        assert self.client.get(self.url).data["capturing"] is True
+        self.client.delete(self.url)
+        assert self.client.get(self.url).data["capturing"] is False
+
+class EmailOutboxTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="guest", password="guestpass")
+        self.property = Property(title="Outbox Home", location="Kilimani", price=1000, created_by=self.user)
+        Property.objects.bulk_create([self.property])
+        self.bookings = Booking.objects.bulk_create([
+            Booking(property=self.property, user=self.user, guest_name=f"Guest {i}", guest_email=f"g{i}@example.com",
+                    guest_phone="0700000000", booking_date=date.today())
+            for i in range(3)
+        ])
+
+    def test_bulk_approve_queues_notifications(self):
+        from django.contrib.admin.sites import site
+        from django.core import mail
+        from .admin import BookingAdmin
+        from .models import OutboxEmail
+
+        admin = BookingAdmin(Booking, site)
+        admin.message_user = lambda *args, **kwargs: None
+        admin.approve_bookings(None, Booking.objects.all())
+
+        assert set(Booking.objects.values_list('status', flat=True)) == {'confirmed'}
+        assert OutboxEmail.objects.filter(status='pending').count() == 3
+        assert len(mail.outbox) == 0
+
+        # Already-confirmed bookings are not notified twice
+        admin.approve_bookings(None, Booking.objects.all())
+        assert OutboxEmail.objects.count() == 3
+
+    def test_send_pending_delivers_batch_and_backs_off_failures(self):
+        from django.core import mail
+        from .models import OutboxEmail
+        from .notifications import enqueue_booking_notifications, send_pending
+
+        enqueue_booking_notifications(Booking.objects.select_related('property'), 'approved')
+        assert send_pending(batch_size=2) == (2, 0)
+        assert send_pending(batch_size=2) == (1, 0)
+        assert len(mail.outbox) == 3
+        assert send_pending() == (0, 0)
+
+        class BrokenConnection:
+            def open(self):
+                raise ConnectionRefusedError("smtp down")
+
+            def close(self):
+                pass
+
+        enqueue_booking_notifications(Booking.objects.select_related('property')[:1], 'rejected')
+        assert send_pending(connection=BrokenConnection()) == (0, 1)
+        failed = OutboxEmail.objects.get(status='pending')
+        assert failed.attempts == 1
+        assert failed.next_attempt_at > timezone.now()
+        assert "smtp down" in failed.last_error
+
+class JobQueueTest(APITestCase):
+    def setUp(self):
+        from . import jobs
+        self.jobs = jobs
+        self.calls = []
+
+        @jobs.job('test_record')
+        def record(value):
+            self.calls.append(value)
+
+        @jobs.job('test_explode', max_attempts=2)
+        def explode():
+            raise RuntimeError("boom")
+
+    def test_claim_and_run_respects_schedule(self):
+        from .models import Job
+
+        self.jobs.enqueue('test_record', {'value': 1})
+        self.jobs.enqueue('test_record', {'value': 2}, delay=3600)
+
+        claimed = self.jobs.claim('worker-1', 10)
+        assert [job.payload for job in claimed] == [{'value': 1}]
+        assert claimed[0].status == 'running' and claimed[0].attempts == 1
+        assert self.jobs.claim('worker-2', 10) == []
+
+        assert self.jobs.run(claimed[0]) is True
+        assert self.calls == [1]
+        assert Job.objects.get(pk=claimed[0].pk).status == 'succeeded'
+
+    def test_failures_back_off_then_go_dead(self):
+        from .models import Job
+
+        job = self.jobs.enqueue('test_explode')
+        assert job.max_attempts == 2
+        [claimed] = self.jobs.claim('worker-1', 1)
+        assert self.jobs.run(claimed) is False
+        job.refresh_from_db()
+        assert job.status == 'queued' and job.run_at > timezone.now()
+        assert "boom" in job.last_error
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        [claimed] = self.jobs.claim('worker-1', 1)
+        self.jobs.run(claimed)
+        assert Job.objects.get(pk=job.pk).status == 'dead'
+
+    def test_stale_running_jobs_are_requeued(self):
+        from datetime import timedelta
+        from .models import Job
+
+        job = self.jobs.enqueue('test_record', {'value': 3})
+        self.jobs.claim('crashed-worker', 1)
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+        assert self.jobs.requeue_stale() == 1
+        job.refresh_from_db()
+        assert job.status == 'queued' and job.attempts == 1 and job.locked_by is None
+
+    def test_stale_jobs_past_max_attempts_are_dead(self):
+        from datetime import timedelta
+        from .models import Job
+
+        job = self.jobs.enqueue('test_record', {'value': 4})
+        Job.objects.filter(pk=job.pk).update(max_attempts=2, attempts=1)
+        self.jobs.claim('crashed-worker', 1)
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+        assert self.jobs.requeue_stale() == 0
+        job.refresh_from_db()
+        assert job.status == 'dead' and job.attempts == 2 and job.last_error
+
+    def test_heartbeat_keeps_running_jobs_from_being_requeued(self):
+        from datetime import timedelta
+        from .models import Job
+
+        job = self.jobs.enqueue('test_record', {'value': 5})
+        self.jobs.claim('busy-worker', 1)
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+        assert self.jobs.heartbeat('other-worker', [job.pk]) == 0
+        assert self.jobs.heartbeat('busy-worker', [job.pk]) == 1
+        assert self.jobs.requeue_stale() == 0
+        assert Job.objects.get(pk=job.pk).status == 'running'
+
+    def test_review_changes_enqueue_rating_recalculation(self):
+        user = User.objects.create_user(username="rater", password="raterpass")
+        other = User.objects.create_user(username="rater2", password="raterpass")
+        listing = Property(title="Rated", location="Meru", price=500)
+        Property.objects.bulk_create([listing])
+        Review.objects.create(property=listing, user=other, rating=4)
+        mine = Review.objects.create(property=listing, user=user, rating=1)
+
+        self.client.force_authenticate(user)
+        resp = self.client.delete(reverse('review-detail', args=[mine.id]))
+        assert resp.status_code == status.HTTP_204_NO_CONTENT
+
+        [claimed] = self.jobs.claim('worker-1', 5)
+        assert claimed.name == 'recalculate_property_rating'
+        assert self.jobs.run(claimed) is True
+        listing.refresh_from_db()
+        assert listing.reviews == 1 and listing.rating == 4
+
+    def test_optimize_image_points_rows_at_copy_and_keeps_original(self):
+        import shutil
+        import tempfile
+        from io import BytesIO
+        from unittest import mock
+        from django.core.files.base import ContentFile
+        from django.core.files.storage import default_storage
+        from django.test import override_settings
+        from PIL import Image
+        from .models import MarketplaceItem
+        from .tasks import optimize_image
+
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        buffer = BytesIO()
+        Image.new("RGB", (400, 200), "red").save(buffer, format="JPEG")
+        with override_settings(MEDIA_ROOT=media_root, IMAGE_MAX_DIMENSION=100):
+            name = default_storage.save("uploads/big.jpg", ContentFile(buffer.getvalue()))
+            listing = Property(title="Resized", location="Meru", price=500, image1=name)
+            Property.objects.bulk_create([listing])
+            seller = User.objects.create_user(username="seller", password="sellerpass")
+            item = MarketplaceItem.objects.create(
+                title="Chair", description="Wooden", price=10, category="furniture", condition="used",
+                location="Meru", image=f"http://testserver{default_storage.url(name)}", created_by=seller)
+
+            with mock.patch.object(default_storage, "save", side_effect=OSError("disk full")):
+                with self.assertRaises(OSError):
+                    optimize_image(name)
+            assert default_storage.exists(name)
+            assert Property.objects.get(pk=listing.pk).image1.name == name
+
+            optimize_image(name)
+            new_name = Property.objects.get(pk=listing.pk).image1.name
+            # The original URL was already returned by upload_image
+            assert new_name != name and default_storage.exists(name)
+            with default_storage.open(new_name) as fh:
+                assert max(Image.open(fh).size) == 100
+            item.refresh_from_db()
+            assert item.image == f"http://testserver{default_storage.url(new_name)}"
+
+class BulkCreateAPITest(APITestCase):
+    def setUp(self):
+        from .models import MovingService
+        self.user = User.objects.create_user(username="agency", password="agencypass", is_staff=True)
+        self.client.force_authenticate(self.user)
+        self.listing = Property(title="Bulk Home", location="Chuka", price=800)
+        self.other_listing = Property(title="Bulk Flat", location="Chuka", price=900)
+        Property.objects.bulk_create([self.listing, self.other_listing])
+        self.service = MovingService.objects.create(name="Movers", location="Nairobi", price_range="KSh 5,000 - KSh 50,000",
+                                                    services=["packing"], image="https://example.com/m.jpg")
+        Booking.objects.create(property=self.listing, user=self.user, guest_name="Existing", guest_email="e@example.com",
+                               guest_phone="0700", booking_date=date(2030, 1, 1),
+                               check_in_date=date(2030, 1, 10), check_out_date=date(2030, 1, 15))
+
+    def _booking(self, listing, check_in, check_out, **extra):
+        return dict(property=listing.id, guest_name="Guest", guest_email="g@example.com", guest_phone="0700",
+                    booking_date="2030-01-01", check_in_date=check_in, check_out_date=check_out, **extra)
+
+    def test_bulk_bookings_validate_overlaps_in_one_query(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        payload = [
+            self._booking(self.listing, "2030-01-12", "2030-01-13"),        # overlaps existing booking
+            self._booking(self.listing, "2030-02-01", "2030-02-05"),
+            self._booking(self.listing, "2030-02-04", "2030-02-06"),        # overlaps the previous item
+            self._booking(self.other_listing, "2030-01-12", "2030-01-13"),
+            self._booking(self.other_listing, "2030-03-01", "2030-03-02") | {"property": 999999},  # unknown property
+        ]
+        resp = self.client.post(reverse('booking-bulk'), payload, format='json')
+        assert resp.status_code == status.HTTP_400_BAD_REQUEST
+        assert [error["index"] for error in resp.data["errors"]] == [0, 2, 4]
+        assert Booking.objects.count() == 1
+
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.post(reverse('booking-bulk') + "?partial=true", payload, format='json')
+        assert resp.status_code == status.HTTP_207_MULTI_STATUS
+        assert len(resp.data["created"]) == 2
+        assert Booking.objects.count() == 3
+        overlap_queries = [q for q in queries.captured_queries if 'check_in_date' in q['sql'] and q['sql'].startswith('SELECT')]
+        assert len(overlap_queries) == 1
+
+    def test_bulk_bookings_refresh_cached_property_detail(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        url = reverse("property-full", args=[self.listing.pk])
+        assert len(self.client.get(url).data["booked_ranges"]) == 1
+        resp = self.client.post(reverse('booking-bulk'), [self._booking(self.listing, "2030-04-01", "2030-04-03")], format='json')
+        assert resp.status_code == status.HTTP_201_CREATED
+        assert len(self.client.get(url).data["booked_ranges"]) == 2
+
+    def test_bulk_quotes_and_marketplace_items(self):
+        quotes = [dict(service_id=self.service.id, client_name=f"Client {i}", client_email="c@example.com", client_phone="0700",
+                       pickup_location="Kilimani", delivery_location="Westlands", moving_date="2030-05-01") for i in range(3)]
+        resp = self.client.post(reverse('quote-bulk'), quotes, format='json')
+        assert resp.status_code == status.HTTP_201_CREATED, resp.data
+        assert [quote["service"]["id"] for quote in resp.data["created"]] == [self.service.id] * 3
+        assert all(quote["user"] == self.user.id for quote in resp.data["created"])
+
+        forged = quotes[0] | {"status": "accepted", "quote_amount": "1.00"}
+        resp = self.client.post(reverse('quote-bulk'), [forged], format='json')
+        assert resp.status_code == status.HTTP_201_CREATED, resp.data
+        assert resp.data["created"][0]["status"] == "pending" and resp.data["created"][0]["quote_amount"] is None
+
+        items = [dict(title=f"Chair {i}", price="1500.00", category="furniture", condition="used",
+                      location="Meru", image="https://example.com/chair.jpg") for i in range(4)]
+        resp = self.client.post(reverse('marketplace-bulk'), items, format='json')
+        assert resp.status_code == status.HTTP_201_CREATED, resp.data
+        assert len(resp.data["created"]) == 4
+        assert all(item["created_by"] == self.user.id for item in resp.data["created"])
+
+    def test_bulk_rejects_non_list_payload(self):
+        resp = self.client.post(reverse('marketplace-bulk'), {"title": "x"}, format='json')
+        assert resp.status_code == status.HTTP_400_BAD_REQUEST
+
+class PropertyImportTest(APITestCase):
+    CSV = (
+        "external_id,title,location,price,type,bedrooms,featured,image1,image2,image3,amenities\n"
+        'AG-1,Garden Flat,Kilimani,25000,rental,2,yes,https://cdn.example.com/1.jpg,https://cdn.example.com/2.jpg,https://cdn.example.com/3.jpg,"{""schools"": [""Braeburn""]}"\n'
+        "AG-2,Too Few Images,Westlands,18000,rental,1,no,https://cdn.example.com/1.jpg,,,\n"
+        "AG-3,Office Suite,CBD,90000,office,,no,https://cdn.example.com/a.jpg,https://cdn.example.com/b.jpg,https://cdn.example.com/c.jpg,\n"
+    )
+
+    def test_csv_rows_are_validated_and_upserted_in_batches(self):
+        import io
+        from .importers import import_properties
+
+        batches = []
+        report = import_properties(io.StringIO(self.CSV), 'csv', batch_size=2, on_batch=lambda r: batches.append(r.rows))
+        assert batches == [2, 3]
+        assert (report.rows, report.upserted, report.failed) == (3, 2, 1)
+        assert report.errors[0]["external_id"] == "AG-2" and report.errors[0]["line"] == 3
+        flat = Property.objects.get(external_id="AG-1")
+        assert flat.featured is True and flat.bedrooms == 2
+        assert flat.amenities == {"schools": ["Braeburn"]}
+
+        updated = self.CSV.replace("Garden Flat,Kilimani,25000", "Garden Flat,Kilimani,27500")
+        import_properties(io.StringIO(updated), 'csv')
+        assert Property.objects.filter(external_id__in=["AG-1", "AG-3"]).count() == 2
+        assert Property.objects.get(external_id="AG-1").price == 27500
+
+    def test_reimport_only_updates_columns_present_in_the_input(self):
+        import io
+        from .importers import import_properties
+        from .models import PropertyAmenity
+
+        import_properties(io.StringIO(self.CSV), 'csv')
+        flat = Property.objects.get(external_id="AG-1")
+        amenity_rows = PropertyAmenity.objects.filter(property=flat).count()
+        assert amenity_rows
+
+        report = import_properties(io.StringIO("external_id,price\nAG-1,30000\n"), 'csv')
+        assert (report.upserted, report.failed) == (1, 0)
+        flat.refresh_from_db()
+        assert flat.price == 30000 and flat.title == "Garden Flat" and flat.bedrooms == 2
+        assert flat.featured is True and flat.amenities == {"schools": ["Braeburn"]}
+        assert flat.image3.name == "https://cdn.example.com/3.jpg"
+        assert PropertyAmenity.objects.filter(property=flat).count() == amenity_rows
+
+        # A new listing still has to carry everything it needs to validate
+        report = import_properties(io.StringIO("external_id,price\nAG-9,30000\n"), 'csv')
+        assert (report.upserted, report.failed) == (0, 1)
+
+    def test_ndjson_with_image_list_and_bad_lines(self):
+        import io
+        import json
+        from .importers import import_properties
+
+        lines = [
+            json.dumps({"external_id": "N-1", "title": "Studio", "location": "Meru", "price": "9000",
+                        "images": ["https://cdn.example.com/s1.jpg", "https://cdn.example.com/s2.jpg", "https://cdn.example.com/s3.jpg"]}),
+            "{not json",
+            json.dumps({"title": "No key", "location": "Meru", "price": "1"}),
+            json.dumps({"external_id": "N-2", "title": "Bad type", "location": "Meru", "price": "1", "type": "castle",
+                        "images": "https://cdn.example.com/1.jpg|https://cdn.example.com/2.jpg|https://cdn.example.com/3.jpg"}),
+        ]
+        report = import_properties(io.StringIO("\n".join(lines)), 'ndjson')
+        assert (report.upserted, report.failed) == (1, 3)
+        assert [error["line"] for error in report.errors] == [2, 3, 4]
+        studio = Property.objects.get(external_id="N-1")
+        assert studio.image3.name == "https://cdn.example.com/s3.jpg"
+
+    def test_remote_images_render_unchanged(self):
+        import io
+        from .importers import import_properties
+
+        import_properties(io.StringIO(self.CSV), 'csv')
+        flat = Property.objects.get(external_id="AG-1")
+        detail = self.client.get(f"/api/properties/{flat.pk}/").data
+        assert detail["image1"] == "https://cdn.example.com/1.jpg"
+        assert detail["images"][2] == "https://cdn.example.com/3.jpg"
+        listed = {row["id"]: row for row in self.client.get("/api/properties/").data["results"]}
+        assert listed[flat.pk]["image"] == "https://cdn.example.com/1.jpg"
+        assert listed[flat.pk]["image2"] == "https://cdn.example.com/2.jpg"
+
+    def test_reimport_refreshes_cached_detail(self):
+        import io
+        from django.core.cache import cache
+        from .importers import import_properties
+
+        cache.clear()
+        import_properties(io.StringIO(self.CSV), 'csv')
+        flat = Property.objects.get(external_id="AG-1")
+        assert self.client.get(f"/api/properties/{flat.pk}/full/").data["property"]["price"] == "25000.00"
+        import_properties(io.StringIO(self.CSV.replace("Kilimani,25000", "Kilimani,27500")), 'csv')
+        assert self.client.get(f"/api/properties/{flat.pk}/full/").data["property"]["price"] == "27500.00"
+
+    def test_admin_upload(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        admin_user = User.objects.create_superuser(username="importer", password="importpass", email="i@example.com")
+        self.client.force_login(admin_user)
+        assert self.client.get("/admin/myapp/property/import/").status_code == 200
+        upload = SimpleUploadedFile("listings.csv", self.CSV.encode(), content_type="text/csv")
+        resp = self.client.post("/admin/myapp/property/import/", {"file": upload})
+        assert resp.status_code == 302
+        assert Property.objects.filter(external_id__startswith="AG-").count() == 2
+
+class ExportAPITest(APITestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username="reporter", password="reportpass", is_staff=True)
+        self.client.force_authenticate(self.staff)
+        listing = Property(title="Export Home", location="Nkubu", price=1200)
+        Property.objects.bulk_create([listing])
+        self.bookings = Booking.objects.bulk_create([
+            Booking(property=listing, user=self.staff, guest_name=f"Guest {i}", guest_email="g@example.com",
+                    guest_phone="0700", booking_date=date(2030, 1, 1), status=booking_status)
+            for i, booking_status in enumerate(['pending', 'confirmed', 'confirmed'])
+        ])
+
+    def _content(self, resp):
+        assert resp.streaming
+        return b"".join(resp.streaming_content).decode()
+
+    def test_csv_export_with_status_and_date_filters(self):
+        import csv
+        import io
+
+        resp = self.client.get(reverse('admin_export', args=['bookings', 'csv']) + "?status=confirmed")
+        assert resp.status_code == status.HTTP_200_OK
+        assert resp['Content-Type'].startswith('text/csv')
+        rows = list(csv.DictReader(io.StringIO(self._content(resp))))
+        assert [row["guest_name"] for row in rows] == ["Guest 1", "Guest 2"]
+        assert rows[0]["property_title"] == "Export Home" and rows[0]["user"] == "reporter"
+
+        today = timezone.now().date()
+        resp = self.client.get(reverse('admin_export', args=['bookings', 'csv']) + f"?start={today}&end={today}")
+        assert len(self._content(resp).splitlines()) == 4
+        resp = self.client.get(reverse('admin_export', args=['bookings', 'csv']) + "?end=2000-01-01")
+        assert len(self._content(resp).splitlines()) == 1
+
+    def test_csv_export_neutralises_formulas(self):
+        import csv
+        import io
+
+        Booking.objects.filter(pk=self.bookings[0].pk).update(guest_name='=HYPERLINK("http://evil.example")',
+                                                               guest_phone="+254700", guest_email="@x")
+        resp = self.client.get(reverse('admin_export', args=['bookings', 'csv']))
+        row = next(csv.DictReader(io.StringIO(self._content(resp))))
+        assert row["guest_name"] == '\'=HYPERLINK("http://evil.example")'
+        assert (row["guest_phone"], row["guest_email"]) == ("'+254700", "'@x")
+        assert row["id"] == str(self.bookings[0].pk)
+
+    def test_ndjson_export_and_permissions(self):
+        import json
+
+        resp = self.client.get(reverse('admin_export', args=['properties', 'ndjson']))
+        [row] = [json.loads(line) for line in self._content(resp).splitlines()]
+        assert row["title"] == "Export Home" and row["price"] == "1200.00"
+
+        assert self.client.get(reverse('admin_export', args=['users', 'csv'])).status_code == status.HTTP_404_NOT_FOUND
+        self.client.force_authenticate(User.objects.create_user(username="nosy", password="nosypass"))
+        assert self.client.get(reverse('admin_export', args=['bookings', 'csv'])).status_code == status.HTTP_403_FORBIDDEN
+
+    def test_admin_export_action(self):
+        admin_user = User.objects.create_superuser(username="exporter", password="exportpass", email="e@example.com")
+        self.client.force_login(admin_user)
+        resp = self.client.post("/admin/myapp/booking/", {
+            "action": "export_csv",
+            "_selected_action": [booking.pk for booking in self.bookings[:2]],
+        })
+        assert resp.status_code == status.HTTP_200_OK
+        assert len(self._content(resp).splitlines()) == 3
+
+class ListQueryCountTest(APITestCase):
+    """List endpoints must run a fixed number of queries regardless of page size"""
+
+    def setUp(self):
+        from .models import MarketplaceItem, MovingService, MoverQuote, Purchase
+        self.user = User.objects.create_user(username="counter", password="counterpass")
+        self.client.force_authenticate(self.user)
+        self.factories = {
+            'booking-list': lambda i: Booking.objects.create(
+                property=self.listing, user=self.user, guest_name=f"G{i}", guest_email="g@example.com",
+                guest_phone="0700", booking_date=date(2030, 1, 1)),
+            'purchase-list': lambda i: Purchase.objects.create(
+                item=MarketplaceItem.objects.create(title=f"Item {i}", price=10, category="other", condition="new",
+                                                    location="Meru", image="https://example.com/i.jpg", created_by=self.user),
+                buyer=self.user, seller=self.user, buyer_name="B", buyer_email="b@example.com", buyer_phone="0700",
+                purchase_price=10),
+            'quote-list': lambda i: MoverQuote.objects.create(
+                service=MovingService.objects.create(name=f"Movers {i}", location="Nairobi", price_range="KSh 1",
+                                                     services=[], image="https://example.com/m.jpg"),
+                user=self.user, client_name="C", client_email="c@example.com", client_phone="0700",
+                pickup_location="A", delivery_location="B", moving_date=date(2030, 1, 1)),
+            'review-list': lambda i: Review.objects.create(
+                property=self.listing, user=User.objects.create_user(username=f"reviewer{i}", password="x"), rating=5),
+        }
+        self.listing = Property(title="Counted", location="Meru", price=100)
+        Property.objects.bulk_create([self.listing])
+
+    def _count_queries(self, url_name):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get(reverse(url_name))
+        assert resp.status_code == status.HTTP_200_OK
+        return len(queries), len(resp.data["results"])
+
+    def test_list_query_counts_do_not_grow_with_rows(self):
+        for url_name, factory in self.factories.items():
+            factory(0)
+            factory(1)
+            small, small_rows = self._count_queries(url_name)
+            for i in range(2, 8):
+                factory(i)
+            large, large_rows = self._count_queries(url_name)
+            assert (small_rows, large_rows) == (2, 8), url_name
+            # one COUNT(*) for pagination plus one SELECT with the joined relations
+            assert small == large == 2, (url_name, small, large)
+
+class CompactListSerializerTest(APITestCase):
+    """The values()-based list path must render exactly what the ModelSerializers do"""
+
+    def setUp(self):
+        from decimal import Decimal
+        from .models import MarketplaceItem
+
+        self.user = User.objects.create_user(username="golden", password="goldenpass")
+        Property.objects.bulk_create([
+            Property(title="Uploaded", location="Meru", county="Meru", price=Decimal("12500.50"), rating=Decimal("4.5"),
+                     bedrooms=2, ready_date=date(2030, 5, 1), amenities=["wifi", "parking"], featured=True,
+                     image1="properties/a.jpg", image2="properties/b b.jpg", image4="properties/d.jpg",
+                     created_by=self.user),
+            Property(title="Legacy image", location="Nairobi", price=100, image="properties/legacy.png"),
+            Property(title="Legacy list", location="Nyeri", price=0,
+                     images=["https://cdn.example.com/1.jpg", "/media/properties/2.jpg"]),
+            Property(title="No images", location="Embu", price=Decimal("1.10"), rental_type="studio"),
+        ])
+        MarketplaceItem.objects.create(title="Sofa", price=Decimal("4500.00"), category="furniture", condition="used",
+                                       location="Meru", image="https://example.com/sofa.jpg", created_by=self.user)
+        MarketplaceItem.objects.create(title="Desk", price=Decimal("99.99"), category="furniture", condition="new",
+                                       description="Oak", location="Meru", image="https://example.com/desk.jpg", created_by=self.user)
+
+    def _expected(self, serializer_class, queryset, request):
+        from rest_framework.request import Request
+
+        return serializer_class(queryset, many=True, context={'request': Request(request)}).data
+
+    def test_property_list_matches_model_serializer(self):
+        from rest_framework.test import APIRequestFactory
+
+        url = reverse("property-list")
+        resp = self.client.get(url)
+        assert resp.status_code == status.HTTP_200_OK
+        expected = self._expected(PropertySerializer, Property.objects.all(), APIRequestFactory().get(url))
+        assert resp.json()["results"] == json.loads(json.dumps(expected))
+
+    def test_marketplace_list_matches_model_serializer(self):
+        from rest_framework.test import APIRequestFactory
+        from .models import MarketplaceItem
+        from .serializers import MarketplaceItemSerializer
+
+        url = reverse("marketplace-list")
+        resp = self.client.get(url, {"ordering": "price"})
+        assert resp.status_code == status.HTTP_200_OK
+        expected = self._expected(MarketplaceItemSerializer, MarketplaceItem.objects.order_by("price"),
+                                  APIRequestFactory().get(url))
+        assert resp.json()["results"] == json.loads(json.dumps(expected))
+        assert resp.json()["results"][0]["price"] == "99.99"
+
+class FastJSONTest(APITestCase):
+    """The orjson-backed renderer/parser must be byte-compatible with DRF's stdlib ones"""
+
+    def test_renderer_output_matches_drf_json_renderer(self):
+        import uuid
+        from datetime import datetime, time, timedelta, timezone as dt_timezone
+        from decimal import Decimal
+        from django.utils.functional import lazy
+        from rest_framework.renderers import JSONRenderer
+        from rest_framework.utils.serializer_helpers import ReturnDict
+        from .renderers import FastJSONRenderer
+
+        payload = ReturnDict({
+            "id": 7, "price": Decimal("12500.50"), "ratio": 0.1, "ok": True, "missing": None,
+            "created_at": datetime(2030, 1, 2, 3, 4, 5, 678901, tzinfo=dt_timezone.utc),
+            "aware": timezone.now(), "naive": datetime(2030, 1, 2, 3, 4, 5), "day": date(2030, 1, 2),
+            "at": time(9, 30), "duration": timedelta(hours=1, seconds=1), "uuid": uuid.uuid4(),
+            "label": lazy(lambda: "Nyumba ya kulala", str)(), "unicode": "Kshs é \u2028 \u2029 \U0001f3e0",
+            "nested": [{"amenities": ["wifi", "parking"]}, (1, 2)], 10: "int key",
+        }, serializer=None)
+        assert FastJSONRenderer().render(payload) == JSONRenderer().render(payload)
+
+        # Indented (browsable API) output falls back to the stdlib encoder
+        context = {"indent": 4}
+        assert FastJSONRenderer().render(payload, renderer_context=context) == JSONRenderer().render(payload, renderer_context=context)
+
+    def test_api_responses_match_drf_json_renderer(self):
+        from rest_framework.renderers import JSONRenderer
+
+        Property.objects.bulk_create([Property(title="Byte for byte \u2028", location="Meru", price="10.00",
+                                               image1="properties/a.jpg", amenities=["wifi"])])
+        resp = self.client.get(reverse("property-list"))
+        assert resp.status_code == status.HTTP_200_OK
+        assert resp.content == JSONRenderer().render(resp.data)
+
+    def test_parser_matches_drf_json_parser(self):
+        from io import BytesIO
+        from rest_framework.exceptions import ParseError
+        from rest_framework.parsers import JSONParser
+        from .renderers import FastJSONParser
+
+        for body in [b'{"a": [1, 2.5, "\\u00e9", null, true], "big": 123456789012345678901234567890}', "é".encode().join([b'"', b'"'])]:
+            assert FastJSONParser().parse(BytesIO(body)) == JSONParser().parse(BytesIO(body))
+        for body in [b'{"a": NaN}', b'{"a": ', b'']:
+            with pytest.raises(ParseError) as fast_error:
+                FastJSONParser().parse(BytesIO(body))
+            with pytest.raises(ParseError) as stdlib_error:
+                JSONParser().parse(BytesIO(body))
+            assert str(fast_error.value) == str(stdlib_error.value)
+
+    def test_json_views_keep_their_values(self):
+        from django.core.serializers.json import DjangoJSONEncoder
+        from django.test import RequestFactory
+        from .views import properties_list
+
+        Property.objects.bulk_create([Property(title="Plain view", location="Meru", price="2500.00", rating="4.5")])
+        resp = properties_list(RequestFactory().get("/properties/"))
+        assert resp.status_code == 200
+        assert resp["Content-Type"] == "application/json"
+        data = json.loads(resp.content)
+        assert data["properties"][0]["price"] == 2500.0
+        assert data == json.loads(json.dumps(data, cls=DjangoJSONEncoder))
+
+class SparseFieldsetTest(APITestCase):
+    """?fields= / ?exclude= / ?view= trim both the payload and the columns loaded"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="sparse", password="sparsepass")
+        Property.objects.bulk_create([
+            Property(title="Sparse", location="Meru", price="900.00", amenities=["wifi"],
+                     image1="properties/a.jpg", image2="properties/b.jpg", image3="properties/c.jpg"),
+        ])
+        self.listing = Property.objects.get()
+
+    def _sql(self, url, params):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get(url, params)
+        assert resp.status_code == status.HTTP_200_OK, resp.content
+        return resp, " ".join(query["sql"] for query in queries)
+
+    def test_fields_and_exclude_on_list(self):
+        resp, sql = self._sql(reverse("property-list"), {"fields": "id,title,price"})
+        assert list(resp.data["results"][0]) == ["id", "title", "price"]
+        assert '"amenities"' not in sql and '"image1"' not in sql
+
+        resp, sql = self._sql(reverse("property-list"), {"exclude": "amenities"})
+        row = resp.data["results"][0]
+        assert "amenities" not in row and row["images"][0].endswith("/media/properties/a.jpg")
+        assert '"amenities"' not in sql
+
+    def test_card_view_on_list_and_detail(self):
+        resp, sql = self._sql(reverse("property-list"), {"view": "card"})
+        row = resp.data["results"][0]
+        assert set(row) == {"id", "title", "location", "price", "price_type", "type", "bedrooms", "bathrooms", "area",
+                            "image", "images", "rating", "reviews", "featured", "managed_by", "landlord_name", "agency_name"}
+        assert row["image"].endswith("/media/properties/a.jpg") and len(row["images"]) == 3
+        assert '"amenities"' not in sql and '"ready_date"' not in sql
+
+        resp, sql = self._sql(reverse("property-detail", args=[self.listing.id]), {"view": "card"})
+        assert set(resp.data) == set(row) and resp.data["images"] == row["images"]
+        assert '"amenities"' not in sql
+
+    def test_related_viewsets_and_errors(self):
+        Review.objects.create(property=self.listing, user=self.user, rating=4, comment="Quiet street")
+        resp, sql = self._sql(reverse("review-list"), {"fields": "id,rating,property"})
+        assert resp.data["results"] == [{"id": resp.data["results"][0]["id"], "rating": 4, "property": "Sparse"}]
+        assert '"comment"' not in sql
+
+        for params in ({"fields": "id,nope"}, {"exclude": "secret"}, {"view": "poster"}):
+            assert self.client.get(reverse("property-list"), params).status_code == status.HTTP_400_BAD_REQUEST
+
+class CompressionAndConditionalGetTest(APITestCase):
+    """Compressed responses and 304s for unchanged list pages"""
+
+    def setUp(self):
+        Property.objects.bulk_create([
+            Property(title=f"Listing {i}", location="Meru", price="1000.00", amenities=["wifi"] * 20) for i in range(5)
+        ])
+
+    def test_gzip_and_brotli(self):
+        import gzip
+        from .middleware import brotli
+
+        url = reverse("property-list")
+        plain = self.client.get(url)
+        assert "Content-Encoding" not in plain
+
+        resp = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip")
+        assert resp["Content-Encoding"] == "gzip"
+        assert "Accept-Encoding" in resp["Vary"]
+        assert gzip.decompress(resp.content) == plain.content
+
+        if brotli is not None:
+            resp = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip, deflate, br")
+            assert resp["Content-Encoding"] == "br"
+            assert brotli.decompress(resp.content) == plain.content
+
+        # Below the size threshold nothing is compressed
+        small = self.client.get(reverse("health_check"), HTTP_ACCEPT_ENCODING="gzip, br")
+        assert "Content-Encoding" not in small
+
+    def test_streaming_responses_are_compressed_per_chunk(self):
+        from django.http import StreamingHttpResponse
+        from django.test import RequestFactory, override_settings
+        from .middleware import CompressionMiddleware, brotli
+
+        chunks = [b"x" * 1000, b"y" * 1000]
+        for encoding in ("gzip", "br"):
+            if encoding == "br" and brotli is None:
+                continue
+            request = RequestFactory().get("/", HTTP_ACCEPT_ENCODING=encoding)
+            middleware = CompressionMiddleware(lambda r: StreamingHttpResponse(iter(chunks)))
+            with override_settings(COMPRESSION_MIN_SIZE=512):
+                resp = middleware(request)
+            assert resp["Content-Encoding"] == encoding
+            parts = list(resp.streaming_content)
+            assert len(parts) >= len(chunks)
+            body = b"".join(parts)
+            if encoding == "gzip":
+                import gzip
+                assert gzip.decompress(body) == b"".join(chunks)
+            else:
+                assert brotli.decompress(body) == b"".join(chunks)
+
+    def test_conditional_get_returns_304_without_serializing(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        url = reverse("property-list")
+        first = self.client.get(url, {"ordering": "price"})
+        assert first.status_code == status.HTTP_200_OK
+        etag, last_modified = first["ETag"], first["Last-Modified"]
+        assert "no-cache" in first["Cache-Control"]
+
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get(url, {"ordering": "price"}, HTTP_IF_NONE_MATCH=etag)
+        assert resp.status_code == status.HTTP_304_NOT_MODIFIED
+        assert resp["ETag"] == etag and not resp.content
+        # only the max(updated_at)/count aggregate ran
+        assert len(queries) == 1
+
+        resp = self.client.get(url, {"ordering": "price"}, HTTP_IF_MODIFIED_SINCE=last_modified)
+        assert resp.status_code == status.HTTP_304_NOT_MODIFIED
+
+        # Another page or filter is a different representation
+        assert self.client.get(url, {"ordering": "-price"}, HTTP_IF_NONE_MATCH=etag).status_code == status.HTTP_200_OK
+
+        # A deletion changes the ETag even though max(updated_at) may not move
+        Property.objects.filter(pk=Property.objects.order_by("pk").values("pk")[:1]).delete()
+        resp = self.client.get(url, {"ordering": "price"}, HTTP_IF_NONE_MATCH=etag)
+        assert resp.status_code == status.HTTP_200_OK and resp["ETag"] != etag
+
+    def test_deletion_moves_last_modified(self):
+        from datetime import timedelta
+
+        url = reverse("property-list")
+        Property.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+        last_modified = self.client.get(url)["Last-Modified"]
+        assert self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code == status.HTTP_304_NOT_MODIFIED
+
+        Property.objects.filter(pk=Property.objects.order_by("pk").values("pk")[:1]).delete()
+        resp = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        assert resp.status_code == status.HTTP_200_OK and resp["Last-Modified"] != last_modified
+
+class StaticAndMediaServingTest(APITestCase):
+    """WhiteNoise static caching and the range-capable media view"""
+
+    def setUp(self):
+        import tempfile
+
+        self.media_root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.media_root, "properties"))
+        self.payload = bytes(range(256)) * 8
+        with open(os.path.join(self.media_root, "properties", "house.jpg"), "wb") as fh:
+            fh.write(self.payload)
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.media_root)
+
+    def _get(self, path="properties/house.jpg", **headers):
+        from django.test import override_settings
+
+        with override_settings(MEDIA_ROOT=self.media_root):
+            return self.client.get(f"/media/{path}", **headers)
+
+    def test_full_file_conditional_and_ranges(self):
+        resp = self._get()
+        assert resp.status_code == 200
+        assert b"".join(resp.streaming_content) == self.payload
+        assert resp["Content-Type"] == "image/jpeg" and resp["Accept-Ranges"] == "bytes"
+        assert "max-age" in resp["Cache-Control"]
+
+        assert self._get(HTTP_IF_NONE_MATCH=resp["ETag"]).status_code == 304
+
+        resp = self._get(HTTP_RANGE="bytes=10-19")
+        assert resp.status_code == 206
+        assert resp["Content-Range"] == f"bytes 10-19/{len(self.payload)}"
+        assert b"".join(resp.streaming_content) == self.payload[10:20]
+
+        resp = self._get(HTTP_RANGE="bytes=-5")
+        assert resp.status_code == 206 and b"".join(resp.streaming_content) == self.payload[-5:]
+
+        resp = self._get(HTTP_RANGE=f"bytes={len(self.payload)}-")
+        assert resp.status_code == 416
+
+        # A stale If-Range gets the whole (changed) file
+        resp = self._get(HTTP_RANGE="bytes=0-1", HTTP_IF_RANGE='"stale"')
+        assert resp.status_code == 200
+
+    def test_range_responses_are_not_compressed(self):
+        with open(os.path.join(self.media_root, "properties", "brochure.pdf"), "wb") as fh:
+            fh.write(self.payload)
+
+        resp = self._get("properties/brochure.pdf", HTTP_ACCEPT_ENCODING="gzip, br")
+        assert resp.status_code == 200 and resp.has_header("Content-Encoding")
+
+        resp = self._get("properties/brochure.pdf", HTTP_RANGE="bytes=10-19", HTTP_ACCEPT_ENCODING="gzip, br")
+        assert resp.status_code == 206 and not resp.has_header("Content-Encoding")
+        assert resp["Content-Range"] == f"bytes 10-19/{len(self.payload)}"
+        assert b"".join(resp.streaming_content) == self.payload[10:20]
+
+    def test_missing_and_traversal_paths_404(self):
+        assert self._get("properties/missing.jpg").status_code == 404
+        assert self._get("../myproject/settings.py").status_code == 404
+
+    def test_accel_redirect(self):
+        from django.test import override_settings
+
+        with override_settings(MEDIA_ACCEL_REDIRECT_PREFIX="/protected-media/"):
+            resp = self._get()
+        assert resp.status_code == 200 and not resp.content
+        assert resp["X-Accel-Redirect"] == "/protected-media/properties/house.jpg"
+
+    def test_whitenoise_serves_hashed_static_files_immutable_and_precompressed(self):
+        import tempfile
+        from django.conf import settings
+        from django.test import Client, override_settings
+
+        static_root = tempfile.mkdtemp()
+        name = "app.0123456789ab.css"
+        for suffix, body in (("", b"body{}" * 100), (".gz", b"gz"), (".br", b"br")):
+            with open(os.path.join(static_root, name + suffix), "wb") as fh:
+                fh.write(body)
+        with open(os.path.join(static_root, "staticfiles.json"), "w") as fh:
+            json.dump({"paths": {"app.css": name}, "version": "1.1"}, fh)
+        storages = {**settings.STORAGES, "staticfiles": {"BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage"}}
+        with override_settings(STATIC_ROOT=static_root, STORAGES=storages):
+            resp = Client().get(f"/static/{name}", HTTP_ACCEPT_ENCODING="br")
+        assert resp.status_code == 200
+        assert "immutable" in resp["Cache-Control"]
+        assert resp["Content-Encoding"] == "br" and b"".join(resp.streaming_content) == b"br"
+
+class ClaimsJWTAuthenticationTest(APITestCase):
+    """Token auth builds the user from claims plus a cached auth state instead of a users query"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="claims", password="claimspass1", email="claims@example.com",
+                                             first_name="Clara")
+
+    def _login(self, password="claimspass1"):
+        resp = self.client.post(reverse("login"), {"username": "claims", "password": password}, format="json")
+        assert resp.status_code == status.HTTP_200_OK, resp.data
+        return resp.data["tokens"]["access"]
+
+    def _get(self, url_name, token):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get(reverse(url_name), HTTP_AUTHORIZATION=f"Bearer {token}")
+        return resp, [q["sql"] for q in queries if '"auth_user"' in q["sql"]]
+
+    def test_tokens_carry_claims_and_skip_user_queries(self):
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        token = self._login()
+        claims = AccessToken(token)
+        assert claims["username"] == "claims" and claims["is_staff"] is False and "hash_password" in claims
+
+        resp, user_queries = self._get("booking-list", token)
+        assert resp.status_code == status.HTTP_200_OK
+        resp, user_queries = self._get("booking-list", token)
+        assert resp.status_code == status.HTTP_200_OK and user_queries == []
+        assert resp.wsgi_request.user.username == "claims" and not resp.wsgi_request.user.is_superuser
+
+        # Views that need the profile load it once, then reuse the cache
+        resp, _ = self._get("me", token)
+        assert resp.data["email"] == "claims@example.com" and resp.data["first_name"] == "Clara"
+        resp, user_queries = self._get("me", token)
+        assert resp.data["email"] == "claims@example.com" and user_queries == []
+
+        resp = self.client.post(reverse("token_obtain_pair"), {"username": "claims", "password": "claimspass1"}, format="json")
+        assert AccessToken(resp.data["access"])["username"] == "claims"
+
+    def test_password_change_and_deactivation_revoke_tokens(self):
+        token = self._login()
+        assert self._get("user_dashboard", token)[0].status_code == status.HTTP_200_OK
+
+        self.user.set_password("claimspass2")
+        self.user.save()
+        assert self._get("user_dashboard", token)[0].status_code == status.HTTP_401_UNAUTHORIZED
+
+        token = self._login("claimspass2")
+        assert self._get("user_dashboard", token)[0].status_code == status.HTTP_200_OK
+        self.user.is_active = False
+        self.user.save()
+        assert self._get("user_dashboard", token)[0].status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_staff_flag_follows_the_database_not_the_token(self):
+        self.user.is_staff = True
+        self.user.save()
+        token = self._login()
+        assert self._get("admin_dashboard", token)[0].status_code == status.HTTP_200_OK
+
+        self.user.is_staff = False
+        self.user.save()
+        assert self._get("admin_dashboard", token)[0].status_code == status.HTTP_403_FORBIDDEN
+
+
+class LoginThrottleTest(APITestCase):
+    """Login attempts are rate limited and password checks run on a bounded pool"""
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.user = User.objects.create_user(username="guarded", password="guardedpass1")
+
+    def _login(self, password="guardedpass1", username="guarded"):
+        return self.client.post(reverse("login"), {"username": username, "password": password}, format="json")
+
+    def test_ip_limit(self):
+        from django.test import override_settings
+
+        with override_settings(LOGIN_IP_LIMIT=3):
+            for _ in range(3):
+                assert self._login(username="nobody").status_code == status.HTTP_401_UNAUTHORIZED
+            resp = self._login()
+        assert resp.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        assert int(resp["Retry-After"]) > 0
+
+    def test_username_failure_limit(self):
+        from django.test import override_settings
+
+        with override_settings(LOGIN_USERNAME_FAILURE_LIMIT=2):
+            assert self._login("wrong").status_code == status.HTTP_401_UNAUTHORIZED
+            assert self._login().status_code == status.HTTP_200_OK
+            # A successful login resets the failure count
+            for _ in range(2):
+                assert self._login("wrong").status_code == status.HTTP_401_UNAUTHORIZED
+            assert self._login().status_code == status.HTTP_429_TOO_MANY_REQUESTS
+            resp = self.client.post(reverse("token_obtain_pair"), {"username": "guarded", "password": "guardedpass1"},
+                                    format="json")
+        assert resp.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+
+    def test_overloaded_pool_returns_429(self):
+        from myapp.login import pool
+
+        held = 0
+        while pool._slots.acquire(blocking=False):
+            held += 1
+        try:
+            assert self._login().status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        finally:
+            for _ in range(held):
+                pool._slots.release()
+        assert self._login().status_code == status.HTTP_200_OK
+
+    def test_rehash_on_login_with_argon2(self):
+        from django.test import override_settings
+
+        assert self.user.password.startswith("pbkdf2_sha256$")
+        with override_settings(PASSWORD_HASHERS=[
+            "django.contrib.auth.hashers.Argon2PasswordHasher",
+            "django.contrib.auth.hashers.PBKDF2PasswordHasher",
+        ]):
+            assert self._login().status_code == status.HTTP_200_OK
+            self.user.refresh_from_db()
+            assert self.user.password.startswith("argon2$")
+            assert self._login().status_code == status.HTTP_200_OK
+
+
+class ReadThrottleTest(APITestCase):
+    """Reads spend tokens from per-client buckets; searches cost more and 304s are partly refunded"""
+
+    def setUp(self):
+        from django.conf import settings
+        from django.test import override_settings
+        from myapp.throttling import local_buckets
+
+        local_buckets.clear()
+        self.addCleanup(local_buckets.clear)
+        rates = {"anon": "10/min", "user": "20/min", "staff": None}
+        override = override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": rates})
+        override.enable()
+        self.addCleanup(override.disable)
+        self.url = reverse("property-list")
+
+    def test_anonymous_budget_and_retry_after(self):
+        for _ in range(5):
+            assert self.client.get(self.url).status_code == status.HTTP_200_OK
+        resp = self.client.get(self.url)
+        assert resp.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        assert int(resp["Retry-After"]) >= 1
+        # Writes are not counted against the read budget
+        assert self.client.post(self.url, {}, format="json").status_code != status.HTTP_429_TOO_MANY_REQUESTS
+
+    def test_search_and_deep_pages_cost_more(self):
+        assert self.client.get(self.url, {"search": "studio"}).status_code == status.HTTP_200_OK
+        assert self.client.get(self.url).status_code == status.HTTP_200_OK
+        assert self.client.get(self.url).status_code == status.HTTP_429_TOO_MANY_REQUESTS
+
+        from myapp.throttling import local_buckets
+
+        local_buckets.clear()
+        assert self.client.get(self.url, {"page": 11}).status_code == status.HTTP_404_NOT_FOUND
+        assert self.client.get(self.url, {"page": 11}).status_code == status.HTTP_429_TOO_MANY_REQUESTS
+
+    def test_not_modified_is_refunded(self):
+        etag = self.client.get(self.url)["ETag"]
+        # 8 tokens left: each 304 is charged 2 up front and refunded down to 1
+        for _ in range(7):
+            assert self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code == status.HTTP_304_NOT_MODIFIED
+        assert self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code == status.HTTP_429_TOO_MANY_REQUESTS
+
+    def test_separate_budgets_per_user_and_staff(self):
+        user = User.objects.create_user(username="reader", password="readerpass1")
+        staff = User.objects.create_user(username="staffer", password="staffpass1", is_staff=True)
+
+        for _ in range(5):
+            self.client.get(self.url)
+        assert self.client.get(self.url).status_code == status.HTTP_429_TOO_MANY_REQUESTS
+
+        self.client.force_authenticate(user)
+        for _ in range(10):
+            assert self.client.get(self.url).status_code == status.HTTP_200_OK
+        assert self.client.get(self.url).status_code == status.HTTP_429_TOO_MANY_REQUESTS
+
+        # No staff rate configured: unlimited
+        self.client.force_authenticate(staff)
+        for _ in range(20):
+            assert self.client.get(self.url).status_code == status.HTTP_200_OK
+
+
+class ChangesFeedTest(APITestCase):
+    """The changes feed returns rows changed after a cursor plus tombstones for deleted rows"""
+
+    def setUp(self):
+        self.properties = Property.objects.bulk_create([
+            Property(title=f"Feed {i}", location="Nairobi", price="1000.00", bedrooms=1, bathrooms=1,
+                     image1="a.jpg", image2="b.jpg", image3="c.jpg")
+            for i in range(3)
+        ])
+        self.url = reverse("property-changes")
+
+    def _sync(self, **params):
+        resp = self.client.get(self.url, params)
+        assert resp.status_code == status.HTTP_200_OK, resp.data
+        return resp.data
+
+    def test_full_sync_then_deltas(self):
+        from django.utils import timezone
+
+        first = self._sync(limit=2)
+        assert first["has_more"] is True and len(first["results"]) == 2 and first["deleted"] == []
+        second = self._sync(cursor=first["cursor"], limit=2)
+        assert second["has_more"] is False
+        seen = [row["id"] for row in first["results"] + second["results"]]
+        assert sorted(seen) == sorted(p.pk for p in self.properties)
+        assert self._sync(cursor=second["cursor"])["results"] == []
+
+        changed, removed = self.properties[0], self.properties[1]
+        Property.objects.filter(pk=changed.pk).update(title="Feed renamed", updated_at=timezone.now())
+        Property.objects.filter(pk=removed.pk).delete()
+        delta = self._sync(cursor=second["cursor"], fields="id,title")
+        assert delta["results"] == [{"id": changed.pk, "title": "Feed renamed"}]
+        assert delta["deleted"] == [removed.pk]
+
+        caught_up = self._sync(cursor=delta["cursor"])
+        assert caught_up["results"] == [] and caught_up["deleted"] == []
+
+    def test_updated_since_and_bad_input(self):
+        from datetime import timedelta
+        from django.utils import timezone
+
+        since = timezone.now() + timedelta(seconds=1)
+        assert self._sync(updated_since=since.isoformat())["results"] == []
+        past = (timezone.now() - timedelta(days=1)).isoformat()
+        assert len(self._sync(updated_since=past)["results"]) == 3
+
+        assert self.client.get(self.url, {"cursor": "nope"}).status_code == status.HTTP_400_BAD_REQUEST
+        assert self.client.get(self.url, {"updated_since": "yesterday"}).status_code == status.HTTP_400_BAD_REQUEST
+        resp = self.client.get(self.url, {"updated_since": "2000-01-01T00:00:00Z"})
+        assert resp.status_code == status.HTTP_410_GONE
+
+
+class ServerSentEventsTest(APITestCase):
+    """Status transitions are pushed to the owner's event stream on commit"""
+
+    def setUp(self):
+        from datetime import date
+
+        self.user = User.objects.create_user(username="streamer", password="streampass1")
+        prop = Property.objects.bulk_create([
+            Property(title="Stream flat", location="Nairobi", price="1000.00", bedrooms=1, bathrooms=1,
+                     image1="a.jpg", image2="b.jpg", image3="c.jpg"),
+        ])[0]
+        self.booking = Booking.objects.create(property=prop, user=self.user, guest_name="Sam",
+                                              guest_email="sam@example.com", guest_phone="0700000000",
+                                              booking_date=date.today())
+
+    def _confirm(self):
+        booking = Booking.objects.get(pk=self.booking.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.status = "confirmed"
+            booking.save()
+
+    async def _stream(self, query_string, headers=(), method="GET"):
+        import asyncio
+        from asgiref.sync import sync_to_async
+        from asgiref.testing import ApplicationCommunicator
+        from myproject.events_asgi import application
+
+        communicator = ApplicationCommunicator(application, {
+            "type": "http", "method": method, "path": "/api/events/", "headers": list(headers),
+            "query_string": query_string.encode(),
+        })
+        await communicator.send_input({"type": "http.request", "body": b""})
+        start = await communicator.receive_output(timeout=5)
+        if start["status"] != 200 or method != "GET":
+            return start, []
+        chunks = [(await communicator.receive_output(timeout=5))["body"]]
+        await sync_to_async(self._confirm)()
+        chunks.append((await communicator.receive_output(timeout=5))["body"])
+        await communicator.send_input({"type": "http.disconnect"})
+        await asyncio.wait_for(communicator.future, timeout=5)
+        return start, chunks
+
+    def test_stream_receives_status_change(self):
+        from asgiref.sync import async_to_sync
+
+        self.client.force_authenticate(self.user)
+        response = self.client.post("/api/auth/stream-token/")
+        assert response.status_code == 200
+        start, chunks = async_to_sync(self._stream)(f"stream_token={response.data['stream_token']}")
+        assert start["status"] == 200
+        assert b"event: ready" in chunks[0]
+        event, data = chunks[1].decode().strip().split("\n")
+        assert event == "event: booking.status"
+        payload = json.loads(data[len("data: "):])
+        assert payload["id"] == self.booking.pk
+        assert payload["status"] == "confirmed" and payload["previous_status"] == "pending"
+
+    def test_stream_requires_token(self):
+        from asgiref.sync import async_to_sync
+        from django.core import signing
+        from django.test import override_settings
+        from myapp.authentication import invalidate_user, issue_tokens
+        from myapp.events import STREAM_TOKEN_SALT, issue_stream_token
+
+        assert async_to_sync(self._stream)("stream_token=bogus")[0]["status"] == 401
+        # The API access token is not accepted in the URL
+        access = issue_tokens(self.user)["access"]
+        assert async_to_sync(self._stream)(f"token={access}")[0]["status"] == 401
+        assert async_to_sync(self._stream)(f"stream_token={access}")[0]["status"] == 401
+        expired = signing.TimestampSigner(salt=STREAM_TOKEN_SALT).sign(str(self.user.pk))
+        with override_settings(EVENTS_STREAM_TOKEN_SECONDS=-1):
+            assert async_to_sync(self._stream)(f"stream_token={expired}")[0]["status"] == 401
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        invalidate_user(self.user.pk)
+        assert async_to_sync(self._stream)(f"stream_token={issue_stream_token(self.user.pk)}")[0]["status"] == 401
+
+    def test_cors(self):
+        from asgiref.sync import async_to_sync
+        from django.test import override_settings
+
+        allowed = [(b"origin", b"http://localhost:3000")]
+        with override_settings(CORS_ALLOWED_ORIGINS=["http://localhost:3000"], CORS_ALLOW_ALL_ORIGINS=False):
+            preflight = dict(async_to_sync(self._stream)("", allowed, method="OPTIONS")[0]["headers"])
+            assert preflight[b"access-control-allow-origin"] == b"http://localhost:3000"
+            assert b"authorization" in preflight[b"access-control-allow-headers"]
+            denied = async_to_sync(self._stream)("stream_token=bogus", allowed)[0]
+            assert denied["status"] == 401
+            assert dict(denied["headers"])[b"access-control-allow-origin"] == b"http://localhost:3000"
+            other = async_to_sync(self._stream)("stream_token=bogus", [(b"origin", b"https://evil.example")])[0]
+            assert b"access-control-allow-origin" not in dict(other["headers"])
+
+    def test_admin_bulk_approve_publishes(self):
+        from unittest import mock
+        from django.contrib.admin.sites import site
+        from myapp import events
+
+        admin = site._registry[Booking]
+        published = []
+        with mock.patch.object(events.LocalBackend, "publish", lambda backend, message: published.append(message)):
+            with self.captureOnCommitCallbacks(execute=True):
+                admin._set_status_and_notify(Booking.objects.all(), "confirmed", "approved")
+        assert [(m["event"], m["users"], m["data"]["status"]) for m in published] == [
+            ("booking.status", [self.user.pk], "confirmed"),
+        ]
+
+
+class PropertyDetailEndpointTest(APITestCase):
+    """/properties/{id}/full/ is built with a fixed number of queries and cached until something changes"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        from datetime import date, timedelta
+
+        cache.clear()
+        common = dict(location="Nairobi", town="Kilimani", bedrooms=2, bathrooms=1, type="rental",
+                      image1="a.jpg", image2="b.jpg", image3="c.jpg")
+        self.prop, self.similar, self.pricey = Property.objects.bulk_create([
+            Property(title="Main flat", price="20000.00", **common),
+            Property(title="Similar flat", price="22000.00", **common),
+            Property(title="Pricey flat", price="90000.00", **common),
+        ])
+        self.reviewers = [User.objects.create_user(username=f"reviewer{i}", password="reviewpass1") for i in range(3)]
+        for user, rating in zip(self.reviewers[:2], (5, 4)):
+            Review.objects.create(property=self.prop, user=user, rating=rating, comment="Nice")
+        self.check_in = date.today() + timedelta(days=3)
+        Booking.objects.create(property=self.prop, user=self.reviewers[0], guest_name="Sam",
+                               guest_email="sam@example.com", guest_phone="0700000000", booking_date=date.today(),
+                               check_in_date=self.check_in, check_out_date=self.check_in + timedelta(days=2))
+        self.url = reverse("property-full", args=[self.prop.pk])
+
+        from myapp.similarity import rebuild
+
+        rebuild()
+
+    def _get(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get(self.url)
+        assert resp.status_code == status.HTTP_200_OK
+        return resp.data, len(queries)
+
+    def test_composite_response_and_caching(self):
+        data, query_count = self._get()
+        assert query_count == 5
+        assert data["property"]["id"] == self.prop.pk
+        assert [r["user"] for r in data["reviews"]] == ["reviewer1", "reviewer0"]
+        assert data["rating_breakdown"] == {"1": 0, "2": 0, "3": 0, "4": 1, "5": 1}
+        assert data["booked_ranges"][0]["check_in_date"] == self.check_in.isoformat()
+        assert [p["id"] for p in data["similar"]] == [self.similar.pk, self.pricey.pk]
+
+        # Cached: only the property lookup
+        assert self._get()[1] == 1
+
+        Review.objects.create(property=self.prop, user=self.reviewers[2], rating=3)
+        data, query_count = self._get()
+        assert query_count == 5
+        assert data["rating_breakdown"]["3"] == 1
+
+
+class SimilarPropertiesTest(APITestCase):
+    """Neighbours come from vectorized feature scoring and are refreshed incrementally"""
+
+    def setUp(self):
+        def listing(title, **values):
+            defaults = dict(location="Nairobi", county="Nairobi", town="Kilimani", type="rental",
+                            rental_type="two-bedroom", price="30000.00", bedrooms=2, bathrooms=1,
+                            amenities=["wifi", "parking"], image1="a.jpg", image2="b.jpg", image3="c.jpg")
+            return Property(title=title, **{**defaults, **values})
+
+        self.base, self.twin, self.cousin, self.office = Property.objects.bulk_create([
+            listing("Base"),
+            listing("Twin", price="31000.00"),
+            listing("Cousin", town="Westlands", price="45000.00", bedrooms=3, amenities=["wifi"]),
+            listing("Office", type="office", rental_type=None, price="250000.00", bedrooms=None, amenities=[]),
+        ])
+
+    def _neighbours(self, prop):
+        from myapp.models import SimilarProperty
+
+        return list(SimilarProperty.objects.filter(property=prop).values_list("neighbor_id", flat=True))
+
+    def test_rebuild_ranks_by_features(self):
+        from myapp.similarity import rebuild
+
+        assert rebuild() == 4
+        assert self._neighbours(self.base) == [self.twin.pk, self.cousin.pk, self.office.pk]
+        assert self._neighbours(self.office)[-1] != self.office.pk
+
+        resp = self.client.get(reverse("property-similar", args=[self.base.pk]), {"limit": 2})
+        assert resp.status_code == status.HTTP_200_OK
+        assert [row["title"] for row in resp.data] == ["Twin", "Cousin"]
+
+    def test_incremental_refresh(self):
+        from myapp.similarity import rebuild, refresh
+
+        rebuild()
+        Property.objects.filter(pk=self.office.pk).update(type="rental", rental_type="two-bedroom", price="30500.00",
+                                                          bedrooms=2, amenities=["wifi", "parking"])
+        affected = refresh([self.office.pk])
+        assert self.base.pk in affected
+        assert self._neighbours(self.base)[0] == self.office.pk
+
+        self.twin.delete()
+        refresh([self.twin.pk])
+        assert self.twin.pk not in self._neighbours(self.base)
+        assert len(self._neighbours(self.base)) == 2
+
+    def test_save_enqueues_refresh_only_for_feature_changes(self):
+        from myapp.models import Job
+
+        prop = Property.objects.get(pk=self.base.pk)
+        prop.featured = True
+        prop.save()
+        assert not Job.objects.filter(name="refresh_similar_properties").exists()
+        prop.bedrooms = 4
+        prop.save()
+        assert list(Job.objects.filter(name="refresh_similar_properties").values_list("payload", flat=True)) == [
+            {"property_ids": [self.base.pk]},
+        ]
+
+        # Later changes join the waiting job instead of queueing their own
+        twin = Property.objects.get(pk=self.twin.pk)
+        twin.price = "35000.00"
+        twin.save()
+        Property.objects.get(pk=self.cousin.pk).delete()
+        assert list(Job.objects.filter(name="refresh_similar_properties").values_list("payload", flat=True)) == [
+            {"property_ids": sorted([self.base.pk, self.twin.pk, self.cousin.pk])},
+        ]
+        Job.objects.filter(name="refresh_similar_properties").update(status="running")
+        prop.bedrooms = 5
+        prop.save()
+        assert Job.objects.filter(name="refresh_similar_properties", status="queued").count() == 1
+
+
+class PriceAnalyticsTest(APITestCase):
+    """Price quartiles come from per-segment histograms kept current on save and delete"""
+
+    def _listing(self, price, town="Kilimani", rental_type="studio"):
+        prop = Property(title=f"{town} {price}", location="Nairobi", county="Nairobi", town=town,
+                        rental_type=rental_type, price=price, image1="a.jpg", image2="b.jpg", image3="c.jpg")
+        prop.save()
+        return prop
+
+    def _bins(self):
+        from myapp.models import PriceHistogramBin
+
+        return sorted(PriceHistogramBin.objects.filter(count__gt=0).values_list(
+            "price_type", "county", "town", "rental_type", "period", "bin", "count"))
+
+    def test_incremental_updates_match_rebuild(self):
+        from myapp.rollups import rebuild
+
+        listings = [self._listing(price) for price in ("10000.00", "20000.00", "30000.00", "40000.00")]
+        self._listing("80000.00", town="Westlands")
+        listings[0].price = "15000.00"
+        listings[0].save()
+        listings[1].town = "Westlands"
+        listings[1].save()
+        listings[3].delete()
+
+        incremental = self._bins()
+        assert rebuild() == 4
+        assert self._bins() == incremental
+
+    def test_endpoint_quartiles(self):
+        from django.utils import timezone
+
+        for price in range(10000, 60000, 5000):
+            self._listing(f"{price}.00")
+        self._listing("90000.00", town="Westlands", rental_type="one-bedroom")
+
+        resp = self.client.get(reverse("price_analytics"))
+        assert resp.status_code == status.HTTP_200_OK
+        kilimani, westlands = resp.data["results"]
+        assert (kilimani["town"], kilimani["count"]) == ("Kilimani", 10)
+        assert abs(kilimani["median"] - 32500) / 32500 < 0.06
+        assert kilimani["p25"] < kilimani["median"] < kilimani["p75"]
+        assert (westlands["rental_type"], westlands["count"]) == ("one-bedroom", 1)
+
+        month = timezone.now().strftime("%Y-%m")
+        resp = self.client.get(reverse("price_analytics"), {"group_by": "period", "town": "Westlands", "since": month})
+        assert [(row["period"], row["count"]) for row in resp.data["results"]] == [(month, 1)]
+        assert self.client.get(reverse("price_analytics"), {"group_by": "price"}).status_code == 400
+        assert self.client.get(reverse("price_analytics"), {"since": "2026-13"}).status_code == 400
+
+
+class AmenityFilterTest(APITestCase):
+    """?amenity= is answered from the PropertyAmenity side table, kept in sync on save"""
+
+    def _listing(self, title, amenities):
+        prop = Property(title=title, location="Nairobi", price="10000.00", amenities=amenities,
+                        image1="a.jpg", image2="b.jpg", image3="c.jpg")
+        prop.save()
+        return prop
+
+    def _titles(self, amenity):
+        resp = self.client.get(reverse("property-list"), {"amenity": amenity})
+        assert resp.status_code == status.HTTP_200_OK
+        return sorted(item["title"] for item in resp.data["results"])
+
+    def test_filter_and_sync(self):
+        from myapp.amenities import amenity_rows, rebuild
+        from myapp.models import PropertyAmenity
+
+        assert amenity_rows({"Schools": ["Nairobi  Academy"], "roads": [], "Parking": True}) == {
+            ("schools", "nairobi academy"), ("parking", "")}
+        near_school = self._listing("school", {"schools": ["Nairobi Academy"], "hospitals": []})
+        self._listing("parking", ["WiFi", "Parking"])
+        self._listing("both", {"schools": ["Kilimani Primary"], "parking": True})
+        self._listing("none", None)
+
+        assert self._titles("schools") == ["both", "school"]
+        assert self._titles("Parking, schools") == ["both"]
+        assert self._titles("hospitals") == []
+        assert len(self._titles("")) == 4
+
+        near_school.amenities["parking"] = True
+        near_school.save()
+        assert self._titles("parking,schools") == ["both", "school"]
+
+        synced = sorted(PropertyAmenity.objects.values_list("property_id", "key", "name"))
+        assert rebuild() == 4
+        assert sorted(PropertyAmenity.objects.values_list("property_id", "key", "name")) == synced
+
+    def test_loading_and_unchanged_saves_skip_normalising(self):
+        from unittest import mock
+        from myapp import amenities
+
+        prop = self._listing("school", {"schools": ["Nairobi Academy"]})
+        with mock.patch.object(amenities, "amenity_rows", wraps=amenities.amenity_rows) as rows:
+            loaded = list(Property.objects.all())
+            loaded[0].title = "renamed"
+            loaded[0].save()
+            assert rows.call_count == 0
+            loaded[0].amenities["schools"].append("Kilimani Primary")
+            loaded[0].save()
+            assert rows.call_count == 1
+        assert self._titles("schools") == ["renamed"] and prop.pk == loaded[0].pk
+
+
+class MarketplaceCheckoutTest(APITestCase):
+    """Checkout sells an item once, derives seller and price from it, and hides sold items from lists"""
+
+    def setUp(self):
+        from myapp.models import MarketplaceItem
+
+        self.seller = User.objects.create_user(username="seller", password="pass")
+        self.buyer = User.objects.create_user(username="buyer", password="pass")
+        self.item = MarketplaceItem.objects.create(title="Sofa", price="15000.00", category="furniture",
+                                                   condition="used", location="Nairobi",
+                                                   image="https://example.com/sofa.jpg", created_by=self.seller)
+
+    def _buy(self, client, **extra):
+        return client.post(reverse("purchase-list"), {
+            "item_id": self.item.pk, "buyer_name": "Buyer", "buyer_email": "buyer@example.com",
+            "buyer_phone": "0700000000", "purchase_price": "1.00", **extra,
+        }, format="json")
+
+    def test_checkout_and_release(self):
+        from myapp.models import Purchase
+
+        self.client.force_authenticate(self.seller)
+        assert self._buy(self.client).status_code == status.HTTP_400_BAD_REQUEST
+
+        self.client.force_authenticate(self.buyer)
+        resp = self._buy(self.client)
+        assert resp.status_code == status.HTTP_201_CREATED
+        purchase = Purchase.objects.get(pk=resp.data["id"])
+        assert (purchase.seller, str(purchase.purchase_price)) == (self.seller, "15000.00")
+        self.item.refresh_from_db()
+        assert self.item.status == "sold"
+
+        assert self._buy(self.client).status_code == status.HTTP_409_CONFLICT
+        assert self.client.get(reverse("marketplace-list")).data["count"] == 0
+        assert self.client.get(reverse("marketplace-list"), {"status": "sold"}).data["count"] == 1
+        assert self.client.get(reverse("marketplace-detail", args=[self.item.pk])).status_code == 200
+
+        purchase.status = "cancelled"
+        purchase.save()
+        self.item.refresh_from_db()
+        assert self.item.status == "available"
+        assert self.client.get(reverse("marketplace-list")).data["count"] == 1
+
+
+class ConcurrentCheckoutTest(APITransactionTestCase):
+    """Many buyers racing for one item: exactly one purchase, everyone else gets 409"""
+
+    def test_parallel_buyers(self):
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+
+        from django.db import connection
+        from rest_framework.test import APIClient
+
+        from myapp.models import MarketplaceItem, Purchase
+
+        seller = User.objects.create_user(username="seller", password="pass")
+        buyers = [User.objects.create_user(username=f"buyer{i}", password="pass") for i in range(12)]
+        item = MarketplaceItem.objects.create(title="Bike", price="8000.00", category="vehicles", condition="used",
+                                              location="Nairobi", image="https://example.com/bike.jpg",
+                                              created_by=seller)
+        start = threading.Barrier(len(buyers))
+
+        def buy(user):
+            client = APIClient()
+            client.force_authenticate(user)
+            start.wait()
+            try:
+                return client.post(reverse("purchase-list"), {
+                    "item_id": item.pk, "buyer_name": user.username, "buyer_email": "buyer@example.com",
+                    "buyer_phone": "0700000000",
+                }, format="json").status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=len(buyers)) as executor:
+            codes = sorted(executor.map(buy, buyers))
+
+        assert codes == [201] + [409] * (len(buyers) - 1)
+        assert Purchase.objects.filter(item=item).count() == 1
+        item.refresh_from_db()
+        assert item.status == "sold"
+
+
+class MovingServicePriceTest(APITestCase):
+    """price_range is parsed into indexed min/max columns that the movers list filters and sorts on"""
+
+    def _service(self, name, price_range):
+        from myapp.models import MovingService
+
+        return MovingService.objects.create(name=name, location="Nairobi", price_range=price_range, services=[],
+                                            image="https://example.com/movers.jpg")
+
+    def _names(self, **params):
+        resp = self.client.get(reverse("moving-service-list"), params)
+        assert resp.status_code == status.HTTP_200_OK
+        return [service["name"] for service in resp.data["results"]]
+
+    def test_filters_ordering_and_backfill(self):
+        from io import StringIO
+
+        from django.core.management import call_command
+
+        from myapp.models import MovingService
+
+        cheap = self._service("cheap", "KSh 5,000 - KSh 50,000")
+        self._service("mid", "KSh 15k - 120k")
+        self._service("premium", "From KSh 40,000")
+        self._service("unknown", "Call for a quote")
+        assert (cheap.min_price, cheap.max_price) == (5000, 50000)
+
+        assert self._names(ordering="min_price", min_price=1) == ["cheap", "mid", "premium"]
+        assert sorted(self._names(budget=20000)) == ["cheap", "mid"]
+        assert self._names(max_price=60000) == ["cheap"]
+
+        cheap.price_range = "KSh 25,000 - KSh 60,000"
+        cheap.save(update_fields=["price_range"])
+        assert sorted(self._names(budget=20000)) == ["mid"]
+
+        MovingService.objects.update(min_price=None, max_price=None)
+        call_command("backfill_moving_service_prices", stdout=StringIO())
+        assert sorted(self._names(budget=30000)) == ["cheap", "mid"]
+
+
+class QuoteMatchTest(APITestCase):
+    """POST /api/quotes/match/ ranks nearby verified movers and can fan quotes out to them"""
+
+    def _service(self, name, location, price_range="KSh 10,000 - KSh 80,000", rating="4.5", reviews=20, verified=True):
+        from myapp.models import MovingService
+
+        return MovingService.objects.create(name=name, location=location, price_range=price_range, services=[],
+                                            image="https://example.com/movers.jpg", rating=rating, reviews=reviews,
+                                            verified=verified)
+
+    def _match(self, **extra):
+        return self.client.post(reverse("quote-match"), {
+            "pickup_location": "Kilimani, Nairobi", "delivery_location": "Westlands", "moving_date": "2030-05-01",
+            **extra,
+        }, format="json")
+
+    def test_ranking_and_fan_out(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        from myapp.models import MoverQuote, QuoteCounter
+        from myapp.quote_counters import rebuild
+
+        user = User.objects.create_user(username="mover-client", password="pass")
+        self.client.force_authenticate(user)
+        near = self._service("near", "Kilimani")
+        busy = self._service("busy", "Lavington, Nairobi")
+        cheap_far = self._service("cheap-far", "Thika", price_range="KSh 5,000 - KSh 20,000")
+        self._service("unverified", "Kilimani", verified=False)
+        self._service("mombasa", "Mombasa")
+        for _ in range(10):
+            MoverQuote.objects.create(service=busy, user=user, client_name="C", client_email="c@example.com",
+                                      client_phone="07", pickup_location="Kilimani", delivery_location="Karen",
+                                      moving_date="2030-01-01")
+
+        # The first match builds the per-town index
+        assert self._match().status_code == status.HTTP_200_OK
+        with CaptureQueriesContext(connection) as queries:
+            resp = self._match()
+        assert resp.status_code == status.HTTP_200_OK
+        assert (resp.data["pickup_town"], resp.data["delivery_town"]) == ("Kilimani", "Westlands")
+        assert [match["service"]["name"] for match in resp.data["results"]] == ["near", "busy", "cheap-far"]
+        assert resp.data["results"][1]["pending_quotes"] == 10
+        # Pending counters, then the winners' cards
+        assert len([q for q in queries.captured_queries if "myapp_" in q["sql"]]) == 2
+
+        resp = self._match(budget="8000")
+        assert [match["service"]["name"] for match in resp.data["results"]] == ["cheap-far"]
+        assert self._match(pickup_location="Atlantis").status_code == status.HTTP_400_BAD_REQUEST
+        assert self._match(create_quotes=True).status_code == status.HTTP_400_BAD_REQUEST
+
+        resp = self._match(limit=2, create_quotes=True, client_name="Jane", client_email="jane@example.com",
+                           client_phone="0700000000")
+        assert resp.status_code == status.HTTP_201_CREATED
+        assert sorted(quote["service_id"] for quote in resp.data["quotes"]) == sorted([near.pk, busy.pk])
+        assert QuoteCounter.objects.get(service=busy, status="pending").count == 11
+
+        MoverQuote.objects.filter(service=near).first().delete()
+        quote = MoverQuote.objects.filter(service=busy).first()
+        quote.status = "quoted"
+        quote.save()
+        counters = sorted(QuoteCounter.objects.filter(count__gt=0).values_list("service_id", "status", "count"))
+        rebuild()
+        assert sorted(QuoteCounter.objects.filter(count__gt=0).values_list("service_id", "status", "count")) == counters
+        assert cheap_far.town == "Thika"
+
+
+class ProviderQuoteInboxTest(APITestCase):
+    """Moving companies page through their quotes, update them in bulk and read queue sizes from counters"""
+
+    def setUp(self):
+        from myapp.models import MoverQuote, MovingService
+
+        self.owner = User.objects.create_user(username="mover-owner", password="pass")
+        self.client_user = User.objects.create_user(username="mover-client", password="pass")
+        self.service = MovingService.objects.create(name="Owned Movers", location="Kilimani", price_range="KSh 1",
+                                                    services=[], image="https://example.com/m.jpg",
+                                                    created_by=self.owner)
+        other = MovingService.objects.create(name="Other Movers", location="Karen", price_range="KSh 1",
+                                             services=[], image="https://example.com/m.jpg")
+        self.quotes = [
+            MoverQuote.objects.create(service=service, user=self.client_user, client_name=f"C{i}",
+                                      client_email="c@example.com", client_phone="07", pickup_location="Kilimani",
+                                      delivery_location="Karen", moving_date="2030-01-01")
+            for i, service in enumerate([self.service] * 5 + [other])
+        ]
+        self.client.force_authenticate(self.owner)
+
+    def test_cursor_pages_only_own_quotes(self):
+        url = reverse("provider-quote-list")
+        resp = self.client.get(url, {"status": "pending", "page_size": 2})
+        assert resp.status_code == status.HTTP_200_OK
+        seen = [quote["id"] for quote in resp.data["results"]]
+        while resp.data["next"]:
+            resp = self.client.get(resp.data["next"])
+            seen += [quote["id"] for quote in resp.data["results"]]
+        assert seen == [quote.pk for quote in reversed(self.quotes[:5])]
+
+        self.client.force_authenticate(self.client_user)
+        assert self.client.get(url).data["results"] == []
+
+    def test_bulk_update_and_counts(self):
+        from myapp.models import MoverQuote, QuoteCounter
+        from myapp.quote_counters import rebuild
+
+        url = reverse("provider-quote-bulk-update")
+        first, second, third = (quote.pk for quote in self.quotes[:3])
+        resp = self.client.post(url, [{"id": first, "quote_amount": "12000"}, {"id": second, "status": "quoted"}],
+                                format="json")
+        assert resp.status_code == status.HTTP_400_BAD_REQUEST
+        assert resp.data["errors"] == [{"index": 1, "errors": {"quote_amount": "Required to quote."}}]
+        assert self.client.post(url, [{"id": self.quotes[5].pk, "status": "rejected"}], format="json").status_code == 400
+
+        resp = self.client.post(url, [
+            {"id": first, "quote_amount": "12000"},
+            {"id": second, "status": "quoted", "quote_amount": "15000"},
+            {"id": third, "status": "rejected"},
+        ], format="json")
+        assert resp.status_code == status.HTTP_200_OK
+        assert sorted(MoverQuote.objects.filter(pk__in=[first, second, third]).values_list("status", flat=True)) == [
+            "quoted", "quoted", "rejected"]
+
+        counts = self.client.get(reverse("provider-quote-counts")).data
+        assert counts["totals"] == {"pending": 2, "quoted": 2, "accepted": 0, "rejected": 1, "completed": 0}
+        assert [service["name"] for service in counts["services"]] == ["Owned Movers"]
+
+        maintained = sorted(QuoteCounter.objects.filter(count__gt=0).values_list("service_id", "status", "count"))
+        rebuild()
+        assert sorted(QuoteCounter.objects.filter(count__gt=0).values_list("service_id", "status", "count")) == maintained
@@ -0,0 +1,167 @@
+"""
+Token-bucket throttling for API reads, weighted by what a request costs us.
+
+Each client has one bucket per scope: ``anon`` (by IP), ``user`` and
+``staff`` (by user id), sized by the matching ``DEFAULT_THROTTLE_RATES``
+entry: ``'120/min'`` holds 120 tokens and refills at 2 per second. Requests
+spend ``API_THROTTLE_COSTS`` tokens: a plain read costs ``read``, a search or
+a deep page costs extra, and a list answered with 304 Not Modified is refunded
+down to ``not_modified``. Writes are not throttled here.
+
+The bucket is stored GCRA-style as a single number, the time at which it
+will be full again, so a check is one read-modify-write. With the Redis cache
+backend that is one Lua script call (a single round trip, atomic across
+processes); with any other backend buckets live in this process's memory,
+which matches what LocMemCache would share anyway.
+"""
+import threading
+import time
+import zlib
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.redis import RedisCache
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle, SimpleRateThrottle
+
+# KEYS[1] = bucket; ARGV = now, seconds per token, capacity, cost.
+# Returns {allowed, seconds until the request would fit}; floats as strings
+# because Lua numbers are truncated to integers in replies.
+GCRA_SCRIPT = """
+local now = tonumber(ARGV[1])
+local interval = tonumber(ARGV[2])
+local capacity = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local full_at = tonumber(redis.call('GET', KEYS[1]) or '0')
+if full_at < now then full_at = now end
+local new_full_at = full_at + cost * interval
+local wait = new_full_at - capacity * interval - now
+if wait > 0 then
+    return {0, tostring(wait)}
+end
+if new_full_at > now then
+    redis.call('SET', KEYS[1], tostring(new_full_at), 'PX', math.ceil((new_full_at - now) * 1000))
+else
+    redis.call('DEL', KEYS[1])
+end
+return {1, '0'}
+"""
+
+
+class LocalBuckets:
+    """
+    Buckets in process memory. CPython has no compare-and-swap, so each
+    update holds one of a few striped locks for a couple of float operations
+    rather than a lock around the whole cache.
+    """
+    STRIPES = 16
+    MAX_KEYS = 10000
+
+    def __init__(self):
+        self._full_at = {}
+        self._locks = [threading.Lock() for _ in range(self.STRIPES)]
+
+    def consume(self, key, cost, capacity, interval, now):
+        with self._locks[zlib.crc32(key.encode()) % self.STRIPES]:
+            full_at = max(self._full_at.get(key, 0.0), now)
+            new_full_at = full_at + cost * interval
+            wait = new_full_at - capacity * interval - now
+            if wait > 0:
+                return False, wait
+            self._full_at[key] = new_full_at
+        if len(self._full_at) > self.MAX_KEYS:
+            self._prune(now)
+        return True, 0.0
+
+    def _prune(self, now):
+        # Full buckets carry no state; dropping them is the same as keeping them
+        for key, full_at in list(self._full_at.items()):
+            if full_at <= now:
+                self._full_at.pop(key, None)
+
+    def clear(self):
+        self._full_at.clear()
+
+
+class RedisBuckets:
+    _script = None
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def consume(self, key, cost, capacity, interval, now):
+        key = self.backend.make_and_validate_key(key)
+        client = self.backend._cache.get_client(key, write=True)
+        if RedisBuckets._script is None:
+            RedisBuckets._script = client.register_script(GCRA_SCRIPT)
+        allowed, wait = RedisBuckets._script(keys=[key], args=[now, interval, capacity, cost], client=client)
+        return bool(allowed), float(wait)
+
+
+local_buckets = LocalBuckets()
+
+
+def get_buckets():
+    backend = caches[DEFAULT_CACHE_ALIAS]
+    if isinstance(backend, RedisCache):
+        return RedisBuckets(backend)
+    return local_buckets
+
+
+def _page_number(request):
+    try:
+        return int(request.query_params.get('page', 1))
+    except (TypeError, ValueError):
+        return 1
+
+
+def request_cost(request, view):
+    """Tokens a read request spends up front"""
+    costs = settings.API_THROTTLE_COSTS
+    cost = costs['read']
+    if request.query_params.get(api_settings.SEARCH_PARAM, '').strip():
+        cost += costs['search']
+    if _page_number(request) > settings.API_THROTTLE_DEEP_PAGE:
+        cost += costs['deep_page']
+    return cost
+
+
+class TokenBucketThrottle(BaseThrottle):
+    def get_scope(self, request):
+        user = request.user
+        if not (user and user.is_authenticated):
+            return 'anon', self.get_ident(request)
+        return ('staff' if user.is_staff else 'user'), str(user.pk)
+
+    def allow_request(self, request, view):
+        if request.method not in SAFE_METHODS:
+            return True
+        scope, ident = self.get_scope(request)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope)
+        if rate is None:
+            return True
+        num_requests, duration = SimpleRateThrottle.parse_rate(None, rate)
+        interval = duration / num_requests
+
+        key = f'throttle:{scope}:{ident}'
+        cost = request_cost(request, view)
+        allowed, self._wait = get_buckets().consume(key, cost, num_requests, interval, time.time())
+        if allowed:
+            request._throttle_charge = (key, cost, num_requests, interval)
+        return allowed
+
+    def wait(self):
+        return self._wait
+
+
+def refund_not_modified(request):
+    """Give back the tokens of a request that ended up a cheap 304"""
+    charge = getattr(request, '_throttle_charge', None)
+    if charge is None:
+        return
+    key, cost, capacity, interval = charge
+    refund = cost - settings.API_THROTTLE_COSTS['not_modified']
+    if refund > 0:
+        get_buckets().consume(key, -refund, capacity, interval, time.time())
+        request._throttle_charge = None
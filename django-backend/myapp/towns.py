@@ -0,0 +1,101 @@
+"""
+Known towns and Nairobi neighbourhoods, with an offline distance matrix.
+
+``TOWN_COORDINATES`` is a static table, so the town-to-town matrix is built
+once at import (great-circle distance times ``ROAD_FACTOR`` for the detours
+of real roads) and a lookup never touches the database. ``resolve_town()``
+maps free-text locations such as "Westlands, Nairobi" to a key of the table.
+"""
+import re
+
+import numpy as np
+
+# (latitude, longitude), approximate town centres
+TOWN_COORDINATES = {
+    'Nairobi': (-1.2864, 36.8172),
+    'CBD': (-1.2841, 36.8233),
+    'Westlands': (-1.2676, 36.8108),
+    'Parklands': (-1.2620, 36.8200),
+    'Kilimani': (-1.2921, 36.7856),
+    'Kileleshwa': (-1.2810, 36.7840),
+    'Lavington': (-1.2800, 36.7700),
+    'Upper Hill': (-1.2990, 36.8160),
+    'Karen': (-1.3197, 36.7073),
+    'Langata': (-1.3500, 36.7600),
+    'South B': (-1.3100, 36.8370),
+    'South C': (-1.3200, 36.8270),
+    'Embakasi': (-1.3190, 36.8950),
+    'Kasarani': (-1.2210, 36.8970),
+    'Roysambu': (-1.2180, 36.8870),
+    'Runda': (-1.2180, 36.8100),
+    'Gigiri': (-1.2330, 36.8030),
+    'Ruaka': (-1.2060, 36.7800),
+    'Rongai': (-1.3960, 36.7590),
+    'Ngong': (-1.3520, 36.6690),
+    'Syokimau': (-1.3700, 36.9300),
+    'Kitengela': (-1.4760, 36.9600),
+    'Athi River': (-1.4560, 36.9780),
+    'Ruiru': (-1.1460, 36.9600),
+    'Juja': (-1.1020, 37.0140),
+    'Thika': (-1.0330, 37.0690),
+    'Kiambu': (-1.1710, 36.8350),
+    'Kikuyu': (-1.2460, 36.6630),
+    'Limuru': (-1.1140, 36.6420),
+    'Machakos': (-1.5177, 37.2634),
+    'Naivasha': (-0.7167, 36.4333),
+    'Nakuru': (-0.3031, 36.0800),
+    'Nyeri': (-0.4201, 36.9476),
+    'Nanyuki': (0.0167, 37.0667),
+    'Embu': (-0.5310, 37.4500),
+    'Chuka': (-0.3330, 37.6460),
+    'Meru': (0.0470, 37.6490),
+    'Nkubu': (-0.0667, 37.6667),
+    'Kisumu': (-0.0917, 34.7680),
+    'Kakamega': (0.2827, 34.7519),
+    'Kisii': (-0.6817, 34.7667),
+    'Kericho': (-0.3670, 35.2830),
+    'Eldoret': (0.5143, 35.2698),
+    'Kitale': (1.0157, 35.0062),
+    'Garissa': (-0.4532, 39.6461),
+    'Mombasa': (-4.0435, 39.6682),
+    'Nyali': (-4.0230, 39.7100),
+    'Malindi': (-3.2170, 40.1190),
+}
+
+ROAD_FACTOR = 1.3
+EARTH_RADIUS_KM = 6371.0
+
+TOWNS = sorted(TOWN_COORDINATES)
+TOWN_INDEX = {town: i for i, town in enumerate(TOWNS)}
+
+
+def _distance_matrix():
+    latitudes, longitudes = np.radians(np.array([TOWN_COORDINATES[town] for town in TOWNS])).T
+    dlat = latitudes[:, None] - latitudes[None, :]
+    dlon = longitudes[:, None] - longitudes[None, :]
+    a = np.sin(dlat / 2) ** 2 + np.cos(latitudes[:, None]) * np.cos(latitudes[None, :]) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0))) * ROAD_FACTOR
+
+
+DISTANCE_KM = _distance_matrix()
+
+# Longest names first so "South B" wins over a shorter name at the same position
+_TOWN_RE = re.compile(
+    r'\b(%s)\b' % '|'.join(re.escape(town) for town in sorted(TOWNS, key=len, reverse=True)), re.IGNORECASE)
+_TOWN_BY_LOWER = {town.lower(): town for town in TOWNS}
+
+
+def resolve_town(location):
+    """Town key for a free-text location, or None; the first town named wins ("Westlands, Nairobi" -> Westlands)"""
+    match = _TOWN_RE.search(' '.join((location or '').split()))
+    return _TOWN_BY_LOWER[match.group(1).lower()] if match else None
+
+
+def distance_km(origin, destination):
+    return float(DISTANCE_KM[TOWN_INDEX[origin], TOWN_INDEX[destination]])
+
+
+def towns_within(town, radius_km):
+    """``{town: km}`` for every town within ``radius_km`` of ``town`` (itself included)"""
+    row = DISTANCE_KM[TOWN_INDEX[town]]
+    return {TOWNS[i]: float(row[i]) for i in np.nonzero(row <= radius_km)[0]}
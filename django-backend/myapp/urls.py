@@ -2,9 +2,9 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
     RegisterView, MeView, PropertyViewSet, MarketplaceItemViewSet, MovingServiceViewSet,
-    BookingViewSet, MoverQuoteViewSet, PurchaseViewSet, ReviewViewSet,
+    BookingViewSet, MoverQuoteViewSet, ProviderQuoteViewSet, PurchaseViewSet, ReviewViewSet,
     user_dashboard, admin_dashboard, health_check, api_404_handler, api_500_handler,
-    login_view, register_view, upload_image
+    login_view, register_view, stream_token_view, upload_image, admin_profile, admin_export, price_analytics
 )
 
 router = DefaultRouter()
@@ -13,6 +13,7 @@ router.register(r'marketplace', MarketplaceItemViewSet, basename='marketplace')
 router.register(r'moving-services', MovingServiceViewSet, basename='moving-service')
 router.register(r'bookings', BookingViewSet, basename='booking')
 router.register(r'quotes', MoverQuoteViewSet, basename='quote')
+router.register(r'provider/quotes', ProviderQuoteViewSet, basename='provider-quote')
 router.register(r'purchases', PurchaseViewSet, basename='purchase')
 router.register(r'reviews', ReviewViewSet, basename='review')
 
@@ -21,10 +22,16 @@ urlpatterns = [
     path('auth/login/', login_view, name='login'),
     path('auth/register/', register_view, name='register'),
     path('auth/me/', MeView.as_view(), name='me'),
+    path('auth/stream-token/', stream_token_view, name='stream_token'),
 
     # Dashboard
     path('dashboard/', user_dashboard, name='user_dashboard'),
     path('admin/dashboard/', admin_dashboard, name='admin_dashboard'),
+    path('admin/profile/', admin_profile, name='admin_profile'),
+    path('admin/export/<str:dataset>.<str:export_format>', admin_export, name='admin_export'),
+
+    # Analytics
+    path('analytics/prices/', price_analytics, name='price_analytics'),
 
     # Health check
     path('health/', health_check, name='health_check'),
@@ -1,24 +1,55 @@
 from rest_framework import generics, permissions, viewsets, status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
 from rest_framework.response import Response
-from rest_framework_simplejwt.tokens import RefreshToken
 from django_filters import rest_framework as filters
-from .serializers import RegisterSerializer, UserSerializer, PropertySerializer, BookingSerializer, MarketplaceItemSerializer, MovingServiceSerializer, MoverQuoteSerializer, PurchaseSerializer, ReviewSerializer
-from django.contrib.auth import get_user_model, authenticate
+from .serializers import PrefetchablePrimaryKeyRelatedField, PropertyCompactSerializer, MarketplaceItemCompactSerializer, RegisterSerializer, UserSerializer, PropertySerializer, BookingSerializer, MarketplaceItemSerializer, MovingServiceSerializer, MoverQuoteSerializer, ProviderQuoteUpdateSerializer, PurchaseSerializer, QuoteMatchSerializer, ReviewSerializer
+from django.contrib.auth import get_user_model
 from django.shortcuts import render, get_object_or_404
-from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
 from django.views.decorators.http import require_http_methods
-from django.db.models import Q, Count
+from django.db import transaction
+from django.core.exceptions import FieldDoesNotExist, SuspiciousFileOperation
+from django.db.models import Q, Count, DateTimeField, Max, Subquery
 from django.core.paginator import Paginator
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import http_date
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
 from django.conf import settings
+import base64
+import binascii
+import hashlib
 import json
+import mimetypes
 import os
+import re
 import uuid
-from .models import Property, Booking, MarketplaceItem, MovingService, MoverQuote, Purchase, Profile, Review
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from urllib.parse import quote
+from .models import Property, PropertyAmenity, Booking, DeletionLog, MarketplaceItem, MovingService, MoverQuote, Purchase, Profile, Review
+from .amenities import normalize as normalize_amenity
+from .profiling import sampler
+from .property_detail import SIMILAR_LIMIT, invalidate_property_detail, property_detail, similar_properties
+from .rollups import price_stats
+from .renderers import FastJsonResponse
+from .authentication import get_full_user, issue_tokens
+from .login import guarded_authenticate
+from .checkout import checkout
+from .events import issue_stream_token
+from .matching import create_quotes, match_services
+from .provider_inbox import provider_services, queue_counts, update_quotes
+from .quote_counters import record_created as record_quotes_created
+from .towns import distance_km
+from .throttling import refund_not_modified
+from .jobs import enqueue
+from .exports import EXPORTS, FORMATS, export_response, filter_queryset as filter_export_queryset
 
 User = get_user_model()
 
@@ -34,6 +65,340 @@ class IsAdminOrReadOnly(permissions.BasePermission):
         user = request.user
         return bool(user and user.is_authenticated and (user.is_staff or user.is_superuser))
 
+class RelatedPlanMixin:
+    """
+    Viewsets declare the relations their serializer renders so that list
+    pages cost a fixed number of queries regardless of page size.
+    """
+    select_related_fields = ()
+    prefetch_related_fields = ()
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.select_related_fields:
+            queryset = queryset.select_related(*self.select_related_fields)
+        if self.prefetch_related_fields:
+            queryset = queryset.prefetch_related(*self.prefetch_related_fields)
+        return queryset
+
+class SparseFieldsMixin:
+    """
+    Sparse fieldsets on reads: ``?fields=a,b``, ``?exclude=c`` or a named
+    ``?view=`` preset from ``field_presets``. Only the selected fields are
+    rendered and the queryset is narrowed with ``.only()`` to the columns they
+    need, so unused columns (e.g. JSON blobs) are neither loaded nor decoded.
+    """
+    field_presets = {}
+
+    def get_requested_fields(self):
+        """Names of the output fields to render, or None for all of them"""
+        if hasattr(self, '_requested_fields'):
+            return self._requested_fields
+
+        requested = None
+        params = self.request.query_params if self.request else {}
+        if self.request and self.request.method in permissions.SAFE_METHODS and (
+                'fields' in params or 'exclude' in params or 'view' in params):
+            available = [name for name, field in self.get_serializer_class()().fields.items() if not field.write_only]
+            selected = set(available)
+            view = params.get('view')
+            if view:
+                if view not in self.field_presets:
+                    raise ValidationError({'view': f"Unknown view '{view}'. Choose from: {', '.join(self.field_presets) or 'none'}"})
+                selected = set(self.field_presets[view])
+            if params.get('fields'):
+                selected = self._parse_field_list(params['fields'], available, 'fields')
+            if params.get('exclude'):
+                selected -= self._parse_field_list(params['exclude'], available, 'exclude')
+            requested = [name for name in available if name in selected]
+            if not requested:
+                raise ValidationError({'fields': 'At least one field must be selected'})
+
+        self._requested_fields = requested
+        return requested
+
+    def _parse_field_list(self, value, available, param):
+        names = {name.strip() for name in value.split(',') if name.strip()}
+        unknown = sorted(names.difference(available))
+        if unknown:
+            raise ValidationError({param: f"Unknown field(s): {', '.join(unknown)}"})
+        return names
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        requested = self.get_requested_fields()
+        if requested is not None:
+            fields = getattr(serializer, 'child', serializer).fields
+            for name in list(fields):
+                if name not in requested:
+                    fields.pop(name)
+        return serializer
+
+    def get_only_columns(self, requested):
+        """Model columns needed to render ``requested``, or None if they can't be determined"""
+        serializer_class = self.get_serializer_class()
+        dependencies = getattr(serializer_class, 'field_dependencies', {})
+        fields = serializer_class().fields
+        model = serializer_class.Meta.model
+        columns = {model._meta.pk.name}
+        columns.update(getattr(self, 'select_related_fields', ()))
+        for name in requested:
+            for source in dependencies.get(name, (fields[name].source,)):
+                try:
+                    model_field = model._meta.get_field(source.split('.')[0])
+                except FieldDoesNotExist:
+                    return None
+                if not model_field.concrete:
+                    return None
+                columns.add(model_field.name)
+        return columns
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        requested = self.get_requested_fields()
+        if requested is not None:
+            columns = self.get_only_columns(requested)
+            if columns:
+                queryset = queryset.only(*columns)
+        return queryset
+
+class CompactListMixin(SparseFieldsMixin):
+    """
+    Render list pages from ``values()`` rows with ``compact_serializer_class``
+    instead of instantiating a model and a ModelSerializer field set per row.
+    """
+    compact_serializer_class = None
+
+    def list(self, request, *args, **kwargs):
+        compact = self.compact_serializer_class(context=self.get_serializer_context(), fields=self.get_requested_fields())
+        queryset = self.filter_queryset(self.get_queryset()).values(*compact.value_fields())
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(compact.render(page))
+        return Response(compact.render(queryset))
+
+class ConditionalListMixin:
+    """
+    Conditional GET for list pages. ``Last-Modified`` is the newest
+    ``updated_at`` or ``DeletionLog`` entry of the whole model, so rows that
+    were deleted or left the filter still move it; the ETag also covers the
+    filtered row count, the query string, the user and the renderer. A
+    matching ``If-None-Match``/``If-Modified-Since`` gets a 304 before any
+    row is fetched or serialized.
+    """
+    last_modified_field = 'updated_at'
+
+    def get_list_validators(self, queryset):
+        model = queryset.model
+        # Newest change and newest deletion: one indexed lookup each, in the same query as the count
+        changed = model._default_manager.order_by(f'-{self.last_modified_field}').values(self.last_modified_field)[:1]
+        deleted = DeletionLog.objects.filter(model=model._meta.label_lower).order_by('-deleted_at').values('deleted_at')[:1]
+        stats = queryset.order_by().aggregate(
+            count=Count('pk'),
+            changed=Max(Subquery(changed, output_field=DateTimeField())),
+            deleted=Max(Subquery(deleted, output_field=DateTimeField())),
+        )
+        last_modified = max(filter(None, [stats['changed'], stats['deleted']]), default=None)
+        key = '|'.join([
+            last_modified.isoformat() if last_modified else '', str(stats['count']),
+            self.request.get_full_path(), str(self.request.user.pk or ''),
+            self.request.accepted_media_type or '',
+        ])
+        etag = '"%s"' % hashlib.md5(key.encode(), usedforsecurity=False).hexdigest()
+        return etag, last_modified
+
+    def list(self, request, *args, **kwargs):
+        etag, last_modified = self.get_list_validators(self.filter_queryset(self.get_queryset()))
+        last_modified_ts = int(last_modified.timestamp()) if last_modified else None
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified_ts)
+        if response is None:
+            response = super().list(request, *args, **kwargs)
+        elif response.status_code == 304:
+            refund_not_modified(request)
+        response['ETag'] = etag
+        if last_modified_ts is not None:
+            response['Last-Modified'] = http_date(last_modified_ts)
+        # Per-user lists: browsers may store them but must revalidate every time
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+def _encode_changes_cursor(rows_after, deletions_after):
+    values = [[moment.isoformat(), pk] for moment, pk in (rows_after, deletions_after)]
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode()).decode()
+
+def _decode_changes_cursor(cursor):
+    try:
+        (rows_at, rows_pk), (deleted_at, deleted_pk) = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        rows_after, deletions_after = (parse_datetime(rows_at), int(rows_pk)), (parse_datetime(deleted_at), int(deleted_pk))
+    except (TypeError, ValueError, binascii.Error):
+        raise ValidationError({'cursor': 'Invalid cursor'})
+    if rows_after[0] is None or deletions_after[0] is None:
+        raise ValidationError({'cursor': 'Invalid cursor'})
+    return rows_after, deletions_after
+
+class ChangesFeedMixin:
+    """
+    ``GET <list-url>/changes/`` for clients that keep a local copy of the list.
+    Returns rows created or updated after a high-water mark, plus the ids of
+    rows deleted since then (see ``DeletionLog``). Both are keyset-paginated:
+    rows on ``(updated_at, id)`` and tombstones on ``(deleted_at, id)``, which
+    are indexed, so each call reads only what changed.
+
+    Start with no parameters (full sync) or ``?updated_since=<ISO datetime>``,
+    then pass the returned ``cursor`` back until ``has_more`` is false. A
+    cursor older than ``CHANGES_TOMBSTONE_DAYS`` gets 410 Gone: its deletions
+    may have been pruned, so the client must start over.
+    """
+    changes_page_size = 200
+    changes_max_page_size = 1000
+
+    def get_changes_page_size(self):
+        try:
+            limit = int(self.request.query_params.get('limit', self.changes_page_size))
+        except (TypeError, ValueError):
+            raise ValidationError({'limit': 'Must be an integer'})
+        return max(1, min(limit, self.changes_max_page_size))
+
+    def get_changes_watermarks(self):
+        """((updated_at, id), (deleted_at, id)) to read after; updated_at None means from the start"""
+        params = self.request.query_params
+        if params.get('cursor'):
+            return _decode_changes_cursor(params['cursor'])
+        if params.get('updated_since'):
+            since = parse_datetime(params['updated_since'])
+            if since is None:
+                raise ValidationError({'updated_since': 'Expected an ISO 8601 datetime'})
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+            return (since, 0), (since, 0)
+        # Full sync: every current row, and deletions from now on
+        return (None, 0), (timezone.now(), 0)
+
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        rows_after, deletions_after = self.get_changes_watermarks()
+        if deletions_after[0] < timezone.now() - timedelta(days=settings.CHANGES_TOMBSTONE_DAYS):
+            return Response({'detail': 'Cursor expired, sync from the start.', 'code': 'resync'},
+                            status=status.HTTP_410_GONE)
+        limit = self.get_changes_page_size()
+
+        queryset = self.get_queryset().order_by('updated_at', 'pk')
+        if rows_after[0] is not None:
+            updated_at, pk = rows_after
+            queryset = queryset.filter(Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, pk__gt=pk))
+        rows = list(queryset[:limit + 1])
+
+        deleted_at, pk = deletions_after
+        tombstones = list(
+            DeletionLog.objects
+            .filter(model=queryset.model._meta.label_lower)
+            .filter(Q(deleted_at__gt=deleted_at) | Q(deleted_at=deleted_at, pk__gt=pk))
+            .order_by('deleted_at', 'pk')
+            .values_list('deleted_at', 'pk', 'object_id')[:limit + 1]
+        )
+
+        has_more = len(rows) > limit or len(tombstones) > limit
+        rows, tombstones = rows[:limit], tombstones[:limit]
+        if rows:
+            rows_after = (rows[-1].updated_at, rows[-1].pk)
+        elif rows_after[0] is None:
+            # Nothing to sync yet: later rows are anything after the deletion watermark
+            rows_after = (deletions_after[0], 0)
+        if tombstones:
+            deletions_after = tombstones[-1][:2]
+
+        return Response({
+            'results': self.get_serializer(rows, many=True).data,
+            'deleted': [object_id for _, _, object_id in tombstones],
+            'cursor': _encode_changes_cursor(rows_after, deletions_after),
+            'has_more': has_more,
+        })
+
+class BulkCreateMixin:
+    """
+    Adds ``POST <list-url>/bulk/`` taking an array of objects.
+
+    Items are validated in one pass (related ids are resolved with one query
+    per relation) and inserted with a single ``bulk_create`` in one
+    transaction. Any invalid item rejects the whole batch unless
+    ``?partial=true`` is given, in which case the valid items are created and
+    the per-item errors are returned alongside them.
+    """
+    bulk_max_items = 500
+
+    def get_bulk_save_kwargs(self):
+        """Server-side values applied to every created object"""
+        return {}
+
+    def validate_bulk(self, items):
+        """
+        Cross-item validation hook: ``items`` is a list of (index, validated_data), returns {index: errors}.
+        Runs in the insert's transaction.
+        """
+        return {}
+
+    def after_bulk_create(self, created):
+        """Hook for what post_save would have done, run in the insert's transaction"""
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request, *args, **kwargs):
+        items = request.data
+        if not isinstance(items, list):
+            return Response({'error': 'Expected a list of objects'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > self.bulk_max_items:
+            return Response({'error': f'At most {self.bulk_max_items} objects per request'}, status=status.HTTP_400_BAD_REQUEST)
+        partial = request.query_params.get('partial') == 'true'
+
+        context = self.get_serializer_context()
+        context['bulk'] = True
+        context['prefetched'] = self._prefetch_related_ids(items)
+        serializer = self.get_serializer_class()(context=context)
+
+        errors = {}
+        valid = []
+        for index, item in enumerate(items):
+            try:
+                valid.append((index, serializer.run_validation(item)))
+            except ValidationError as e:
+                errors[index] = e.detail
+
+        model = serializer.Meta.model
+        extra = self.get_bulk_save_kwargs()
+        # validate_bulk may lock rows: its checks hold until the insert commits
+        with transaction.atomic():
+            errors.update(self.validate_bulk(valid))
+            valid = [(index, data) for index, data in valid if index not in errors]
+            error_list = [{'index': index, 'errors': errors[index]} for index in sorted(errors)]
+            if errors and not partial:
+                return Response({'created': [], 'errors': error_list}, status=status.HTTP_400_BAD_REQUEST)
+            # Server-side values win over anything the client sent
+            created = model.objects.bulk_create([model(**{**data, **extra}) for _, data in valid])
+            self.after_bulk_create(created)
+
+        output = self.get_serializer_class()(created, many=True, context=context).data
+        return Response(
+            {'created': output, 'errors': error_list},
+            status=status.HTTP_207_MULTI_STATUS if errors else status.HTTP_201_CREATED,
+        )
+
+    def _prefetch_related_ids(self, items):
+        """Resolve every id referenced by the batch with one query per relation field"""
+        prefetched = {}
+        for name, field in self.get_serializer_class()().fields.items():
+            if not isinstance(field, PrefetchablePrimaryKeyRelatedField) or field.read_only:
+                continue
+            ids = set()
+            for item in items:
+                if isinstance(item, dict) and item.get(name) not in (None, ''):
+                    try:
+                        ids.add(field.get_queryset().model._meta.pk.to_python(item[name]))
+                    except Exception:
+                        pass  # reported per item during validation
+            prefetched[name] = field.get_queryset().in_bulk(ids) if ids else {}
+        return prefetched
+
 # Properties API
 @require_http_methods(["GET"])
 def properties_list(request):
@@ -101,7 +466,7 @@ def properties_list(request):
             'rating': float(prop.rating) if prop.rating else None,
         })
 
-    return JsonResponse({
+    return FastJsonResponse({
         'properties': properties_data,
         'pagination': {
             'page': properties_page.number,
@@ -123,7 +488,7 @@ def create_mover_quote(request, service_id):
         # In a real app, you'd get the user from authentication
         user = request.user if request.user.is_authenticated else None
         if not user:
-            return JsonResponse({'error': 'Authentication required'}, status=401)
+            return FastJsonResponse({'error': 'Authentication required'}, status=401)
 
         quote = MoverQuote.objects.create(
             service=service,
@@ -137,7 +502,7 @@ def create_mover_quote(request, service_id):
             inventory=data.get('inventory'),
         )
 
-        return JsonResponse({
+        return FastJsonResponse({
             'id': quote.id,
             'service_id': quote.service.id,
             'client_name': quote.client_name,
@@ -148,23 +513,23 @@ def create_mover_quote(request, service_id):
             'created_at': quote.created_at.isoformat(),
         }, status=201)
     except KeyError as e:
-        return JsonResponse({'error': f'Missing required field: {str(e)}'}, status=400)
+        return FastJsonResponse({'error': f'Missing required field: {str(e)}'}, status=400)
     except json.JSONDecodeError:
-        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+        return FastJsonResponse({'error': 'Invalid JSON'}, status=400)
     except Exception as e:
-        return JsonResponse({'error': str(e)}, status=500)
+        return FastJsonResponse({'error': str(e)}, status=500)
 
 # Legacy API (keeping for compatibility)
 @require_http_methods(["GET"])
 def item_list(request):
     """Legacy endpoint - returns empty list"""
-    return JsonResponse([], safe=False)
+    return FastJsonResponse([], safe=False)
 
 @csrf_exempt
 @require_http_methods(["POST"])
 def item_create(request):
     """Legacy endpoint - returns error"""
-    return JsonResponse({'error': 'This endpoint is deprecated. Use specific model endpoints.'}, status=410)
+    return FastJsonResponse({'error': 'This endpoint is deprecated. Use specific model endpoints.'}, status=410)
 
 class RegisterView(generics.CreateAPIView):
     queryset = User.objects.all()
@@ -176,7 +541,7 @@ class MeView(generics.RetrieveAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self):
-        return self.request.user
+        return get_full_user(self.request.user)
 
 class PropertyFilter(filters.FilterSet):
     county = filters.CharFilter(field_name='location', lookup_expr='icontains')
@@ -184,14 +549,27 @@ class PropertyFilter(filters.FilterSet):
     property_type = filters.CharFilter(field_name='type')
     min_price = filters.NumberFilter(field_name='price', lookup_expr='gte')
     max_price = filters.NumberFilter(field_name='price', lookup_expr='lte')
+    amenity = filters.CharFilter(method='filter_amenity', help_text="Comma-separated amenities the listing must all have, e.g. 'schools,parking'")
 
     class Meta:
         model = Property
-        fields = ['type', 'rental_type', 'location', 'price', 'bedrooms', 'featured', 'county', 'town', 'property_type', 'min_price', 'max_price']
+        fields = ['type', 'rental_type', 'location', 'price', 'bedrooms', 'featured', 'county', 'town', 'property_type', 'min_price', 'max_price', 'amenity']
+
+    def filter_amenity(self, queryset, name, value):
+        # One indexed subquery per key on PropertyAmenity rather than decoding the JSON column
+        for key in sorted({normalize_amenity(key) for key in value.split(',')} - {''}):
+            queryset = queryset.filter(pk__in=PropertyAmenity.objects.filter(key=key).values('property_id'))
+        return queryset
 
-class PropertyViewSet(viewsets.ModelViewSet):
+class PropertyViewSet(ChangesFeedMixin, ConditionalListMixin, CompactListMixin, viewsets.ModelViewSet):
     queryset = Property.objects.all()
     serializer_class = PropertySerializer
+    compact_serializer_class = PropertyCompactSerializer
+    # Fields rendered by the frontend PropertyCard
+    field_presets = {
+        'card': ['id', 'title', 'location', 'price', 'price_type', 'type', 'bedrooms', 'bathrooms', 'area',
+                 'image', 'images', 'rating', 'reviews', 'featured', 'managed_by', 'landlord_name', 'agency_name'],
+    }
     permission_classes = [IsAdminOrReadOnly]
     filterset_class = PropertyFilter
     search_fields = ['title', 'location', 'rental_type']
@@ -200,8 +578,22 @@ class PropertyViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
 
+    @action(detail=True, methods=['get'])
+    def full(self, request, pk=None):
+        """Property, latest reviews, rating histogram, booked dates and similar listings in one response"""
+        return Response(property_detail(request, self.get_object()))
+
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        """Most similar listings, from the precomputed neighbour table"""
+        try:
+            limit = min(int(request.query_params.get('limit', SIMILAR_LIMIT)), settings.SIMILAR_PROPERTIES_K)
+        except ValueError:
+            raise ValidationError({'limit': 'Must be an integer'})
+        return Response(similar_properties(request, self.get_object(), limit=max(limit, 1)))
+
     def get_queryset(self):
-        queryset = Property.objects.all()
+        queryset = super().get_queryset()
         created_by_user = self.request.query_params.get('created_by_user', None)
 
         if created_by_user and self.request.user.is_authenticated:
@@ -214,14 +606,22 @@ class MarketplaceItemFilter(filters.FilterSet):
     condition = filters.CharFilter(field_name='condition')
     min_price = filters.NumberFilter(field_name='price', lookup_expr='gte')
     max_price = filters.NumberFilter(field_name='price', lookup_expr='lte')
+    status = filters.ChoiceFilter(choices=MarketplaceItem.STATUS_CHOICES + [('all', 'All')], method='filter_status')
 
     class Meta:
         model = MarketplaceItem
-        fields = ['category', 'condition', 'location', 'min_price', 'max_price']
+        fields = ['category', 'condition', 'location', 'min_price', 'max_price', 'status']
 
-class MarketplaceItemViewSet(viewsets.ModelViewSet):
+    def filter_status(self, queryset, name, value):
+        return queryset if value == 'all' else queryset.filter(status=value)
+
+class MarketplaceItemViewSet(BulkCreateMixin, ChangesFeedMixin, ConditionalListMixin, CompactListMixin, viewsets.ModelViewSet):
     queryset = MarketplaceItem.objects.all()
     serializer_class = MarketplaceItemSerializer
+    compact_serializer_class = MarketplaceItemCompactSerializer
+    field_presets = {
+        'card': ['id', 'title', 'price', 'category', 'condition', 'location', 'image'],
+    }
     permission_classes = [IsAdminOrReadOnly]
     filterset_class = MarketplaceItemFilter
     search_fields = ['title', 'description', 'category']
@@ -230,30 +630,45 @@ class MarketplaceItemViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
 
+    def get_bulk_save_kwargs(self):
+        return {'created_by': self.request.user}
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        # Lists hide sold items unless ?status= asks for them; detail pages still show them
+        if self.action == 'list' and not self.request.query_params.get('status'):
+            queryset = queryset.filter(status='available')
+        return queryset
+
 class MovingServiceFilter(filters.FilterSet):
     verified = filters.BooleanFilter(field_name='verified')
+    # On the columns parsed from price_range (see parse_price_range)
+    min_price = filters.NumberFilter(field_name='min_price', lookup_expr='gte')
+    max_price = filters.NumberFilter(field_name='max_price', lookup_expr='lte')
+    budget = filters.NumberFilter(field_name='min_price', lookup_expr='lte', help_text='Services whose prices start at or below this amount')
 
     class Meta:
         model = MovingService
-        fields = ['location', 'verified']
+        fields = ['location', 'verified', 'min_price', 'max_price', 'budget']
 
-class MovingServiceViewSet(viewsets.ModelViewSet):
+class MovingServiceViewSet(ChangesFeedMixin, ConditionalListMixin, SparseFieldsMixin, viewsets.ModelViewSet):
     queryset = MovingService.objects.all()
     serializer_class = MovingServiceSerializer
     permission_classes = [IsAdminOrReadOnly]
     filterset_class = MovingServiceFilter
     search_fields = ['name', 'location']
-    ordering_fields = ['created_at', 'rating', 'name']
+    ordering_fields = ['created_at', 'rating', 'name', 'min_price', 'max_price']
 
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
 
-class BookingViewSet(viewsets.ModelViewSet):
+class BookingViewSet(BulkCreateMixin, SparseFieldsMixin, RelatedPlanMixin, viewsets.ModelViewSet):
     queryset = Booking.objects.all()
     serializer_class = BookingSerializer
     permission_classes = [permissions.IsAuthenticated]
     filterset_fields = ['status', 'property']
     ordering_fields = ['created_at', 'booking_date']
+    select_related_fields = ('user',)
 
     def perform_create(self, serializer):
         try:
@@ -265,52 +680,181 @@ class BookingViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         # Users can only see their own bookings
-        return self.queryset.filter(user=self.request.user)
-
-class MoverQuoteViewSet(viewsets.ModelViewSet):
+        return super().get_queryset().filter(user=self.request.user)
+
+    def get_bulk_save_kwargs(self):
+        return {'user': self.request.user, 'status': 'pending'}
+
+    def validate_bulk(self, items):
+        """Check date overlaps for the whole batch, against the DB and each other, with one query"""
+        ranged = [(index, data) for index, data in items if data.get('check_in_date') and data.get('check_out_date')]
+        if not ranged:
+            return {}
+
+        property_ids = {data['property'].pk for _, data in ranged}
+        # Lock the properties so concurrent bookings of them wait for this insert
+        list(Property.objects.select_for_update().filter(pk__in=property_ids).order_by('pk').values_list('pk'))
+        taken = defaultdict(list)
+        existing = Booking.objects.filter(
+            property__in=property_ids,
+            check_in_date__lte=max(data['check_out_date'] for _, data in ranged),
+            check_out_date__gte=min(data['check_in_date'] for _, data in ranged),
+        ).values_list('property_id', 'check_in_date', 'check_out_date')
+        for property_id, check_in, check_out in existing:
+            taken[property_id].append((check_in, check_out))
+
+        errors = {}
+        for index, data in ranged:
+            start, end = data['check_in_date'], data['check_out_date']
+            ranges = taken[data['property'].pk]
+            if any(check_in <= end and check_out >= start for check_in, check_out in ranges):
+                errors[index] = {'non_field_errors': ["Property is already booked for those dates"]}
+            else:
+                ranges.append((start, end))
+        return errors
+
+    def after_bulk_create(self, created):
+        # bulk_create skips post_save (drop_parent_property_detail)
+        for property_id in {booking.property_id for booking in created}:
+            invalidate_property_detail(property_id)
+
+class MoverQuoteViewSet(BulkCreateMixin, SparseFieldsMixin, RelatedPlanMixin, viewsets.ModelViewSet):
     queryset = MoverQuote.objects.all()
     serializer_class = MoverQuoteSerializer
     permission_classes = [permissions.IsAuthenticated]
     filterset_fields = ['status', 'service']
     ordering_fields = ['created_at', 'moving_date']
+    select_related_fields = ('service',)
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
     def get_queryset(self):
         # Users can only see their own quotes
-        return self.queryset.filter(user=self.request.user)
+        return super().get_queryset().filter(user=self.request.user)
+
+    def get_bulk_save_kwargs(self):
+        # Only the provider sets status and amount (see provider_inbox.py)
+        return {'user': self.request.user, 'status': 'pending', 'quote_amount': None}
+
+    def after_bulk_create(self, created):
+        record_quotes_created(created)
+
+    @action(detail=False, methods=['post'])
+    def match(self, request):
+        """Rank verified movers for a move; with ``create_quotes`` also request a quote from each"""
+        serializer = QuoteMatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        matches = match_services(request, data['pickup_town'], data['limit'], budget=data.get('budget'))
+        response = {
+            'pickup_town': data['pickup_town'],
+            'delivery_town': data['delivery_town'],
+            'route_km': round(distance_km(data['pickup_town'], data['delivery_town']), 1),
+            'results': matches,
+        }
+        if data['create_quotes']:
+            quotes = create_quotes(request.user, matches, data)
+            response['quotes'] = [
+                {'id': quote.id, 'service_id': quote.service_id, 'status': quote.status} for quote in quotes
+            ]
+        return Response(response, status=status.HTTP_201_CREATED if data['create_quotes'] else status.HTTP_200_OK)
+
+class ProviderInboxPagination(CursorPagination):
+    # Keyset pages on the (service, status, created_at) index: deep pages cost the same as the first
+    ordering = ('-created_at', '-id')
+    page_size = 25
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+class ProviderQuoteViewSet(SparseFieldsMixin, RelatedPlanMixin, viewsets.ReadOnlyModelViewSet):
+    """Inbox of the quotes sent to the moving services the user created (see provider_inbox.py)"""
+    queryset = MoverQuote.objects.all()
+    serializer_class = MoverQuoteSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = ProviderInboxPagination
+    # No ?ordering=: pages follow the cursor's order
+    filter_backends = [filters.DjangoFilterBackend]
+    filterset_fields = ['service', 'status']
+    select_related_fields = ('service',)
+    bulk_max_items = 200
 
-class PurchaseViewSet(viewsets.ModelViewSet):
+    def get_queryset(self):
+        return super().get_queryset().filter(service__in=provider_services(self.request.user))
+
+    @action(detail=False, methods=['post'], url_path='bulk-update')
+    def bulk_update(self, request):
+        """Set status and/or quote_amount on up to ``bulk_max_items`` quotes; all or nothing"""
+        items = request.data
+        if not isinstance(items, list):
+            return Response({'error': 'Expected a list of objects'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > self.bulk_max_items:
+            return Response({'error': f'At most {self.bulk_max_items} objects per request'}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = ProviderQuoteUpdateSerializer(data=items, many=True)
+        if not serializer.is_valid():
+            errors = [{'index': index, 'errors': item} for index, item in enumerate(serializer.errors) if item]
+            return Response({'updated': [], 'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+        ids = [item['id'] for item in serializer.validated_data]
+        if len(set(ids)) != len(ids):
+            return Response({'error': 'Each quote may appear only once'}, status=status.HTTP_400_BAD_REQUEST)
+
+        quotes, errors = update_quotes(request.user, serializer.validated_data)
+        if errors:
+            return Response({'updated': [], 'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+        updated = [
+            {'id': quote.id, 'status': quote.status, 'quote_amount': quote.quote_amount, 'updated_at': quote.updated_at}
+            for quote in quotes
+        ]
+        return Response({'updated': updated, 'errors': []})
+
+    @action(detail=False, methods=['get'])
+    def counts(self, request):
+        """Quotes per status for each of the user's services, from the maintained counters"""
+        return Response(queue_counts(request.user))
+
+class PurchaseViewSet(SparseFieldsMixin, RelatedPlanMixin, viewsets.ModelViewSet):
     queryset = Purchase.objects.all()
     serializer_class = PurchaseSerializer
     permission_classes = [permissions.IsAuthenticated]
     filterset_fields = ['status']
     ordering_fields = ['created_at']
+    select_related_fields = ('item', 'buyer')
 
     def perform_create(self, serializer):
-        serializer.save(buyer=self.request.user)
+        # 409 if someone else bought the item first
+        checkout(serializer, self.request.user)
 
     def get_queryset(self):
         # Users can only see their own purchases
-        return self.queryset.filter(buyer=self.request.user)
+        return super().get_queryset().filter(buyer=self.request.user)
 
-class ReviewViewSet(viewsets.ModelViewSet):
+class ReviewViewSet(SparseFieldsMixin, RelatedPlanMixin, viewsets.ModelViewSet):
     queryset = Review.objects.all()
     serializer_class = ReviewSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     filterset_fields = ['property', 'rating']
     ordering_fields = ['created_at']
+    select_related_fields = ('property', 'user')
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        review = serializer.save(user=self.request.user)
+        enqueue('recalculate_property_rating', {'property_id': review.property_id})
+
+    def perform_update(self, serializer):
+        review = serializer.save()
+        enqueue('recalculate_property_rating', {'property_id': review.property_id})
+
+    def perform_destroy(self, instance):
+        property_id = instance.property_id
+        instance.delete()
+        enqueue('recalculate_property_rating', {'property_id': property_id})
 
 # Dashboard API Views
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def user_dashboard(request):
     """Get user's dashboard data"""
-    user = request.user
+    user = get_full_user(request.user)
 
     # Get user's bookings
     bookings = Booking.objects.filter(user=user).select_related('property').order_by('-created_at')[:5]
@@ -360,7 +904,7 @@ def user_dashboard(request):
             'title': item.title,
             'image': item.image,
             'price': float(item.price),
-            'status': 'active',  # Assuming all are active
+            'status': item.status,
             'created_at': item.created_at,
         } for item in marketplace_items],
         'user_properties': [{
@@ -375,7 +919,7 @@ def user_dashboard(request):
             'total_bookings': Booking.objects.filter(user=user).count(),
             'total_purchases': Purchase.objects.filter(buyer=user).count(),
             'total_quotes': MoverQuote.objects.filter(user=user).count(),
-            'active_listings': MarketplaceItem.objects.filter(created_by=user).count(),
+            'active_listings': MarketplaceItem.objects.filter(created_by=user, status='available').count(),
         }
     }
 
@@ -409,6 +953,9 @@ def upload_image(request):
         file_path = os.path.join('uploads', unique_filename)
         file_name = default_storage.save(file_path, ContentFile(image_file.read()))
 
+        # Resizing happens in the background so the upload returns immediately
+        enqueue('optimize_image', {'file_name': file_name})
+
         # Generate URL
         if hasattr(settings, 'AWS_S3_CUSTOM_DOMAIN') and settings.AWS_S3_CUSTOM_DOMAIN:
             image_url = f"https://{settings.AWS_S3_CUSTOM_DOMAIN}/{file_name}"
@@ -425,6 +972,83 @@ def upload_image(request):
     except Exception as e:
         return Response({'error': f'Upload failed: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+# Media files (local storage only; S3 media is served by the bucket/CDN)
+MEDIA_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+MEDIA_CHUNK_SIZE = 64 * 1024
+
+def _media_range(header, size):
+    """Parse a single ``bytes=`` range; None means serve the whole file, False is unsatisfiable"""
+    match = MEDIA_RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if not start:
+        suffix = int(end)
+        return (max(size - suffix, 0), size - 1) if suffix and size else False
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size:
+        return False
+    return (start, end) if start <= end else None
+
+def _iter_file_range(fh, start, length):
+    try:
+        fh.seek(start)
+        while length > 0:
+            chunk = fh.read(min(MEDIA_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        fh.close()
+
+@require_http_methods(["GET", "HEAD"])
+def serve_media(request, path):
+    """Serve a file from MEDIA_ROOT with conditional GET and byte-range support"""
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404('Not found')
+    if not os.path.isfile(full_path):
+        raise Http404('Not found')
+
+    stat = os.stat(full_path)
+    etag = '"%x-%x"' % (int(stat.st_mtime), stat.st_size)
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+
+    if not_modified is not None:
+        response = not_modified
+    elif settings.MEDIA_ACCEL_REDIRECT_PREFIX:
+        # nginx streams the file (ranges included) from its internal location
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT_PREFIX.rstrip('/') + '/' + quote(path)
+    else:
+        byte_range = None
+        if request.headers.get('Range') and request.headers.get('If-Range', etag) in (etag, http_date(stat.st_mtime)):
+            byte_range = _media_range(request.headers['Range'], stat.st_size)
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+        elif byte_range:
+            start, end = byte_range
+            response = StreamingHttpResponse(
+                _iter_file_range(open(full_path, 'rb'), start, end - start + 1), status=206, content_type=content_type,
+            )
+            response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+            response['Content-Length'] = str(end - start + 1)
+        else:
+            # FileResponse hands the file to the server's wsgi.file_wrapper (sendfile) when available
+            response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Accept-Ranges'] = 'bytes'
+    # Not immutable: image jobs may rewrite a file under the same name
+    patch_cache_control(response, public=True, max_age=settings.MEDIA_CACHE_MAX_AGE)
+    return response
+
 # Authentication Views
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
@@ -438,7 +1062,7 @@ def login_view(request):
             'error': 'Please provide both username and password'
         }, status=status.HTTP_400_BAD_REQUEST)
 
-    user = authenticate(username=username, password=password)
+    user = guarded_authenticate(request, username, password)
 
     if user is None:
         return Response({
@@ -451,18 +1075,20 @@ def login_view(request):
         }, status=status.HTTP_401_UNAUTHORIZED)
 
     # Generate JWT tokens
-    refresh = RefreshToken.for_user(user)
-    access_token = str(refresh.access_token)
-    refresh_token = str(refresh)
-
     return Response({
         'user': UserSerializer(user).data,
-        'tokens': {
-            'access': access_token,
-            'refresh': refresh_token,
-        }
+        'tokens': issue_tokens(user),
     }, status=status.HTTP_200_OK)
 
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def stream_token_view(request):
+    """Short-lived token for ``GET /api/events/?stream_token=``; it opens event streams and nothing else"""
+    return Response({
+        'stream_token': issue_stream_token(request.user.pk),
+        'expires_in': settings.EVENTS_STREAM_TOKEN_SECONDS,
+    })
+
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
 def register_view(request):
@@ -472,16 +1098,9 @@ def register_view(request):
         user = serializer.save()
 
         # Generate JWT tokens for new user
-        refresh = RefreshToken.for_user(user)
-        access_token = str(refresh.access_token)
-        refresh_token = str(refresh)
-
         return Response({
             'user': UserSerializer(user).data,
-            'tokens': {
-                'access': access_token,
-                'refresh': refresh_token,
-            },
+            'tokens': issue_tokens(user),
             'message': 'User registered successfully'
         }, status=status.HTTP_201_CREATED)
 
@@ -501,6 +1120,43 @@ def health_check(request):
         }
     })
 
+PRICE_GROUP_FIELDS = ('county', 'town', 'rental_type', 'period')
+
+@api_view(['GET'])
+@permission_classes([permissions.AllowAny])
+def price_analytics(request):
+    """
+    Price quartiles and listing counts per segment, read from the price
+    rollups. ``?group_by=`` any of county,town,rental_type,period (default
+    county,town,rental_type); filter with county/town/rental_type,
+    ``price_type`` (default month) and ``since``/``until`` (YYYY-MM).
+    """
+    params = request.query_params
+    group_by = [name.strip() for name in params.get('group_by', 'county,town,rental_type').split(',') if name.strip()]
+    unknown = sorted(set(group_by).difference(PRICE_GROUP_FIELDS))
+    if unknown:
+        raise ValidationError({'group_by': f"Unknown field(s): {', '.join(unknown)}. Choose from: {', '.join(PRICE_GROUP_FIELDS)}"})
+
+    segment_filters = {'price_type': params.get('price_type', 'month')}
+    for field in ('county', 'town', 'rental_type'):
+        if params.get(field):
+            segment_filters[field] = params[field]
+    for param, lookup in (('since', 'period__gte'), ('until', 'period__lte')):
+        if params.get(param):
+            try:
+                period = parse_date(f"{params[param]}-01")
+            except ValueError:
+                period = None
+            if period is None:
+                raise ValidationError({param: 'Expected YYYY-MM'})
+            segment_filters[lookup] = period
+
+    results = price_stats(segment_filters, group_by)
+    for row in results:
+        if 'period' in row:
+            row['period'] = row['period'].strftime('%Y-%m')
+    return Response({'price_type': segment_filters['price_type'], 'group_by': group_by, 'results': results})
+
 # Error handling views
 @api_view(['GET'])
 def api_404_handler(request, exception=None):
@@ -582,3 +1238,77 @@ def admin_dashboard(request):
     }
 
     return Response(dashboard_data)
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def admin_export(request, dataset, export_format):
+    """
+    Stream an export of bookings/purchases/quotes/properties as CSV or NDJSON (staff only)
+    Query parameters:
+    - start, end: inclusive creation date range (YYYY-MM-DD)
+    - status: comma-separated statuses
+    """
+    user = request.user
+    if not user.is_staff and not user.is_superuser:
+        return Response({'error': 'Admin access required'}, status=status.HTTP_403_FORBIDDEN)
+
+    if dataset not in EXPORTS or export_format not in FORMATS:
+        return Response({
+            'error': f"Unknown export. Use one of {sorted(EXPORTS)} with format {sorted(FORMATS)}"
+        }, status=status.HTTP_404_NOT_FOUND)
+
+    dates = {}
+    for param in ('start', 'end'):
+        value = request.query_params.get(param)
+        if value:
+            dates[param] = parse_date(value)
+            if dates[param] is None:
+                return Response({'error': f'{param} must be a YYYY-MM-DD date'}, status=status.HTTP_400_BAD_REQUEST)
+    statuses = [value for value in request.query_params.get('status', '').split(',') if value]
+
+    spec = EXPORTS[dataset]
+    queryset = filter_export_queryset(spec, spec.model.objects.all(), statuses=statuses, **dates)
+    return export_response(dataset, export_format, queryset)
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([permissions.IsAuthenticated])
+def admin_profile(request):
+    """
+    Control the sampling profiler (staff only)
+    - GET ?seconds=N: arm a capture window in every worker sharing the cache
+    - GET: list the collapsed-stack files written so far
+    - DELETE: close the current capture window early
+    """
+    user = request.user
+    if not user.is_staff and not user.is_superuser:
+        return Response({'error': 'Admin access required'}, status=status.HTTP_403_FORBIDDEN)
+
+    if request.method == 'DELETE':
+        sampler.disarm()
+        return Response({'capturing': False})
+
+    seconds = request.query_params.get('seconds')
+    if seconds is not None:
+        try:
+            seconds = float(seconds)
+        except ValueError:
+            return Response({'error': 'seconds must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 0 < seconds <= settings.PROFILER_MAX_CAPTURE_SECONDS:
+            return Response({
+                'error': f'seconds must be between 0 and {settings.PROFILER_MAX_CAPTURE_SECONDS}'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        until = sampler.arm(seconds)
+        return Response({
+            'capturing': True,
+            'until': datetime.fromtimestamp(until, tz=dt_timezone.utc).isoformat(),
+            'interval': sampler.interval,
+            'output_dir': sampler.output_dir,
+        }, status=status.HTTP_202_ACCEPTED)
+
+    return Response({
+        'capturing': sampler.is_sampling(),
+        'continuous': sampler.continuous,
+        'output_dir': sampler.output_dir,
+        'files': sampler.profile_files(),
+    })
@@ -0,0 +1,39 @@
+"""
+ASGI entry point for the server-sent events stream, run as its own service:
+
+    uvicorn myproject.events_asgi:application --host 0.0.0.0 --port 8001
+
+Django itself stays on WSGI (``myproject.wsgi``) so streaming downloads and
+media range responses are not buffered by the ASGI handler. Requests to
+``EVENTS_PATH`` go to ``myapp.events.events_app``; anything else is a 404.
+Set ``REDIS_URL`` on both services so status changes saved by the WSGI
+workers reach the streams held here.
+"""
+
+import os
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myproject.settings')
+
+django.setup(set_prefix=False)
+
+# Imported after setup so the app registry is ready
+from django.conf import settings  # noqa: E402
+from myapp.events import events_app  # noqa: E402
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    if scope['type'] == 'http' and scope['path'] == settings.EVENTS_PATH:
+        return await events_app(scope, receive, send)
+    if scope['type'] == 'http':
+        await send({'type': 'http.response.start', 'status': 404, 'headers': [(b'content-type', b'text/plain')]})
+        await send({'type': 'http.response.body', 'body': b'Not Found'})
@@ -43,6 +43,8 @@ INSTALLED_APPS = [
     'django.contrib.contenttypes',
     'django.contrib.sessions',
     'django.contrib.messages',
+    # before staticfiles so runserver serves static files the same way as production
+    'whitenoise.runserver_nostatic',
     'django.contrib.staticfiles',
     # third-party
     'rest_framework',
@@ -58,12 +60,15 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'myapp.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'myapp.middleware.SamplingProfilerMiddleware',
 ]
 
 ROOT_URLCONF = 'myproject.urls'
@@ -93,6 +98,13 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Concurrent writers wait for the lock instead of failing straight away
+            'timeout': 20,
+        },
+        # A file rather than shared-cache memory, whose table locks fail
+        # concurrent writers immediately (see ConcurrentCheckoutTest)
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
@@ -115,6 +127,16 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Argon2 (argon2-cffi) is cheaper to verify at equal strength than PBKDF2.
+# Existing PBKDF2 hashes keep working and are rehashed on the user's next login.
+USE_ARGON2 = env.bool('USE_ARGON2', default=False)
+if USE_ARGON2:
+    PASSWORD_HASHERS = [
+        'django.contrib.auth.hashers.Argon2PasswordHasher',
+        'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+        'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    ]
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
@@ -132,6 +154,12 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# Served by WhiteNoise: hashed names with far-future immutable caching plus
+# precompressed .gz/.br copies, all written by collectstatic. The test suites
+# have no manifest and run with myproject/test_settings.py instead.
+STATICFILES_BACKEND = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -140,12 +168,32 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # JWT without a users-table query per request (see myapp/authentication.py)
+        'myapp.authentication.ClaimsJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
+    # orjson-backed JSON with the same output as DRF's JSONRenderer/JSONParser
+    'DEFAULT_RENDERER_CLASSES': (
+        'myapp.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'myapp.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
+    # Token buckets for reads, weighted by API_THROTTLE_COSTS (see myapp/throttling.py)
+    'DEFAULT_THROTTLE_CLASSES': (
+        'myapp.throttling.TokenBucketThrottle',
+    ),
+    'DEFAULT_THROTTLE_RATES': {
+        'anon': env('THROTTLE_RATE_ANON', default='120/min'),
+        'user': env('THROTTLE_RATE_USER', default='600/min'),
+        'staff': env('THROTTLE_RATE_STAFF', default='3000/min'),
+    },
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 12,
     'DEFAULT_FILTER_BACKENDS': (
@@ -170,8 +218,78 @@ SIMPLE_JWT = {
     'USER_ID_CLAIM': 'user_id',
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
     'TOKEN_TYPE_CLAIM': 'token_type',
+    # Tokens carry a password fingerprint; changing the password revokes them
+    'CHECK_REVOKE_TOKEN': True,
+    'TOKEN_OBTAIN_SERIALIZER': 'myapp.authentication.ClaimsTokenObtainPairSerializer',
 }
 
+# Tokens spent per read request: searches and pages past API_THROTTLE_DEEP_PAGE
+# cost extra; a list answered 304 Not Modified is refunded down to not_modified
+API_THROTTLE_COSTS = {'read': 2, 'search': 6, 'deep_page': 4, 'not_modified': 1}
+API_THROTTLE_DEEP_PAGE = 10
+
+# Deletion tombstones for the listing changes feed are kept this long; older
+# cursors must resync from scratch (prune with `manage.py prune_deletion_log`)
+CHANGES_TOMBSTONE_DAYS = 30
+
+# How long token authentication trusts its cached copy of a user's active/staff
+# flags and password fingerprint. Saves and deletes drop it immediately; this
+# only bounds staleness for bulk .update() calls and per-process caches.
+AUTH_STATE_CACHE_SECONDS = 60
+
+# Login password checks run on a small per-process pool; requests beyond
+# LOGIN_WORKERS + LOGIN_QUEUE_SIZE in flight get a 429 (see myapp/login.py)
+LOGIN_WORKERS = env.int('LOGIN_WORKERS', default=2)
+LOGIN_QUEUE_SIZE = env.int('LOGIN_QUEUE_SIZE', default=8)
+LOGIN_TIMEOUT_SECONDS = 10
+# Attempts per client IP, and failed attempts per username, per window (seconds)
+LOGIN_IP_LIMIT = env.int('LOGIN_IP_LIMIT', default=20)
+LOGIN_IP_WINDOW = 60
+LOGIN_USERNAME_FAILURE_LIMIT = env.int('LOGIN_USERNAME_FAILURE_LIMIT', default=5)
+LOGIN_USERNAME_WINDOW = 15 * 60
+
+# Shared cache (auth state, profiler capture windows); per-process memory without REDIS_URL
+REDIS_URL = env('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# /api/properties/{id}/full/ responses; dropped early when the property, its
+# reviews or bookings change, so this only bounds staleness of similar listings
+PROPERTY_DETAIL_CACHE_SECONDS = 300
+
+# Neighbours kept per listing in the similar-properties table (myapp/similarity.py)
+SIMILAR_PROPERTIES_K = 12
+# Saves within this window are merged into one refresh job
+SIMILAR_REFRESH_DELAY_SECONDS = env.int('SIMILAR_REFRESH_DELAY_SECONDS', default=5)
+
+# Quote matching (myapp/matching.py) only considers moving services based
+# within this distance of the pickup town
+MATCH_RADIUS_KM = env.int('MATCH_RADIUS_KM', default=60)
+# Upper bound on how stale a process's per-town matching index may get when
+# invalidations don't reach it (e.g. LocMemCache with several workers)
+MATCH_INDEX_SECONDS = 300
+
+# Server-sent status events (myapp/events.py), served by myproject/events_asgi.py
+EVENTS_PATH = '/api/events/'
+EVENTS_BACKEND = 'myapp.events.RedisBackend' if REDIS_URL else 'myapp.events.LocalBackend'
+EVENTS_HEARTBEAT_SECONDS = 25
+EVENTS_RETRY_MS = 5000
+# Events held per stream for a slow reader; older ones are dropped
+EVENTS_BUFFER_SIZE = 100
+# Lifetime of the ?stream_token= handed out by /api/auth/stream-token/
+EVENTS_STREAM_TOKEN_SECONDS = 60
+
 SPECTACULAR_SETTINGS = {
     'TITLE': 'Masskan API',
     'DESCRIPTION': 'API for listings, bookings, reviews',
@@ -179,8 +297,9 @@ SPECTACULAR_SETTINGS = {
 }
 
 # Storage: use S3 when env present, fallback to local MEDIA_ROOT
-if env.bool('USE_S3', default=False):
-    DEFAULT_FILE_STORAGE = 'storages.backends.s3boto3.S3Boto3Storage'
+USE_S3 = env.bool('USE_S3', default=False)
+if USE_S3:
+    DEFAULT_STORAGE_BACKEND = 'storages.backends.s3boto3.S3Boto3Storage'
     AWS_ACCESS_KEY_ID = env('AWS_ACCESS_KEY_ID')
     AWS_SECRET_ACCESS_KEY = env('AWS_SECRET_ACCESS_KEY')
     AWS_STORAGE_BUCKET_NAME = env('AWS_STORAGE_BUCKET_NAME')
@@ -188,9 +307,21 @@ if env.bool('USE_S3', default=False):
     AWS_S3_CUSTOM_DOMAIN = env('AWS_S3_CUSTOM_DOMAIN', default=None)
     MEDIA_URL = f"https://{AWS_S3_CUSTOM_DOMAIN or AWS_STORAGE_BUCKET_NAME}.s3.amazonaws.com/"
 else:
+    DEFAULT_STORAGE_BACKEND = 'django.core.files.storage.FileSystemStorage'
     MEDIA_ROOT = BASE_DIR / 'media'
     MEDIA_URL = '/media/'
 
+STORAGES = {
+    'default': {'BACKEND': DEFAULT_STORAGE_BACKEND},
+    'staticfiles': {'BACKEND': STATICFILES_BACKEND},
+}
+
+# Local media is served by myapp.views.serve_media (conditional and Range
+# requests). Behind nginx, set MEDIA_ACCEL_REDIRECT_PREFIX to an `internal`
+# location aliased to MEDIA_ROOT and the view only answers with X-Accel-Redirect.
+MEDIA_ACCEL_REDIRECT_PREFIX = env('MEDIA_ACCEL_REDIRECT_PREFIX', default='')
+MEDIA_CACHE_MAX_AGE = env.int('MEDIA_CACHE_MAX_AGE', default=24 * 60 * 60)
+
 # CORS
 CORS_ALLOW_ALL_ORIGINS = env.bool('CORS_ALLOW_ALL_ORIGINS', default=False)
 CORS_ALLOWED_ORIGINS = env.list('CORS_ALLOWED_ORIGINS', default=[
@@ -235,3 +366,35 @@ DEFAULT_FROM_EMAIL = env('DEFAULT_FROM_EMAIL', default='noreply@masskan.com')
 # For development, use console backend
 if DEBUG:
     EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+
+# Outbox: notifications are queued in the database and delivered by
+# `python manage.py send_outbox --loop`
+OUTBOX_BATCH_SIZE = env.int('OUTBOX_BATCH_SIZE', default=50)
+OUTBOX_MAX_ATTEMPTS = env.int('OUTBOX_MAX_ATTEMPTS', default=6)
+OUTBOX_BACKOFF_SECONDS = 60  # doubled after every failed attempt
+OUTBOX_BACKOFF_MAX_SECONDS = 6 * 60 * 60
+OUTBOX_LEASE_SECONDS = 300  # how long a claimed batch is hidden from other senders
+
+# Sampling profiler: always on when PROFILER_ENABLED, otherwise only during
+# capture windows armed through /api/admin/profile/?seconds=N
+PROFILER_ENABLED = env.bool('PROFILER_ENABLED', default=False)
+PROFILER_INTERVAL = env.float('PROFILER_INTERVAL', default=0.05)  # seconds between samples
+PROFILER_FLUSH_INTERVAL = env.int('PROFILER_FLUSH_INTERVAL', default=60)
+PROFILER_OUTPUT_DIR = env('PROFILER_OUTPUT_DIR', default=str(BASE_DIR / 'profiles'))
+PROFILER_MAX_CAPTURE_SECONDS = 300
+
+# Background jobs: `python manage.py runworker` claims due rows from the Job table
+JOB_WORKER_CONCURRENCY = env.int('JOB_WORKER_CONCURRENCY', default=4)
+JOB_POLL_INTERVAL = env.float('JOB_POLL_INTERVAL', default=1.0)
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_BACKOFF_SECONDS = 30  # doubled after every failed attempt
+JOB_RETRY_BACKOFF_MAX_SECONDS = 60 * 60
+JOB_STALE_SECONDS = 15 * 60  # running jobs older than this are assumed orphaned
+
+# Uploaded images larger than this (px, longest edge) are downscaled by a job
+IMAGE_MAX_DIMENSION = 2048
+
+# Response compression (myapp.middleware.CompressionMiddleware): Brotli when
+# the client accepts it and the package is installed, gzip otherwise
+COMPRESSION_MIN_SIZE = env.int('COMPRESSION_MIN_SIZE', default=512)  # bytes
+COMPRESSION_BROTLI_QUALITY = 5  # 0-11; higher is smaller but slower
@@ -0,0 +1,13 @@
+"""
+Settings for the test suites (pytest via pytest.ini, ``manage.py test`` via
+manage.py): no collectstatic has run, so static files use the plain storage
+instead of WhiteNoise's manifest.
+"""
+
+from .settings import *  # noqa: F401,F403
+from .settings import STORAGES
+
+STORAGES = {
+    **STORAGES,
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
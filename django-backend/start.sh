@@ -0,0 +1,22 @@
+#!/bin/bash
+# Single-container start: gunicorn plus the background job worker (optimize_image,
+# send_outbox, rating and similar-listing refreshes). Set RUN_WORKER=false when the
+# worker runs as its own service (docker-compose.yml, render.yaml).
+set -u
+
+pids=()
+if [ "${RUN_WORKER:-true}" != "false" ]; then
+    python manage.py runworker &
+    pids+=($!)
+fi
+gunicorn --bind "0.0.0.0:${PORT:-8000}" --workers "${WEB_CONCURRENCY:-3}" myproject.wsgi:application &
+pids+=($!)
+
+trap 'kill -TERM "${pids[@]}" 2>/dev/null' TERM INT
+
+# If either process exits, stop the other so the platform restarts the container
+wait -n
+status=$?
+kill -TERM "${pids[@]}" 2>/dev/null
+wait
+exit $status